@@ -1,33 +1,136 @@
-from flask import Flask
+from flask import Flask, jsonify, request
 import dash
-from dash import html, dcc
+from dash import html, dcc, ctx, no_update, Patch
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ALL, MATCH
+import os
+import math
 import random
-from datetime import datetime, timedelta
+from datetime import datetime
 import socket
 import threading
 import time
-import cv2
-import numpy as np
-import mss
+
+from monitoring.engine import FleetEngine
+from monitoring.store import DeviceStore, STATUS, VISION_STATUS, DEVICE_TYPES
+from monitoring.events import CRITICAL, INFO
+from monitoring.logs import generate_logs, render_event
+from monitoring.render import TerminalRenderer, CLIENT_RENDER, client_tables
+from monitoring.analytics import StreamingAnalytics
+from monitoring.streaming import SnapshotStream
+from monitoring.ingest import TelemetryIngestor, TelemetryForwarder
+from monitoring.shared import SharedSnapshotReader, SharedSnapshotWriter
+from monitoring.synthetic import synthetic_fleet, parse_mix, parse_layout
+from monitoring.index import FleetIndex, OTHER_TYPE
+from monitoring.hierarchy import FleetLayout, FleetRollups
+from monitoring.history import HistoryStore
+from monitoring.checkpoint import Checkpoint, Checkpointer
+from monitoring.commands import CommandExecutor, CommandForwarder, SimulatedEndpoint
+from monitoring.control import DEFAULT_PORT, WriterClient
+from monitoring.vision import VisionScanner
+from monitoring.metrics import MetricsRegistry, SIZE_BUCKETS
+from monitoring.compress import enable_compression
+from monitoring.notify import NotificationStore, NotificationDispatcher, FileChannel
 
 # Initialize Flask and Dash
 server = Flask(__name__)
 app = dash.Dash(__name__, server=server, suppress_callback_exceptions=True)
 
-# Server host details (no longer shown in layout)
+# Server host details (no longer shown in layout). The address is resolved in the background
+# so a slow resolver never stalls startup; it stays None until the lookup finishes.
 host_info = {
     "hostname": socket.gethostname(),
-    "ip_address": socket.gethostbyname(socket.gethostname()),
+    "ip_address": None,
 }
 
-# Global flag and thread handle for screen recording
-recording_flag = False
-recording_thread = None
+def resolve_host_info():
+    try:
+        host_info["ip_address"] = socket.gethostbyname(host_info["hostname"])
+    except OSError:
+        host_info["ip_address"] = "unresolved"
+
+threading.Thread(target=resolve_host_info, name='host-info', daemon=True).start()
+
+# Push mode streams snapshots to browsers over Server-Sent Events; set IOT_PUSH_MODE=0
+# to fall back to plain 2 s interval polling
+PUSH_MODE = os.environ.get('IOT_PUSH_MODE', '1') != '0'
+
+# Deployment role: "standalone" runs everything in this process. Under serve.py a single
+# "writer" process owns the fleet and mirrors each snapshot to the IOT_SHARED_STATE segment,
+# and "worker" processes only read that segment and serve the dashboard
+ROLE = os.environ.get('IOT_ROLE', 'standalone')
+SHARED_STATE = os.environ.get('IOT_SHARED_STATE')
+# Workers send actions on writer-owned state (device commands, the screen recorder) to the
+# writer's loopback control listener, which serve.py runs on IOT_CONTROL_PORT
+writer_control = (WriterClient(f"http://127.0.0.1:{os.environ.get('IOT_CONTROL_PORT', DEFAULT_PORT)}")
+                  if ROLE == 'worker' else None)
+
+# Screen recording settings (region=None records the primary monitor) and the active recorder,
+# which only the writer (or a standalone process) owns. "process" mode captures and encodes in
+# worker processes as rolling 10 s segments, for at most an hour unless stopped;
+# IOT_RECORDING_MODE=thread records a single file from threads inside this process.
+RECORDING_MODE = os.environ.get('IOT_RECORDING_MODE', 'process')
+RECORDING = {"output": "screen_record.mp4", "fps": 20, "duration": 60, "region": None, "scale": 1.0}
+SEGMENTED_RECORDING = {"output_dir": "recordings", "segment_seconds": 10, "fps": 20, "duration": 3600,
+                       "region": None, "scale": 1.0}
+recorder = None
+recorder_lock = threading.Lock()
+
+# The recorder module (and, in thread mode, OpenCV and mss) loads on the first recording request
+def start_recorder():
+    from monitoring.recorder import ScreenRecorder, SegmentedRecorder
+    if RECORDING_MODE == 'process':
+        settings = SEGMENTED_RECORDING
+        message = (f"Manual Action: Screen recording started in a worker process for up to "
+                   f"{settings['duration'] // 60} minutes at {settings['fps']} fps. "
+                   f"Saved as {settings['segment_seconds']} s segments in '{settings['output_dir']}/'.")
+        return SegmentedRecorder(**settings).start(), message
+    message = (f"Manual Action: Screen recording started for up to {RECORDING['duration']} seconds at {RECORDING['fps']} fps. "
+               f"Saved as '{RECORDING['output']}'.")
+    return ScreenRecorder(**RECORDING).start(), message
+
+# Record and Stop from any browser act on that one recorder; workers relay them to the writer's
+# /recording/start|stop routes. Both return the message shown under the controls.
+def relay_recording(action):
+    status, payload, _ = writer_control.call('POST', f'/recording/{action}')
+    if status >= 400:
+        raise ValueError(payload.get('error', f"writer answered {status}"))
+    return payload['message']
+
+def start_recording():
+    global recorder
+    if writer_control is not None:
+        return relay_recording('start')
+    with recorder_lock:
+        if recorder is not None and recorder.running:
+            return "Screen recording is already in progress."
+        if recorder is not None:
+            recorder.close()
+        recorder, message = start_recorder()
+        return message
+
+def stop_recording():
+    if writer_control is not None:
+        return relay_recording('stop')
+    with recorder_lock:
+        if recorder is None or not recorder.running:
+            return "No screen recording is currently active."
+        recorder.stop()
+        stats = recorder.stats()
+    return (f"Manual Action: Screen recording stopped ({stats['achieved_fps']:.1f} fps achieved, "
+            f"{stats['frames_dropped']} frames dropped).")
+
+def recording_view(action):
+    return jsonify({'message': start_recording() if action == 'start' else stop_recording()})
 
-# IoT devices with enhanced AI and predictive features
-devices = {
+server.add_url_rule('/recording/<any(start, stop):action>', 'recording', recording_view, methods=['POST'])
+
+# Number of scan/error/AI log entries retained per device
+LOG_CAPACITY = 5
+
+# IoT devices with enhanced AI and predictive features, held column-wise in a DeviceStore
+devices = DeviceStore.from_records({
     "Smart Thermostat": {"status": "Online", "ai_shield": True, "vision_status": "Active", "last_scan": "Clean",
                            "scan_log": ["Starting scan..."], "error_log": ["No issues"], "ai_confidence": 0.95,
                            "threat_score": 0.1, "health_score": 90, "ai_log": [], "anomaly_detected": False,
@@ -78,155 +181,408 @@ devices = {
                      "threat_score": 0.14, "health_score": 86, "ai_log": [], "anomaly_detected": False,
                      "maintenance_alert": None, "optimization_suggestion": None,
                      "failure_probability": 0.0, "predicted_maintenance_date": None},
+}, log_capacity=LOG_CAPACITY)
+
+# Where the demo devices are: sites > buildings > rooms. Graphs roll the fleet up to these levels.
+layout = FleetLayout([
+    ("Headquarters", "Main Building", "Lobby"),
+    ("Headquarters", "Main Building", "Office"),
+    ("Headquarters", "Main Building", "Living Area"),
+    ("Headquarters", "Service Wing", "Kitchen"),
+    ("Headquarters", "Service Wing", "Utility Room"),
+    ("Warehouse", "Depot", "Loading Bay"),
+])
+DEVICE_ROOMS = {
+    "Smart Thermostat": ("Headquarters", "Main Building", "Office"),
+    "Security Camera": ("Warehouse", "Depot", "Loading Bay"),
+    "Smart Lock": ("Headquarters", "Main Building", "Lobby"),
+    "Smart Light": ("Headquarters", "Main Building", "Office"),
+    "Smart Speaker": ("Headquarters", "Main Building", "Living Area"),
+    "Smart Fridge": ("Headquarters", "Service Wing", "Kitchen"),
+    "Smart TV": ("Headquarters", "Main Building", "Living Area"),
+    "Smart Doorbell": ("Headquarters", "Main Building", "Lobby"),
+    "Smart AC": ("Warehouse", "Depot", "Loading Bay"),
+    "Smart Washer": ("Headquarters", "Service Wing", "Utility Room"),
 }
+for name, path in DEVICE_ROOMS.items():
+    devices[name]['room'] = layout.room_id(*path)
+
+# IOT_SYNTHETIC_DEVICES=N swaps the demo fleet for N seeded synthetic devices (load testing and
+# benchmarks); IOT_SYNTHETIC_MIX weights device types, e.g. "Security Camera=3,Smart Lock=1", and
+# IOT_SYNTHETIC_LAYOUT spreads them over SITESxBUILDINGSxROOMS generated rooms
+SYNTHETIC_DEVICES = int(os.environ.get('IOT_SYNTHETIC_DEVICES', '0'))
+if SYNTHETIC_DEVICES:
+    layout = parse_layout(os.environ.get('IOT_SYNTHETIC_LAYOUT', '4x5x10'))
+    devices = synthetic_fleet(SYNTHETIC_DEVICES, parse_mix(os.environ.get('IOT_SYNTHETIC_MIX')),
+                              seed=int(os.environ.get('IOT_SYNTHETIC_SEED', '0')), log_capacity=LOG_CAPACITY,
+                              change_rate=float(os.environ.get('IOT_SYNTHETIC_CHANGE_RATE', '0.25')),
+                              error_rate=float(os.environ.get('IOT_SYNTHETIC_ERROR_RATE', '0.3')),
+                              rooms=len(layout.rooms))
 
-# Notification storage and time markers
-notifications = []
+# Streaming anomaly detection and failure prediction (EWMA statistics and health trend per device)
+analytics = StreamingAnalytics(devices.capacity)
+
+# Notification storage (bounded, repeats per device coalesced for 5 minutes), delivery
+# channels (local file stubs for Slack/Email/SMS) and time markers
+notifications = NotificationStore(capacity=1000, dedup_window=300)
+dispatcher = NotificationDispatcher([
+    FileChannel("slack", "notifications/outbox.ndjson", target="#vision-alerts"),
+    FileChannel("email", "notifications/outbox.ndjson", target="vision@quantum.io"),
+    FileChannel("sms", "notifications/outbox.ndjson", target="+1-555-987-6543", rate=0.2, burst=2),
+])
 last_hourly_check = datetime.now()
 last_30min_check = datetime.now()
 
-# Utility functions for logs
-def generate_scan_log(device):
-    messages = [
-        f"[{datetime.now().strftime('%H:%M:%S')}] Vision scan on {device}...",
-        f"[{datetime.now().strftime('%H:%M:%S')}] AI analysis complete: {devices[device]['last_scan']}"
-    ]
-    return random.choice(messages)
-
-def generate_error_log(device):
-    error_types = {
-        "Smart Thermostat": "Temp anomaly detected - AI corrected",
-        "Security Camera": "Vision blur detected - AI enhanced",
-        "Smart Lock": "Access violation - AI locked",
-        "Smart Light": "Light flicker - AI stabilized",
-        "Smart Speaker": "Audio distortion - AI fixed",
-        "Smart Fridge": "Door left open - AI alerted",
-        "Smart TV": "Screen glitch - AI resolved",
-        "Smart Doorbell": "False detection - AI filtered",
-        "Smart AC": "Vent blockage - AI cleared",
-        "Smart Washer": "Water overflow - AI stopped"
-    }
-    messages = [
-        f"[{datetime.now().strftime('%H:%M:%S')}] Critical failure - AI rebooting",
-        f"[{datetime.now().strftime('%H:%M:%S')}] Vision module offline - AI restoring",
-        f"[{datetime.now().strftime('%H:%M:%S')}] {error_types[device]}"
-    ]
-    return random.choice(messages if random.random() < 0.3 else [f"[{datetime.now().strftime('%H:%M:%S')}] No issues detected"])
-
-def generate_ai_log(device):
-    actions = [
-        f"[{datetime.now().strftime('%H:%M:%S')}] AI adjusted {device} parameters",
-        f"[{datetime.now().strftime('%H:%M:%S')}] Threat prediction updated for {device}",
-        f"[{datetime.now().strftime('%H:%M:%S')}] Health score recalculated for {device}",
-        (f"[{datetime.now().strftime('%H:%M:%S')}] Anomaly detection triggered for {device}"
-         if devices[device]['anomaly_detected'] else f"[{datetime.now().strftime('%H:%M:%S')}] No anomalies in {device}"),
-        (f"[{datetime.now().strftime('%H:%M:%S')}] Maintenance scheduled for {device}"
-         if devices[device]['maintenance_alert'] else f"[{datetime.now().strftime('%H:%M:%S')}] No maintenance needed for {device}"),
-        (f"[{datetime.now().strftime('%H:%M:%S')}] Optimization applied: {devices[device]['optimization_suggestion']}"
-         if devices[device]['optimization_suggestion'] else f"[{datetime.now().strftime('%H:%M:%S')}] No optimization needed for {device}")
-    ]
-    return random.choice(actions)
+# Checkpoints of the whole engine state (fleet and logs, analytics, notifications, alert timers),
+# written every IOT_CHECKPOINT_INTERVAL seconds off the tick thread. IOT_CHECKPOINT= (empty) disables.
+CHECKPOINT_PATH = os.environ.get('IOT_CHECKPOINT', 'checkpoints/fleet.ckpt')
+CHECKPOINT_INTERVAL = float(os.environ.get('IOT_CHECKPOINT_INTERVAL', '30'))
+
+def restore_checkpoint(path):
+    """Resume from the checkpoint at ``path`` if it covers every configured device.
+
+    Everything is decoded and validated before anything is replaced, so a
+    checkpoint that fails part way leaves the freshly configured state intact.
+    """
+    global devices, last_hourly_check, last_30min_check
+    checkpoint = Checkpoint(path)
+    snapshot = checkpoint.snapshot()
+    missing = [name for name in devices.names if name not in snapshot.devices.index]
+    if missing:
+        raise ValueError(f"checkpoint lacks {len(missing)} configured devices, e.g. {missing[0]!r}")
+    state = checkpoint.state
+    restored = DeviceStore.from_snapshot(snapshot.devices, change_rate=devices.change_rate,
+                                         error_rate=devices.error_rate)
+    restored.rng.bit_generator.state = state['rng']
+    hourly = datetime.fromisoformat(state['last_hourly_check'])
+    half_hourly = datetime.fromisoformat(state['last_30min_check'])
+    stats = checkpoint.arrays('analytics:')
+    analytics.check(stats)
+    # The last step that can fail; it changes nothing unless every notification decodes
+    notifications.restore(state['notifications'])
+    analytics.restore(stats, state['analytics_t0'])
+    devices = restored
+    last_hourly_check, last_30min_check = hourly, half_hourly
+    return {'devices': len(devices), 'saved': snapshot.time.isoformat()}
+
+def checkpoint_state(snapshot):
+    stats, t0 = analytics.state(len(snapshot.devices))
+    return ([(f'analytics:{name}', array) for name, array in stats.items()],
+            {'analytics_t0': t0, 'rng': devices.rng.bit_generator.state, 'notifications': notifications.state(),
+             'last_hourly_check': last_hourly_check.isoformat(), 'last_30min_check': last_30min_check.isoformat()})
+
+# Outcome of the warm restart: None (no checkpoint), what was restored, or why it was not
+restored = None
+if CHECKPOINT_PATH and ROLE != 'worker' and os.path.exists(CHECKPOINT_PATH):
+    restore_started = time.perf_counter()
+    try:
+        restored = restore_checkpoint(CHECKPOINT_PATH)
+        restored['seconds'] = round(time.perf_counter() - restore_started, 4)
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        restored = {'error': f"{type(exc).__name__}: {exc}"}
+
+# Terminal text is rendered from per-device templates compiled once and cached by state version
+terminals = TerminalRenderer()
+# IOT_TERMINAL_RENDERING=client (default) ships each card's compact device record and formats the
+# terminal in the browser; =server sends the finished text
+CLIENT_TERMINALS = os.environ.get('IOT_TERMINAL_RENDERING', 'client') == 'client'
+TERMINAL_OUTPUT = ('device-data', 'data') if CLIENT_TERMINALS else ('device-terminal', 'children')
 
 def format_device_info(device, data):
     """Combine all device data, logs, and detailed diagnostics into a formatted string."""
-    info = [
-        f"Device: {device}",
-        f"Status: {data['status']}",
-        f"AI Shield: {'Active' if data['ai_shield'] else 'Inactive'}",
-        f"Vision Module: {data['vision_status']}",
-        f"AI Confidence: {data['ai_confidence']:.2f}",
-        f"Threat Score: {data['threat_score']:.2f}",
-        f"Health Score: {data['health_score']}",
-        f"Anomaly: {'Yes' if data['anomaly_detected'] else 'No'}",
-        f"Maintenance: {data['maintenance_alert'] or 'None'}",
-        f"Optimization: {data['optimization_suggestion'] or 'None'}",
-        f"Failure Probability: {data['failure_probability']:.2f}",
-        f"Predicted Maintenance: {data['predicted_maintenance_date'] or 'N/A'}",
-        f"Last Scan: {data['last_scan']}",
-        ""
+    return terminals.render(device, data)
+
+# What update_grid sends for a card's terminal: the text, or in client mode the compact record;
+# a device the card already shows only has its changing parts patched in
+def terminal_content(device, data, shown):
+    if not CLIENT_TERMINALS:
+        return format_device_info(device, data)
+    if not shown:
+        return terminals.compact(device, data)
+    patch = Patch()
+    for key, value in terminals.compact(device, data, static=False).items():
+        patch[key] = value
+    return patch
+
+# Advance the simulated fleet by one engine tick; returns popup data if an alert fired
+def advance_fleet(current_time):
+    global last_hourly_check, last_30min_check
+    
+    # Status, threat and health transitions for the whole fleet at once, then streaming
+    # analytics derive anomaly flags, failure probability and predicted maintenance dates
+    devices.step(current_time)
+    analytics.update(devices, current_time)
+    
+    # Append one structured scan/error/AI event per changed device into the ring buffers
+    generate_logs(devices, current_time)
+    
+    # Popup notifications for critical alerts and admin approvals
+    popup = None
+    if (current_time - last_hourly_check).total_seconds() >= 3600:
+        last_hourly_check = current_time
+        dev = random.choice(list(devices.keys()))
+        error_log = devices[dev]['error_log']
+        last_error = error_log[-1] if len(error_log) else None
+        critical = last_error is not None and last_error['severity'] == CRITICAL
+        if critical or devices[dev]['status'] == 'Offline' or devices[dev]['anomaly_detected']:
+            detail = render_event('error_log', dev, last_error) if last_error is not None else devices[dev]['status']
+            msg = f"Critical issue on {dev}: {detail}"
+            # Delivery happens on the dispatcher's workers; coalesced repeats are not re-sent
+            notification = notifications.post(current_time, dev, CRITICAL, "critical", msg)
+            if notification is not None:
+                dispatcher.submit(notification)
+                popup = {"title": "Critical Alert",
+                         "lines": [f"Slack: {msg}", "Email: Sent to vision@quantum.io", "SMS: Sent to +1-555-987-6543"]}
+    
+    if (current_time - last_30min_check).total_seconds() >= 1800:
+        last_30min_check = current_time
+        dev = "Security Camera"
+        approval_msg = f"Admin approval required for update of {dev} driver."
+        notification = notifications.post(current_time, dev, INFO, "approval", approval_msg)
+        if notification is not None:
+            dispatcher.submit(notification)
+            popup = {"title": "Update Approval Request", "lines": [approval_msg]}
+    
+    return popup
+
+def fleet_step(current_time):
+    with TICK_SECONDS.time():
+        popup = advance_fleet(current_time)
+        return devices.freeze(), popup
+
+# Single engine advances the fleet every 2 s regardless of how many dashboards are open
+engine = FleetEngine(fleet_step, interval=2.0)
+engine.publish(devices.freeze())
+# Where the dashboard reads snapshots from: the local engine, or the writer's shared segment
+fleet_source = SharedSnapshotReader(SHARED_STATE) if ROLE == 'worker' else engine
+if PUSH_MODE:
+    stream = SnapshotStream(fleet_source).register(server)
+
+# Live telemetry: POST JSON/NDJSON to /ingest, or send NDJSON datagrams to the UDP listener, which
+# is unauthenticated and so only runs when IOT_INGEST_UDP_PORT is set (on IOT_INGEST_UDP_HOST,
+# loopback unless changed). Unknown device names auto-register, up to IOT_INGEST_MAX_DEVICES new
+# devices. Workers relay HTTP readings to the writer's UDP listener.
+INGEST_UDP_HOST = os.environ.get('IOT_INGEST_UDP_HOST', '127.0.0.1')
+INGEST_UDP_PORT = int(os.environ.get('IOT_INGEST_UDP_PORT', '0'))
+if ROLE == 'worker':
+    ingestor = TelemetryForwarder(('127.0.0.1' if INGEST_UDP_HOST in ('', '0.0.0.0') else INGEST_UDP_HOST,
+                                   INGEST_UDP_PORT)).register(server)
+else:
+    ingestor = TelemetryIngestor(devices, engine.lock,
+                                 max_registered=int(os.environ.get('IOT_INGEST_MAX_DEVICES', '10000'))
+                                 ).register(server)
+shared_state = None
+checkpoints = (Checkpointer(CHECKPOINT_PATH, checkpoint_state, CHECKPOINT_INTERVAL).attach(engine)
+               if CHECKPOINT_PATH and ROLE != 'worker' else None)
+
+# Server-side indexes (status, vision status, type, top threat/failure risk) behind the paginated
+# device grid and the /devices query API; kept current from each snapshot's changed rows
+device_index = FleetIndex(fleet_source).register(server)
+GRID_PAGE_SIZE = 12
+GRID_SORTS = [{'label': 'Fleet order', 'value': 'name'},
+              {'label': 'Highest threat score', 'value': 'threat_score'},
+              {'label': 'Highest failure probability', 'value': 'failure_probability'}]
+
+# Site/building/room aggregates behind the graphs and /rollups, updated from each snapshot's changed rows
+rollups = FleetRollups(fleet_source, layout).register(server)
+GRAPH_LEVELS = [{'label': 'Per site', 'value': 'site'}, {'label': 'Per building', 'value': 'building'},
+                {'label': 'Per room', 'value': 'room'}]
+
+# Bulk device commands (lock, freeze, firmware rollout in waves, restart) run on an async executor
+# against a simulated device endpoint; jobs are listed and controlled at /commands. The executor
+# lives with the device store, so workers forward commands and job queries to the writer.
+if ROLE == 'worker':
+    commands = CommandForwarder(writer_control).register(server)
+else:
+    commands = CommandExecutor(devices, engine.lock, SimulatedEndpoint()).register(server)
+
+# Real vision scans for cameras and doorbells: motion and blur analysis of frames from a video,
+# image or directory (IOT_VISION_SOURCE, see monitoring.vision.FrameSource) in niced worker
+# processes, written back into vision_status, last_scan and threat_score; stats at /vision.
+# Unset, every device's vision fields stay simulated.
+VISION_SOURCE = os.environ.get('IOT_VISION_SOURCE')
+vision = (VisionScanner(devices, engine.lock, VISION_SOURCE,
+                        fps=float(os.environ.get('IOT_VISION_FPS', '2')),
+                        workers=int(os.environ.get('IOT_VISION_WORKERS', '2')),
+                        streams=int(os.environ.get('IOT_VISION_STREAMS', '64'))).register(server)
+          if VISION_SOURCE and ROLE != 'worker' else None)
+
+# Prometheus metrics at /metrics; POST /metrics/profile/start|stop toggles a sampling profiler whose
+# folded stacks (/metrics/profile) feed flame graph tools
+metrics = MetricsRegistry().register(server)
+CALLBACK_SECONDS = metrics.histogram('callback_duration_seconds', "update_dashboard time by stage",
+                                     labelnames=('stage',))
+CALLBACK_CALLS = metrics.counter('callback_calls_total', "update_dashboard calls by outcome", labelnames=('result',))
+CALLBACK_BYTES = metrics.histogram('callback_response_bytes', "Dash callback response body size as sent",
+                                   buckets=SIZE_BUCKETS)
+TICK_SECONDS = metrics.histogram('tick_duration_seconds', "Engine tick (simulation, analytics, logs, freeze)")
+metrics.gauge('stream_clients', "Open Server-Sent Events connections",
+              lambda: stream.clients if PUSH_MODE else None)
+metrics.gauge('notification_queue_depth', "Notifications waiting for delivery", lambda: dispatcher.depth)
+metrics.gauge('notifications_dropped_total', "Notifications dropped on a full queue", lambda: dispatcher.dropped,
+              kind='counter')
+metrics.gauge('command_jobs_active', "Bulk device command jobs queued or running",
+              lambda: len(commands.active()) if ROLE != 'worker' else None)
+metrics.gauge('command_in_flight', "Device commands currently awaiting a response",
+              lambda: commands.in_flight if ROLE != 'worker' else None)
+metrics.gauge('ingest_queue_depth', "Telemetry readings waiting to be applied", lambda: ingestor.depth)
+metrics.gauge('ingest_invalid_values_total', "Telemetry field values dropped as out of range or mistyped",
+              lambda: getattr(ingestor, 'invalid', None), kind='counter')
+metrics.gauge('ingest_unregistered_total', "Telemetry readings dropped for unknown devices past the registration limit",
+              lambda: getattr(ingestor, 'unregistered', None), kind='counter')
+metrics.gauge('engine_tick_errors_total', "Engine ticks that raised", lambda: engine.errors, kind='counter')
+metrics.gauge('devices', "Devices in the latest snapshot",
+              lambda: len(fleet_source.snapshot().devices) if fleet_source.snapshot() else None)
+
+def recorder_stat(key):
+    return lambda: recorder.stats()[key] if recorder is not None else None
+
+metrics.gauge('recorder_running', "1 while a screen recording is active",
+              lambda: int(recorder.running) if recorder is not None else None)
+metrics.gauge('recorder_fps', "Achieved capture rate of the current or last recording", recorder_stat('achieved_fps'))
+metrics.gauge('recorder_frames_dropped', "Frame slots missed by the current or last recording",
+              recorder_stat('frames_dropped'))
+metrics.gauge('recorder_encode_latency_seconds', "Average per-frame encode time of the current or last recording",
+              recorder_stat('encode_latency_avg'))
+
+# Per-device metric history (memory-mapped, 1 s / 1 min / 1 h tiers) behind the trend graph and
+# /history. The writer appends every snapshot once start_services has locked the directory;
+# workers map the same files read-only.
+# IOT_HISTORY_DIR= (empty) turns history off.
+HISTORY_DIR = os.environ.get('IOT_HISTORY_DIR', 'history')
+history = (HistoryStore(HISTORY_DIR, width=devices.capacity, readonly=ROLE == 'worker').register(server)
+           if HISTORY_DIR else None)
+HISTORY_SECONDS = metrics.histogram('history_write_seconds', "Appending one snapshot to the metric history")
+TREND_METRICS = [{'label': 'AI confidence', 'value': 'ai_confidence'},
+                 {'label': 'Failure probability', 'value': 'failure_probability'},
+                 {'label': 'Error rate', 'value': 'error_rate'}]
+TREND_RANGES = [{'label': 'Last hour', 'value': 3600}, {'label': 'Last day', 'value': 86400},
+                {'label': 'Last week', 'value': 7 * 86400}]
+TREND_METHODS = [{'label': 'LTTB', 'value': 'lttb'}, {'label': 'Min/max', 'value': 'minmax'}]
+TREND_POINTS = 300
+
+def record_history(snapshot):
+    with HISTORY_SECONDS.time():
+        history.record(snapshot)
+
+if history is not None and ROLE != 'worker':
+    engine.subscribe(record_history)
+
+def vision_stat(key):
+    return lambda: vision.stats()[key] if vision is not None else None
+
+metrics.gauge('vision_cameras', "Camera streams being scanned", vision_stat('cameras'))
+metrics.gauge('vision_scans_per_second', "Frames analysed per second over the last 10 s",
+              vision_stat('scans_per_second'))
+metrics.gauge('vision_scans_skipped_total', "Camera scans skipped while a worker was still busy",
+              vision_stat('skipped'), kind='counter')
+metrics.gauge('vision_batch_latency_seconds', "Round trip of the last scan batch", vision_stat('batch_latency'))
+
+def checkpoint_stat(key):
+    return lambda: getattr(checkpoints, key) if checkpoints is not None else None
+
+metrics.gauge('checkpoints_written_total', "Checkpoints written since startup", checkpoint_stat('written'),
+              kind='counter')
+metrics.gauge('checkpoint_failures_total', "Checkpoint writes that failed", checkpoint_stat('failures'), kind='counter')
+metrics.gauge('checkpoint_bytes', "Size of the last checkpoint", checkpoint_stat('last_bytes'))
+metrics.gauge('checkpoint_write_seconds', "Encode, write and fsync time of the last checkpoint",
+              checkpoint_stat('last_seconds'))
+metrics.gauge('checkpoint_age_seconds', "Time since the last checkpoint was written",
+              lambda: time.time() - checkpoints.last_time if checkpoints is not None and checkpoints.last_time else None)
+metrics.gauge('checkpoint_restore_seconds', "Warm restart time from the checkpoint found at startup",
+              lambda: (restored or {}).get('seconds'))
+
+@server.after_request
+def observe_callback_size(response):
+    if request.path.endswith('/_dash-update-component') and response.status_code == 200 and not response.is_streamed:
+        CALLBACK_BYTES.observe(response.calculate_content_length() or 0)
+    return response
+
+# Gzip JSON and HTML responses (Flask-Compress if installed). Enabled after the size hook above
+# so that hook runs later and observes the bytes actually sent. IOT_COMPRESS=0 turns it off.
+COMPRESSION = enable_compression(server) if os.environ.get('IOT_COMPRESS', '1') != '0' else None
+
+# Start the engine and background services; the writer also mirrors snapshots to shared memory
+def start_services():
+    global shared_state
+    if ROLE == 'writer':
+        shared_state = SharedSnapshotWriter(SHARED_STATE).attach(engine)
+    if history is not None:
+        history.acquire()
+    engine.start()
+    dispatcher.start()
+    ingestor.start()
+    commands.start()
+    if checkpoints is not None:
+        checkpoints.start()
+    if vision is not None:
+        vision.start()
+    if INGEST_UDP_PORT:
+        ingestor.start_udp(INGEST_UDP_HOST, INGEST_UDP_PORT)
+
+# Stop ticking first, then leave a final checkpoint and flushed history behind
+def stop_services():
+    engine.stop(timeout=5)
+    ingestor.stop()
+    dispatcher.stop()
+    commands.stop()
+    if vision is not None:
+        vision.stop()
+    if recorder is not None:
+        recorder.close()
+    if checkpoints is not None:
+        checkpoints.close(final=engine.snapshot())
+    if history is not None:
+        history.flush()
+        history.release()
+    if shared_state is not None:
+        shared_state.close()
+
+# Data behind the four graphs from the rollups at ``level``, in graph order; each graph is a
+# list of {trace property: values}, one per trace. Sizes follow the layout, not the fleet.
+def figure_data(level):
+    rollup = rollups.level(level)
+    return [
+        [{'y': rollup['ai_confidence']}],
+        [{'values': rollups.vision_counts()}],
+        [{'y': rollup['error_rate']}],
+        [{'y': rollup['threat_score']}, {'y': rollup['failure_probability']}],
     ]
-    # Extra forensic details per device
-    if device == "Smart Thermostat":
-        info.append("Forensics: Current Temperature is 21°C (Desired: 22°C). Sensor calibration applied.")
-    elif device == "Security Camera":
-        info.append("Forensics: Movement detected at front door at " + datetime.now().strftime("%H:%M:%S") + ". Video snippet saved.")
-    elif device == "Smart Lock":
-        info.append("Forensics: Door unlocked by user 'Alice' at " + datetime.now().strftime("%H:%M:%S") + ". Access log updated.")
-    elif device == "Smart Light":
-        info.append("Forensics: Dynamic color cycle activated. Light intensity stabilized.")
-    elif device == "Smart Speaker":
-        info.append("Forensics: Now playing 'Imagine' by John Lennon. Audio normalization applied.")
-    elif device == "Smart Fridge":
-        info.append("Forensics: Fridge temperature steady at 4°C. Inventory: Milk, Eggs, Cheese verified.")
-    elif device == "Smart TV":
-        num_games = random.randint(2, 4)
-        possible_games = [
-            "Champions League: PSG vs Liverpool", 
-            "Champions League: Real Madrid vs Barcelona", 
-            "Champions League: Manchester City vs Bayern", 
-            "Champions League: Juventus vs AC Milan"
-        ]
-        games = random.sample(possible_games, num_games)
-        info.append("Forensics: Programs watched: " + ", ".join(games) + ". Streaming quality optimized.")
-    elif device == "Smart Doorbell":
-        info.append("Forensics: Visitor snapshot captured at " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ". Facial recognition initiated.")
-    elif device == "Smart AC":
-        info.append("Forensics: Cooling mode active. Set to 18°C. Airflow optimized.")
-    elif device == "Smart Washer":
-        info.append("Forensics: Laundry cycle in progress (Spin cycle at 80%). Load balanced.")
+
+# Full figures (layout, colors, margins); only needed on first load or when the level changes
+def build_figures(level):
+    confidence, vision, errors, risk = figure_data(level)
+    labels = layout.labels(level)
     
-    # Append logs
-    info.append("")
-    info.append("Scan Log:")
-    info.append("\n".join(data['scan_log']))
-    info.append("")
-    info.append("Error Log:")
-    info.append("\n".join(data['error_log']))
-    info.append("")
-    info.append("AI Log:")
-    info.append("\n".join(data['ai_log']))
+    confidence_fig = go.Figure(data=[go.Bar(x=labels,
+                                              y=confidence[0]['y'],
+                                              marker_color='#66d9ef')])
+    confidence_fig.update_layout(title='Mean AI Confidence', plot_bgcolor='rgba(0,0,0,0)',
+                                   paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
+                                   height=300, margin=dict(l=40, r=40, t=40, b=40))
     
-    # Detailed Diagnostics (rich details about issues and fixes)
-    diagnostics = []
-    diagnostics.append("Detailed Diagnostics:")
-    if data['anomaly_detected']:
-        diagnostics.append("- Issue: Anomaly detected in sensor data.")
-        diagnostics.append("- Resolution: AI recalibrated sensors and updated threat model.")
-    else:
-        diagnostics.append("- Issue: No significant anomalies detected.")
-        diagnostics.append("- Resolution: Device operating within normal parameters.")
-    if data['maintenance_alert']:
-        diagnostics.append(f"- Maintenance Recommendation: {data['maintenance_alert']}. Schedule service immediately.")
-    else:
-        diagnostics.append("- Maintenance: No immediate service required.")
-    if data['optimization_suggestion']:
-        diagnostics.append(f"- Optimization: {data['optimization_suggestion']} applied.")
-    else:
-        diagnostics.append("- Optimization: No changes necessary.")
-    diagnostics.append("- Overall, AI successfully monitored and auto-corrected issues where necessary.")
-    info.append("")
-    info.append("\n".join(diagnostics))
+    vision_status_fig = go.Figure(data=[go.Pie(labels=list(VISION_STATUS),
+                                                values=vision[0]['values'],
+                                                marker=dict(colors=['#66d9ef', '#ff6b6b', '#d9534f']))])
+    vision_status_fig.update_layout(title='Vision Module Status', plot_bgcolor='rgba(0,0,0,0)',
+                                    paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'), height=300)
     
-    return "\n".join(info)
-
-# Screen recording function using opencv-python (MP4 format), with manual stop support
-def record_screen():
-    global recording_flag
-    with mss.mss() as sct:
-        monitor = sct.monitors[1]  # primary monitor
-        fps = 20
-        width = monitor["width"]
-        height = monitor["height"]
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter("screen_record.mp4", fourcc, fps, (width, height))
-        start_time = time.time()
-        while recording_flag and (time.time() - start_time < 60):
-            sct_img = sct.grab(monitor)
-            frame = np.array(sct_img)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-            out.write(frame)
-            time.sleep(1 / fps)
-        out.release()
+    error_rate_fig = go.Figure(data=[go.Scatter(x=labels,
+                                                 y=errors[0]['y'],
+                                                 mode='lines+markers',
+                                                 line=dict(color='#ff6b6b', width=3))])
+    error_rate_fig.update_layout(title=f'Error Rate (Last {LOG_CAPACITY} Scans)', plot_bgcolor='rgba(0,0,0,0)',
+                                 paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
+                                 height=300, margin=dict(l=40, r=40, t=40, b=40))
+    
+    failure_fig = go.Figure(data=[go.Bar(x=labels, y=risk[0]['y'], name='Threat score', marker_color='#d9534f'),
+                                  go.Bar(x=labels, y=risk[1]['y'], name='Failure probability',
+                                         marker_color='#ff6b6b')])
+    failure_fig.update_layout(title='Highest Threat and Failure Risk', plot_bgcolor='rgba(0,0,0,0)',
+                              paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
+                              height=300, margin=dict(l=40, r=40, t=40, b=40))
+    
+    return [confidence_fig, vision_status_fig, error_rate_fig, failure_fig]
 
 # Custom CSS
 app.index_string = '''
@@ -334,6 +690,40 @@ app.index_string = '''
                 border: 1px solid #2e4057;
                 white-space: pre-wrap;
             }
+            .grid-controls {
+                display: flex;
+                align-items: center;
+                gap: 10px;
+                margin-bottom: 20px;
+                flex-wrap: wrap;
+            }
+            .grid-controls .Select-control, .grid-controls input {
+                background: #0a1414;
+                color: #e6f0fa;
+                border: 1px solid #3e5c76;
+                border-radius: 8px;
+            }
+            .grid-controls input {
+                padding: 8px 12px;
+            }
+            .grid-controls .dash-dropdown {
+                min-width: 180px;
+                color: #0a1414;
+            }
+            .grid-controls button {
+                background: linear-gradient(45deg, #3e5c76, #5e8299);
+                border: none;
+                padding: 8px 14px;
+                border-radius: 20px;
+                color: #e6f0fa;
+                cursor: pointer;
+                font-weight: bold;
+            }
+            .grid-page-label {
+                color: #b3c6ff;
+                min-width: 140px;
+                text-align: center;
+            }
             .graph-container {
                 display: grid;
                 grid-template-columns: repeat(4, 1fr);
@@ -382,12 +772,32 @@ app.layout = html.Div(className='container', children=[
         html.Button("Update Firmware", id="update-firmware"),
         html.Button("Restart Devices", id="restart-devices")
     ]),
+    # Device grid: filters and paging over the server-side index; only GRID_PAGE_SIZE cards exist
+    html.Div(className='grid-controls', children=[
+        dcc.Input(id='grid-search', type='text', placeholder='Search devices', debounce=True),
+        dcc.Dropdown(id='grid-status', options=list(STATUS), placeholder='Any status', className='dash-dropdown'),
+        dcc.Dropdown(id='grid-vision', options=list(VISION_STATUS), placeholder='Any vision status',
+                     className='dash-dropdown'),
+        dcc.Dropdown(id='grid-type', options=list(DEVICE_TYPES) + [OTHER_TYPE], placeholder='Any device type',
+                     className='dash-dropdown'),
+        dcc.Dropdown(id='grid-sort', options=GRID_SORTS, value='name', clearable=False, className='dash-dropdown'),
+        html.Button("Prev", id='grid-prev'),
+        html.Span(id='grid-page-label', className='grid-page-label'),
+        html.Button("Next", id='grid-next')
+    ]),
     html.Div(className='device-grid', children=[
-        html.Div(className='device-card', children=[
-            html.H3(device, style={'color': '#5e8299'}),
+        html.Div(id={'type': 'device-card', 'index': slot}, className='device-card', style={'display': 'none'}, children=[
+            html.H3(id={'type': 'device-title', 'index': slot}, style={'color': '#5e8299'}),
             # Terminal with full details and diagnostics
-            html.Div(id=f'device-terminal-{device}', className='terminal', children="Loading data...")
-        ]) for device in list(devices.keys())
+            html.Div(id={'type': 'device-terminal', 'index': slot}, className='terminal', children="Loading data..."),
+            # Compact record the terminal is formatted from in client mode
+            dcc.Store(id={'type': 'device-data', 'index': slot})
+        ]) for slot in range(GRID_PAGE_SIZE)
+    ]),
+    dcc.Store(id='terminal-tables', data=client_tables() if CLIENT_TERMINALS else None),
+    dcc.Store(id='grid-state'),
+    html.Div(className='grid-controls', children=[
+        dcc.Dropdown(id='graph-level', options=GRAPH_LEVELS, value='site', clearable=False, className='dash-dropdown')
     ]),
     html.Div(className='graph-container', children=[
         html.Div(className='graph-card', children=[dcc.Graph(id='confidence-graph')]),
@@ -395,11 +805,76 @@ app.layout = html.Div(className='container', children=[
         html.Div(className='graph-card', children=[dcc.Graph(id='error-rate-graph')]),
         html.Div(className='graph-card', children=[dcc.Graph(id='failure-probability-graph')])
     ]),
+    # Trends for the devices on the current grid page, downsampled from the metric history
+    html.Div(className='grid-controls', children=[
+        dcc.Dropdown(id='trend-metric', options=TREND_METRICS, value='ai_confidence', clearable=False,
+                     className='dash-dropdown'),
+        dcc.Dropdown(id='trend-range', options=TREND_RANGES, value=3600, clearable=False, className='dash-dropdown'),
+        dcc.Dropdown(id='trend-method', options=TREND_METHODS, value='lttb', clearable=False,
+                     className='dash-dropdown')
+    ]),
+    html.Div(className='graph-card', children=[dcc.Graph(id='trend-graph')]),
+    dcc.Store(id='trend-state'),
+    dcc.Interval(id='trend-poll', interval=10*1000, n_intervals=0, disabled=history is None),
     html.Div(id='alerts', className='alert-box'),
+    # Bulk command progress, polled once a second (no response body unless a job moved)
+    html.Div(id='command-progress', className='alert-box'),
+    dcc.Store(id='command-version'),
+    dcc.Interval(id='command-poll', interval=1000, n_intervals=0),
     html.Div(id='popup-alert', className='popup', style={'display': 'none'}),
-    dcc.Interval(id='interval-component', interval=2*1000, n_intervals=0)
+    dcc.Store(id='dashboard-state'),
+    # Push transport: the clientside callback below stores each stream event's snapshot version
+    # in 'stream-event' (a number, so callback requests never carry event bodies)
+    dcc.Store(id='stream-config', data={'url': app.get_relative_path('/stream'), 'enabled': PUSH_MODE}),
+    dcc.Store(id='stream-event'),
+    dcc.Store(id='stream-status'),
+    # Polling fallback; stays disabled while the push stream is connected
+    dcc.Interval(id='interval-component', interval=2*1000, n_intervals=0, disabled=PUSH_MODE)
 ])
 
+# Open the snapshot stream in the browser. Each event's version lands in 'stream-event', which
+# triggers update_dashboard; if the stream drops, interval polling takes over until it reconnects.
+app.clientside_callback(
+    """
+    function(config) {
+        if (!config || !config.enabled || !window.EventSource) {
+            dash_clientside.set_props('interval-component', {disabled: false});
+            return 'polling';
+        }
+        if (window.iotStream) {
+            return 'connected';
+        }
+        var source = new EventSource(config.url);
+        source.addEventListener('snapshot', function(e) {
+            dash_clientside.set_props('stream-event', {data: JSON.parse(e.data).version});
+        });
+        source.onopen = function() {
+            dash_clientside.set_props('interval-component', {disabled: true});
+        };
+        source.onerror = function() {
+            dash_clientside.set_props('interval-component', {disabled: false});
+        };
+        window.iotStream = source;
+        return 'connected';
+    }
+    """,
+    Output('stream-status', 'data'),
+    Input('stream-config', 'data')
+)
+
+# Client mode: format each card's terminal in the browser whenever its device record changes
+if CLIENT_TERMINALS:
+    app.clientside_callback(
+        CLIENT_RENDER,
+        Output({'type': 'device-terminal', 'index': MATCH}, 'children'),
+        Input({'type': 'device-data', 'index': MATCH}, 'data'),
+        State('terminal-tables', 'data')
+    )
+
+# Buttons that fan a command out to the whole fleet
+COMMAND_BUTTONS = {"lock-all": "lock", "freeze-all": "freeze", "update-firmware": "firmware",
+                   "restart-devices": "restart"}
+
 # Callback for manual controls
 @app.callback(
     Output('alerts', 'children'),
@@ -412,159 +887,228 @@ app.layout = html.Div(className='container', children=[
      Input('restart-devices', 'n_clicks')]
 )
 def manual_controls_callback(lock_clicks, freeze_clicks, cancel_clicks, record_clicks, stop_clicks, firmware_clicks, restart_clicks):
-    global recording_flag, recording_thread
     ctx = dash.callback_context
     if not ctx.triggered:
         return ""
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if button_id == "lock-all":
-        return html.P("Manual Action: All devices locked for security.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "freeze-all":
-        return html.P("Manual Action: Operations frozen for troubleshooting.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "cancel-operation":
-        return html.P("Manual Action: Current operation canceled.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "record-screen":
-        if not recording_flag:
-            recording_flag = True
-            recording_thread = threading.Thread(target=record_screen, daemon=True)
-            recording_thread.start()
-            return html.P("Manual Action: Screen recording started for up to 1 minute. Saved as 'screen_record.mp4'.", style={'color': '#fff', 'fontWeight': 'bold'})
-        else:
-            return html.P("Screen recording is already in progress.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "stop-record":
-        if recording_flag:
-            recording_flag = False
-            return html.P("Manual Action: Screen recording stopped.", style={'color': '#fff', 'fontWeight': 'bold'})
-        else:
-            return html.P("No screen recording is currently active.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "update-firmware":
-        return html.P("Manual Action: Firmware update initiated on selected devices.", style={'color': '#fff', 'fontWeight': 'bold'})
-    elif button_id == "restart-devices":
-        return html.P("Manual Action: All devices are restarting.", style={'color': '#fff', 'fontWeight': 'bold'})
+    try:
+        if button_id in COMMAND_BUTTONS:
+            job = commands.submit(COMMAND_BUTTONS[button_id]).progress()
+            return html.P(f"Manual Action: {job['label']} started on {job['total']} devices "
+                          f"(job {job['id']}).", style={'color': '#fff', 'fontWeight': 'bold'})
+        elif button_id == "cancel-operation":
+            cancelled = commands.cancel()
+            if not cancelled:
+                return html.P("No device operation is currently running.", style={'color': '#fff', 'fontWeight': 'bold'})
+            return html.P(f"Manual Action: Canceled {', '.join(job.id for job in cancelled)}.",
+                          style={'color': '#fff', 'fontWeight': 'bold'})
+        elif button_id == "record-screen":
+            return html.P(start_recording(), style={'color': '#fff', 'fontWeight': 'bold'})
+        elif button_id == "stop-record":
+            return html.P(stop_recording(), style={'color': '#fff', 'fontWeight': 'bold'})
+    except (OSError, ValueError) as exc:
+        # e.g. a worker could not reach the fleet writer
+        return html.P(f"Manual Action failed: {exc}", style={'color': '#fff', 'fontWeight': 'bold'})
     return ""
 
-# Main update callback: updates graphs and composite terminal per device
+# Progress of the most recent bulk command jobs; skipped while the executor's version is unchanged
+@app.callback(
+    [Output('command-progress', 'children'),
+     Output('command-version', 'data')],
+    [Input('command-poll', 'n_intervals')],
+    [State('command-version', 'data')]
+)
+def update_command_progress(n, seen):
+    try:
+        version, jobs = commands.recent(5)
+    except (OSError, ValueError):
+        raise PreventUpdate
+    if version == seen:
+        raise PreventUpdate
+    lines = []
+    for p in jobs:
+        text = (f"{p['label']} ({p['id']}): {p['done']}/{p['total']} done, {p['succeeded']} ok, "
+                f"{p['failed']} failed, {p['timed_out']} timed out")
+        if p['cancelled']:
+            text += f", {p['cancelled']} cancelled"
+        if p['waves'] > 1:
+            text += f", wave {p['wave']}/{p['waves']}"
+        text += f" - {p['state']}"
+        lines.append(html.P(text, style={'color': '#fff'}))
+    return lines, version
+
+# Main update callback: patches graphs and re-renders only terminals whose device changed.
+# The per-tab 'dashboard-state' store remembers which snapshot and fleet epoch it has shown.
 @app.callback(
     [Output('confidence-graph', 'figure'),
      Output('vision-status-graph', 'figure'),
      Output('error-rate-graph', 'figure'),
      Output('failure-probability-graph', 'figure'),
      Output('popup-alert', 'children'),
-     Output('popup-alert', 'style')] +
-    [Output(f'device-terminal-{device}', 'children') for device in list(devices.keys())],
-    [Input('interval-component', 'n_intervals')]
+     Output('popup-alert', 'style'),
+     Output('dashboard-state', 'data')],
+    [Input('interval-component', 'n_intervals'),
+     Input('stream-event', 'data'),
+     Input('graph-level', 'value')],
+    [State('dashboard-state', 'data')]
 )
-def update_dashboard(n):
-    global last_hourly_check, last_30min_check, notifications
-    current_time = datetime.now()
-    
-    # Update device data with AI features and predictive analytics
-    for device in devices:
-        if random.random() < 0.25 and devices[device]['ai_shield']:
-            devices[device]['status'] = random.choice(['Online', 'Offline'])
-            devices[device]['vision_status'] = random.choice(['Active', 'Degraded']) if devices[device]['status'] == 'Online' else 'Offline'
-            devices[device]['ai_confidence'] = random.uniform(0.7, 0.99) if devices[device]['vision_status'] == 'Active' else random.uniform(0.5, 0.7)
-            devices[device]['threat_score'] = random.uniform(0.05, 0.8) if devices[device]['vision_status'] == 'Degraded' else random.uniform(0.05, 0.3)
-            devices[device]['health_score'] = random.randint(70, 95) if devices[device]['vision_status'] == 'Active' else random.randint(50, 80)
-            devices[device]['anomaly_detected'] = random.random() < 0.2 if devices[device]['threat_score'] > 0.5 else False
-            devices[device]['maintenance_alert'] = "Schedule service" if devices[device]['health_score'] < 70 else None
-            devices[device]['optimization_suggestion'] = random.choice(["Increase scan frequency", "Adjust AI threshold", None]) if random.random() < 0.3 else None
-            if devices[device]['vision_status'] == 'Degraded':
-                devices[device]['last_scan'] = 'Threat Detected'
-        
-        # Append logs
-        devices[device]['scan_log'].append(generate_scan_log(device))
-        devices[device]['error_log'].append(generate_error_log(device))
-        devices[device]['ai_log'].append(generate_ai_log(device))
-        devices[device]['scan_log'] = devices[device]['scan_log'][-5:]
-        devices[device]['error_log'] = devices[device]['error_log'][-5:]
-        devices[device]['ai_log'] = devices[device]['ai_log'][-5:]
-        
-        # Predictive analytics update
-        if devices[device]['health_score'] < 80:
-            devices[device]['failure_probability'] = random.uniform(0.5, 0.9)
-            days_until = random.randint(1, 7)
-            predicted_date = (current_time + timedelta(days=days_until)).strftime('%Y-%m-%d %H:%M')
-            devices[device]['predicted_maintenance_date'] = predicted_date
-        else:
-            devices[device]['failure_probability'] = random.uniform(0.1, 0.5)
-            devices[device]['predicted_maintenance_date'] = "N/A"
-    
-    # Build visualizations
-    confidence_fig = go.Figure(data=[go.Bar(x=list(devices.keys()),
-                                              y=[devices[d]['ai_confidence'] for d in devices.keys()],
-                                              marker_color='#66d9ef')])
-    confidence_fig.update_layout(title='AI Confidence Levels', plot_bgcolor='rgba(0,0,0,0)',
-                                   paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
-                                   height=300, margin=dict(l=40, r=40, t=40, b=40))
+def update_dashboard(n, event, level, state):
+    started = time.perf_counter()
+    level = level or 'site'
+    snapshot = rollups.sync()
+    state = state or {'version': -1, 'epoch': -1, 'level': None, 'popup': False}
+    if snapshot is None or (state['version'] == snapshot.version and state['level'] == level):
+        CALLBACK_CALLS.inc('unchanged')
+        raise PreventUpdate
+    fleet = snapshot.devices
     
-    vision_counts = {'Active': 0, 'Degraded': 0, 'Offline': 0}
-    for d in devices.values():
-        vision_counts[d['vision_status']] += 1
-    vision_status_fig = go.Figure(data=[go.Pie(labels=list(vision_counts.keys()),
-                                                values=list(vision_counts.values()),
-                                                marker=dict(colors=['#66d9ef', '#ff6b6b', '#d9534f']))])
-    vision_status_fig.update_layout(title='Vision Module Status', plot_bgcolor='rgba(0,0,0,0)',
-                                    paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'), height=300)
-    
-    error_rates = [sum(1 for log in devices[d]['error_log'] if 'No issues' not in log) / 5 for d in devices.keys()]
-    error_rate_fig = go.Figure(data=[go.Scatter(x=list(devices.keys()),
-                                                 y=error_rates,
-                                                 mode='lines+markers',
-                                                 line=dict(color='#ff6b6b', width=3))])
-    error_rate_fig.update_layout(title='Error Rate (Last 5 Scans)', plot_bgcolor='rgba(0,0,0,0)',
-                                 paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
-                                 height=300, margin=dict(l=40, r=40, t=40, b=40))
-    
-    failure_fig = go.Figure(data=[go.Bar(x=list(devices.keys()),
-                                          y=[devices[d]['failure_probability'] for d in devices.keys()],
-                                          marker_color='#ff6b6b')])
-    failure_fig.update_layout(title='Device Failure Probability', plot_bgcolor='rgba(0,0,0,0)',
-                              paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'),
-                              height=300, margin=dict(l=40, r=40, t=40, b=40))
+    # Popup for the alert raised on the latest tick, if any
+    popup_content = no_update
+    popup_style = no_update
+    if snapshot.popup:
+        popup_content = [html.H3(snapshot.popup['title'], style={'color': '#5e8299'})] + [
+            html.P(line, style={'color': '#e6f0fa'}) for line in snapshot.popup['lines']]
+        popup_style = {'display': 'block'}
+    elif state['popup']:
+        popup_content = []
+        popup_style = {'display': 'none'}
+    new_state = {'version': snapshot.version, 'epoch': fleet.epoch, 'level': level,
+                 'popup': bool(snapshot.popup)}
+    state_done = time.perf_counter()
     
-    # Popup notifications for critical alerts and admin approvals
-    popup_content = []
-    popup_style = {'display': 'none'}
-    if (current_time - last_hourly_check).total_seconds() >= 3600:
-        last_hourly_check = current_time
-        dev = random.choice(list(devices.keys()))
-        if "Critical" in devices[dev]['error_log'][-1] or devices[dev]['status'] == 'Offline' or devices[dev]['anomaly_detected']:
-            msg = f"Critical issue on {dev}: {devices[dev]['error_log'][-1]}"
-            notifications.append({
-                "time": current_time.strftime('%H:%M:%S'),
-                "message": f"Slack: {msg}\nEmail: vision@quantum.io\nSMS: +1-555-987-6543"
-            })
-            popup_content = [
-                html.H3("Critical Alert", style={'color': '#5e8299'}),
-                html.P(f"Slack: {msg}", style={'color': '#e6f0fa'}),
-                html.P("Email: Sent to vision@quantum.io", style={'color': '#e6f0fa'}),
-                html.P("SMS: Sent to +1-555-987-6543", style={'color': '#e6f0fa'})
-            ]
-            popup_style = {'display': 'block'}
+    # Same level as last time: the x-axes (layout nodes) are unchanged, so only ship the
+    # rollup values, otherwise full figures
+    if state['level'] == level:
+        figures = []
+        for traces in figure_data(level):
+            patch = Patch()
+            for trace, values in enumerate(traces):
+                for prop, data in values.items():
+                    patch['data'][trace][prop] = data
+            figures.append(patch)
+    else:
+        figures = build_figures(level)
+    done = time.perf_counter()
     
-    if (current_time - last_30min_check).total_seconds() >= 1800:
-        last_30min_check = current_time
-        dev = "Security Camera"
-        approval_msg = f"Admin approval required for update of {dev} driver."
-        notifications.append({
-            "time": current_time.strftime('%H:%M:%S'),
-            "message": approval_msg
-        })
-        popup_content = [
-            html.H3("Update Approval Request", style={'color': '#5e8299'}),
-            html.P(approval_msg, style={'color': '#e6f0fa'})
-        ]
-        popup_style = {'display': 'block'}
+    CALLBACK_CALLS.inc('updated')
+    CALLBACK_SECONDS.observe(state_done - started, 'state')
+    CALLBACK_SECONDS.observe(done - state_done, 'figures')
+    CALLBACK_SECONDS.observe(done - started, 'total')
+    return figures + [popup_content, popup_style, new_state]
+
+# Device grid: one page of cards from the index. Re-runs on every new snapshot (via
+# 'dashboard-state') and on filter/paging changes; a card's terminal is only re-rendered
+# when the slot shows a different device or its device changed since the last render.
+@app.callback(
+    [Output({'type': 'device-card', 'index': ALL}, 'style'),
+     Output({'type': 'device-title', 'index': ALL}, 'children'),
+     Output({'type': TERMINAL_OUTPUT[0], 'index': ALL}, TERMINAL_OUTPUT[1]),
+     Output('grid-page-label', 'children'),
+     Output('grid-state', 'data')],
+    [Input('dashboard-state', 'data'),
+     Input('grid-search', 'value'),
+     Input('grid-status', 'value'),
+     Input('grid-vision', 'value'),
+     Input('grid-type', 'value'),
+     Input('grid-sort', 'value'),
+     Input('grid-prev', 'n_clicks'),
+     Input('grid-next', 'n_clicks')],
+    [State('grid-state', 'data')]
+)
+def update_grid(dashboard_state, search, status, vision, kind, sort, prev_clicks, next_clicks, grid):
+    started = time.perf_counter()
+    query = {'search': search or None, 'status': status, 'vision_status': vision, 'kind': kind,
+             'sort': None if sort in (None, 'name') else sort}
+    grid = grid or {'page': 0, 'query': None, 'names': [], 'epoch': -1}
+    # Changing any filter starts again from the first page
+    page = grid['page'] if grid['query'] == query else 0
+    if ctx.triggered_id == 'grid-prev':
+        page = max(0, page - 1)
+    elif ctx.triggered_id == 'grid-next':
+        page += 1
+    result = device_index.query(offset=page * GRID_PAGE_SIZE, limit=GRID_PAGE_SIZE, **query)
+    pages = max(1, math.ceil(result['total'] / GRID_PAGE_SIZE))
+    if page >= pages:
+        page = pages - 1
+        result = device_index.query(offset=page * GRID_PAGE_SIZE, limit=GRID_PAGE_SIZE, **query)
+    if result['snapshot'] is None:
+        raise PreventUpdate
+    fleet = result['snapshot'].devices
+    queried = time.perf_counter()
     
-    # Generate composite terminal outputs with rich details for each device
-    terminal_outputs = []
-    for device, data in devices.items():
-        terminal_outputs.append(format_device_info(device, data))
+    styles, titles, terminals = [], [], []
+    for slot in range(GRID_PAGE_SIZE):
+        name = result['names'][slot] if slot < len(result['names']) else None
+        previous = grid['names'][slot] if slot < len(grid['names']) else None
+        if name == previous:
+            styles.append(no_update)
+            titles.append(no_update)
+            if name is None or fleet.versions[fleet.index[name]] <= grid['epoch']:
+                terminals.append(no_update)
+            else:
+                terminals.append(terminal_content(name, fleet[name], shown=True))
+        elif name is None:
+            styles.append({'display': 'none'})
+            titles.append("")
+            terminals.append(None if CLIENT_TERMINALS else "")
+        else:
+            styles.append({})
+            titles.append(name)
+            terminals.append(terminal_content(name, fleet[name], shown=False))
     
-    return ([confidence_fig, vision_status_fig, error_rate_fig, failure_fig, popup_content, popup_style] +
-            terminal_outputs)
+    first = page * GRID_PAGE_SIZE
+    label = (f"{first + 1}-{first + len(result['names'])} of {result['total']}" if result['total']
+             else "No matching devices")
+    new_grid = {'page': page, 'query': query, 'names': result['names'], 'epoch': fleet.epoch,
+                'total': result['total']}
+    if new_grid == grid and all(terminal is no_update for terminal in terminals):
+        raise PreventUpdate
+    done = time.perf_counter()
+    CALLBACK_SECONDS.observe(queried - started, 'grid_query')
+    CALLBACK_SECONDS.observe(done - queried, 'terminals')
+    return styles, titles, terminals, label, new_grid
+
+# Trend graph: one line per device on the current grid page, at most TREND_POINTS points each
+# whatever the range. Refreshes every 10 s, or at once when the page's devices or options change.
+@app.callback(
+    [Output('trend-graph', 'figure'),
+     Output('trend-state', 'data')],
+    [Input('trend-poll', 'n_intervals'),
+     Input('grid-state', 'data'),
+     Input('trend-metric', 'value'),
+     Input('trend-range', 'value'),
+     Input('trend-method', 'value')],
+    [State('trend-state', 'data')]
+)
+def update_trends(n, grid, metric, span, method, trend):
+    names = (grid or {}).get('names', [])
+    if history is None or (ctx.triggered_id == 'grid-state' and trend and trend['names'] == names):
+        raise PreventUpdate
+    started = time.perf_counter()
+    end = time.time()
+    try:
+        result = history.query(metric, names, end - span, end, points=TREND_POINTS, method=method)
+    except ValueError:
+        # Devices the history has not seen yet
+        raise PreventUpdate
+    figure = go.Figure(data=[go.Scatter(x=times * 1000, y=values.round(4), mode='lines', name=name)
+                             for name, (times, values) in result['series'].items()])
+    label = next(option['label'] for option in TREND_METRICS if option['value'] == metric)
+    figure.update_layout(title=f"{label} ({result['tier']} buckets)", plot_bgcolor='rgba(0,0,0,0)',
+                         paper_bgcolor='rgba(10,20,30,0.9)', font=dict(color='#e6f0fa'), height=320,
+                         margin=dict(l=40, r=40, t=40, b=40), xaxis=dict(type='date'), uirevision=metric)
+    CALLBACK_SECONDS.observe(time.perf_counter() - started, 'trends')
+    return figure, {'names': names}
 
-# Run the app
+# Run the app. In debug mode Werkzeug's reloader re-runs this script in a child process that
+# does the serving; only that child starts the engine, listeners and writers, so two processes
+# never share the UDP port, the history files or the checkpoint.
 if __name__ == '__main__':
-    app.run(debug=True)
+    serving = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if serving:
+        start_services()
+    try:
+        app.run(debug=True)
+    finally:
+        if serving:
+            stop_services()
@@ -0,0 +1 @@
+"""Supporting subsystems for the Quantum Vision Control Center dashboard."""
@@ -0,0 +1,135 @@
+"""Streaming, vectorized anomaly detection and failure prediction over a DeviceStore."""
+import numpy as np
+
+# Metrics tracked per device; each gets an EWMA mean/variance and a z-score
+METRICS = ('ai_confidence', 'threat_score', 'health_score')
+DAY = 86400.0
+
+
+class StreamingAnalytics:
+    """O(1)-per-sample statistics for every device, updated for the whole fleet at once.
+
+    Each tick reads the current metric values, updates exponentially
+    weighted mean/variance (``alpha``) and flags a device as anomalous when
+    any metric's z-score exceeds ``z_threshold`` after ``warmup`` samples.
+    The ``health_score`` trend is an exponentially weighted least-squares
+    slope (``beta``); when the drift it implies over its window clearly
+    exceeds the health noise (``trend_z``), it is extrapolated down to
+    ``failure_health`` to give a predicted maintenance time and a failure
+    probability. Only running moments are kept, never the raw samples.
+    """
+
+    def __init__(self, capacity=16, metrics=METRICS, alpha=0.1, beta=0.05, z_threshold=3.0, warmup=5,
+                 trend_z=1.0, failure_health=60.0, horizon_days=7.0, max_lead_days=30.0):
+        self.metrics = metrics
+        self.alpha = alpha
+        self.beta = beta
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.trend_z = trend_z
+        self.failure_health = failure_health
+        self.horizon = horizon_days * DAY
+        self.max_lead = max_lead_days * DAY
+        # Times are kept relative to the first update for float precision
+        self.t0 = None
+        self._allocate(capacity)
+
+    # Per-device statistics, all indexed by row
+    FIELDS = ('mean', 'var', 'samples', 'et', 'eh', 'ett', 'eth')
+
+    def state(self, n):
+        """Copies of the first ``n`` rows of every statistic plus the time origin (for checkpoints)."""
+        return {name: getattr(self, name)[:n].copy() for name in self.FIELDS}, self.t0
+
+    def check(self, arrays):
+        """Raise ValueError (KeyError for a missing field) unless ``arrays`` can be restored."""
+        n = len(arrays['samples'])
+        for name in self.FIELDS:
+            if arrays[name].shape[1:] != getattr(self, name).shape[1:] or len(arrays[name]) != n:
+                raise ValueError(f"saved analytics field {name} has shape {arrays[name].shape}")
+
+    def restore(self, arrays, t0):
+        """Load statistics saved by ``state``; raises like ``check`` (changing nothing) if they don't fit."""
+        self.check(arrays)
+        n = len(arrays['samples'])
+        if n > len(self.samples):
+            self._allocate(n, keep=len(self.samples))
+        for name in self.FIELDS:
+            getattr(self, name)[:n] = arrays[name]
+        self.t0 = t0
+
+    def _allocate(self, capacity, keep=0):
+        old = getattr(self, 'mean', None)
+        fields = {
+            'mean': np.zeros((capacity, len(self.metrics)), dtype=np.float32),
+            'var': np.zeros((capacity, len(self.metrics)), dtype=np.float32),
+            'samples': np.zeros(capacity, dtype=np.int32),
+            # Exponentially weighted moments of (t, health) for the trend regression
+            'et': np.zeros(capacity, dtype=np.float64),
+            'eh': np.zeros(capacity, dtype=np.float64),
+            'ett': np.zeros(capacity, dtype=np.float64),
+            'eth': np.zeros(capacity, dtype=np.float64),
+        }
+        for name, array in fields.items():
+            if old is not None:
+                array[:keep] = getattr(self, name)[:keep]
+            setattr(self, name, array)
+
+    def update(self, store, now):
+        """Fold the current values of every device into its statistics and write predictions back."""
+        n = len(store)
+        if n > len(self.samples):
+            self._allocate(max(n, 2 * len(self.samples)), keep=len(self.samples))
+        t = now.timestamp()
+        x = np.column_stack([store.column(key) for key in self.metrics]).astype(np.float32)
+        mean, var, samples = self.mean[:n], self.var[:n], self.samples[:n]
+
+        # EWMA mean/variance; the first sample seeds the mean
+        first = samples == 0
+        mean[first] = x[first]
+        delta = x - mean
+        z = np.abs(delta) / np.sqrt(var + 1e-6)
+        mean += self.alpha * delta
+        var[:] = (1.0 - self.alpha) * (var + self.alpha * delta * delta)
+        samples += 1
+        anomaly = (samples > self.warmup) & (z > self.z_threshold).any(axis=1)
+
+        # Exponentially weighted least-squares slope of health over time (points per second)
+        if self.t0 is None:
+            self.t0 = t
+        t = t - self.t0
+        h = x[:, self.metrics.index('health_score')].astype(np.float64)
+        et, eh, ett, eth = self.et[:n], self.eh[:n], self.ett[:n], self.eth[:n]
+        w = np.where(first, 1.0, self.beta)
+        et += w * (t - et)
+        eh += w * (h - eh)
+        ett += w * (t * t - ett)
+        eth += w * (t * h - eth)
+        var_t = np.maximum(ett - et * et, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(var_t > 0, (eth - et * eh) / var_t, 0.0)
+
+        # Extrapolate only a clear downward trend to the failure threshold
+        health = self.metrics.index('health_score')
+        level = mean[:, health]
+        noise = np.sqrt(var[:, health]) + 1.0
+        declining = (slope < 0) & (-slope * 2.0 * np.sqrt(var_t) > self.trend_z * noise)
+        margin = level - self.failure_health
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eta = np.where(margin <= 0, 0.0, np.where(declining, margin / -slope, np.inf))
+        p_trend = np.exp(-eta / self.horizon)
+        p_level = np.clip((80.0 - level) / 40.0, 0.0, 1.0)
+        failure = 1.0 - (1.0 - p_trend) * (1.0 - p_level)
+        failure = np.where(anomaly, np.maximum(failure, 0.5), failure).astype(np.float32)
+        predicted = np.where(eta <= self.max_lead, self.t0 + t + eta, np.nan)
+
+        # Only mark devices whose displayed predictions actually moved
+        previous = store.column('failure_probability')
+        changed = ((np.abs(failure - previous) >= 0.005) | (anomaly != store.column('anomaly_detected'))
+                   | ~np.isclose(predicted, store.column('predicted_maintenance_date'), rtol=0, atol=60,
+                                 equal_nan=True))
+        store.column('anomaly_detected')[:] = anomaly
+        store.column('failure_probability')[:] = failure
+        store.column('predicted_maintenance_date')[:] = predicted
+        store.touch(np.flatnonzero(changed))
+        return anomaly
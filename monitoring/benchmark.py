@@ -0,0 +1,297 @@
+"""Benchmark harness: dashboard callback, tick and render cost at growing fleet sizes, plus recorder fps."""
+import argparse
+import gzip
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (10, 100, 1000, 10000)
+
+# Layout order of the update_dashboard outputs
+OUTPUTS = [('confidence-graph', 'figure'), ('vision-status-graph', 'figure'), ('error-rate-graph', 'figure'),
+           ('failure-probability-graph', 'figure'), ('popup-alert', 'children'), ('popup-alert', 'style'),
+           ('dashboard-state', 'data')]
+# update_grid inputs after 'dashboard-state', with the default (unfiltered) values
+GRID_INPUTS = [('grid-search', 'value', None), ('grid-status', 'value', None), ('grid-vision', 'value', None),
+               ('grid-type', 'value', None), ('grid-sort', 'value', 'name'), ('grid-prev', 'n_clicks', None),
+               ('grid-next', 'n_clicks', None)]
+
+
+class SyntheticScreen:
+    """Frame source cycling through pre-generated noise frames (worst case for the encoder)."""
+
+    size = (1280, 720)
+
+    def __init__(self, frames=8, seed=0):
+        width, height = self.size
+        rng = np.random.default_rng(seed)
+        self._frames = [rng.integers(0, 256, (height, width, 4), dtype=np.uint8) for _ in range(frames)]
+        self._next = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def grab(self):
+        frame = self._frames[self._next]
+        self._next = (self._next + 1) % len(self._frames)
+        return frame
+
+
+def percentiles(samples, scale=1000.0):
+    samples = np.asarray(samples, dtype=float) * scale
+    if not samples.size:
+        return None
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {'p50': round(p50, 3), 'p90': round(p90, 3), 'p99': round(p99, 3),
+            'max': round(samples.max(), 3), 'mean': round(samples.mean(), 3)}
+
+
+class DashboardClient:
+    """Drives ``update_dashboard`` and then ``update_grid`` through Dash's HTTP endpoint, as a browser tab would."""
+
+    def __init__(self, dashboard):
+        self.dashboard = dashboard
+        self.client = dashboard.server.test_client()
+        dependencies = self.client.get('/_dash-dependencies').json
+        self.output = next(dep['output'] for dep in dependencies if 'dashboard-state' in dep['output'])
+        self.grid_output = next(dep['output'] for dep in dependencies if 'grid-state' in dep['output'])
+        self.outputs = [{'id': component, 'property': prop} for component, prop in OUTPUTS]
+        slots = range(dashboard.GRID_PAGE_SIZE)
+        self.grid_outputs = [[{'id': {'type': kind, 'index': slot}, 'property': prop} for slot in slots]
+                             for kind, prop in (('device-card', 'style'), ('device-title', 'children'),
+                                                dashboard.TERMINAL_OUTPUT)]
+        self.grid_outputs += [{'id': 'grid-page-label', 'property': 'children'},
+                              {'id': 'grid-state', 'property': 'data'}]
+        self.polls = 0
+
+    def _post(self, body, key, state):
+        request = json.dumps(body).encode()
+        started = time.perf_counter()
+        response = self.client.post('/_dash-update-component', data=request, content_type='application/json',
+                                    headers={'Accept-Encoding': 'gzip'})
+        elapsed = time.perf_counter() - started
+        wire = response.data
+        data = gzip.decompress(wire) if response.headers.get('Content-Encoding') == 'gzip' else wire
+        if response.status_code == 200:
+            state = json.loads(data)['response'][key]['data']
+        return elapsed, (len(request), len(data), len(wire)), state
+
+    def call(self, state):
+        """One update of a tab; ``state`` is (dashboard state, grid state), both unchanged on 204.
+
+        In push mode the update is triggered the way the browser's SSE
+        listener does it, by writing the notified snapshot version into
+        ``stream-event``; otherwise by the polling interval.
+        Returns (dashboard seconds, grid seconds, (request bytes, response bytes,
+        bytes on the wire), new state).
+        """
+        dashboard_state, grid_state = state or (None, None)
+        self.polls += 1
+        if self.dashboard.PUSH_MODE:
+            event, trigger = self.dashboard.fleet_source.snapshot().version, 'stream-event.data'
+        else:
+            event, trigger = None, 'interval-component.n_intervals'
+        body = {'output': self.output, 'outputs': self.outputs,
+                'inputs': [{'id': 'interval-component', 'property': 'n_intervals',
+                            'value': 0 if self.dashboard.PUSH_MODE else self.polls},
+                           {'id': 'stream-event', 'property': 'data', 'value': event},
+                           {'id': 'graph-level', 'property': 'value', 'value': 'site'}],
+                'state': [{'id': 'dashboard-state', 'property': 'data', 'value': dashboard_state}],
+                'changedPropIds': [trigger]}
+        seconds, size, dashboard_state = self._post(body, 'dashboard-state', dashboard_state)
+        body = {'output': self.grid_output, 'outputs': self.grid_outputs,
+                'inputs': [{'id': 'dashboard-state', 'property': 'data', 'value': dashboard_state}]
+                          + [{'id': component, 'property': prop, 'value': value}
+                             for component, prop, value in GRID_INPUTS],
+                'state': [{'id': 'grid-state', 'property': 'data', 'value': grid_state}],
+                'changedPropIds': ['dashboard-state.data']}
+        grid_seconds, grid_size, grid_state = self._post(body, 'grid-state', grid_state)
+        return seconds, grid_seconds, tuple(np.add(size, grid_size).tolist()), (dashboard_state, grid_state)
+
+
+def bench_fleet(size, ticks, alloc_ticks):
+    """Measure one fleet size in this process; the dashboard must not be loaded yet."""
+    os.environ['IOT_SYNTHETIC_DEVICES'] = str(size)
+    os.environ['IOT_ROLE'] = 'standalone'
+    # Nothing from the caller's deployment may leak in: no checkpoint restore, no real vision scans
+    os.environ['IOT_CHECKPOINT'] = ''
+    os.environ['IOT_VISION_SOURCE'] = ''
+    os.environ.setdefault('IOT_PUSH_MODE', '1')
+    # Metric history is written on every tick, so it is part of the measured cost, but not kept
+    os.environ['IOT_HISTORY_DIR'] = tempfile.mkdtemp(prefix='iot-history-')
+    sys.path.insert(0, HERE)
+    import serve
+
+    started = time.perf_counter()
+    dashboard = serve.load_dashboard()
+    load_seconds = time.perf_counter() - started
+    client = DashboardClient(dashboard)
+    engine = dashboard.engine
+    dashboard.history.acquire()
+    now = datetime.now()
+
+    first_seconds, first_grid, first_bytes, state = client.call(None)
+    tick_times, callback_times, grid_times, payloads = [], [], [], []
+    for _ in range(ticks):
+        now += timedelta(seconds=engine.interval)
+        started = time.perf_counter()
+        engine.tick(now)
+        tick_times.append(time.perf_counter() - started)
+        seconds, grid_seconds, size_bytes, state = client.call(state)
+        callback_times.append(seconds)
+        grid_times.append(grid_seconds)
+        payloads.append(size_bytes)
+    requests, payloads, wire = np.array(payloads).T
+    idle_seconds, idle_grid, idle_bytes, _ = client.call(state)
+
+    # Terminal text for every device: cold (fresh renderer) then cached
+    fleet = engine.snapshot().devices
+    renderer = type(dashboard.terminals)()
+    started = time.perf_counter()
+    for name in fleet.names:
+        renderer.render(name, fleet[name])
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for name in fleet.names:
+        renderer.render(name, fleet[name])
+    cached = time.perf_counter() - started
+
+    # Transient peak and retained growth per tick + callback, under tracemalloc
+    tracemalloc.start()
+    alloc_peaks, retained = [], []
+    for _ in range(alloc_ticks):
+        now += timedelta(seconds=engine.interval)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        engine.tick(now)
+        _, _, _, state = client.call(state)
+        current, peak = tracemalloc.get_traced_memory()
+        alloc_peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+    shutil.rmtree(os.environ['IOT_HISTORY_DIR'], ignore_errors=True)
+
+    return {
+        'devices': len(fleet),
+        'load_seconds': round(load_seconds, 3),
+        'tick_ms': percentiles(tick_times),
+        'callback_ms': percentiles(callback_times),
+        'grid_callback_ms': percentiles(grid_times),
+        'first_load_ms': round((first_seconds + first_grid) * 1000, 3),
+        'unchanged_poll_ms': round((idle_seconds + idle_grid) * 1000, 3),
+        'terminal_rendering': 'client' if dashboard.CLIENT_TERMINALS else 'server',
+        'push_mode': dashboard.PUSH_MODE,
+        'compression': dashboard.COMPRESSION,
+        'request_bytes': {'first_load': first_bytes[0], 'tick_mean': round(float(np.mean(requests))),
+                          'tick_max': int(max(requests)), 'unchanged_poll': idle_bytes[0]},
+        'payload_bytes': {'first_load': first_bytes[1], 'tick_mean': round(float(np.mean(payloads))),
+                          'tick_max': int(max(payloads)), 'unchanged_poll': idle_bytes[1]},
+        'wire_bytes': {'first_load': first_bytes[2], 'tick_mean': round(float(np.mean(wire))),
+                       'tick_max': int(max(wire)), 'unchanged_poll': idle_bytes[2]},
+        'render_us_per_device': {'cold': round(cold / len(fleet) * 1e6, 2),
+                                 'cached': round(cached / len(fleet) * 1e6, 2)},
+        'tick_alloc_peak_bytes': int(np.median(alloc_peaks)) if alloc_peaks else None,
+        'tick_retained_bytes': int(np.median(retained)) if retained else None,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def bench_recorder(duration, fps, screen=False):
+    """Achieved fps of both recorder modes on the synthetic source (or the real screen)."""
+    from monitoring.recorder import MssSource, ScreenRecorder, SegmentedRecorder
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = MssSource() if screen else SyntheticScreen()
+        recorder = ScreenRecorder(os.path.join(tmp, 'bench.mp4'), fps=fps, duration=duration, source=source).start()
+        recorder.join(duration + 30)
+        results['thread'] = recorder.stats()
+        if recorder.error:
+            results['thread']['error'] = str(recorder.error)
+
+        segmented = SegmentedRecorder(output_dir=tmp, prefix='bench', fps=fps, duration=duration,
+                                      source=None if screen else 'monitoring.benchmark:SyntheticScreen').start()
+        segmented.join(duration + 30)
+        results['process'] = segmented.stats()
+        segmented.close()
+    results['source'] = 'screen' if screen else 'synthetic %dx%d' % SyntheticScreen.size
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard at several fleet sizes; prints JSON")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help="comma-separated fleet sizes")
+    parser.add_argument('--ticks', type=int, default=30, help="timed engine ticks per size")
+    parser.add_argument('--alloc-ticks', type=int, default=5, help="ticks measured under tracemalloc")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', default='', help='device type weights, e.g. "Security Camera=3,Smart Lock=1"')
+    parser.add_argument('--change-rate', type=float, default=0.25)
+    parser.add_argument('--error-rate', type=float, default=0.3)
+    parser.add_argument('--poll', action='store_true', help="benchmark interval polling instead of push mode")
+    parser.add_argument('--record-seconds', type=float, default=3, help="recorder run length (0 skips)")
+    parser.add_argument('--record-fps', type=int, default=20)
+    parser.add_argument('--screen', action='store_true', help="record the real (or virtual X) display")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--fleet-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.fleet_size:
+        # Child mode: one size per fresh process so peak memory is not shared between sizes
+        print(json.dumps(bench_fleet(args.fleet_size, args.ticks, args.alloc_ticks)))
+        return
+
+    env = dict(os.environ, IOT_SYNTHETIC_SEED=str(args.seed), IOT_SYNTHETIC_MIX=args.mix,
+               IOT_SYNTHETIC_CHANGE_RATE=str(args.change_rate), IOT_SYNTHETIC_ERROR_RATE=str(args.error_rate),
+               IOT_PUSH_MODE='0' if args.poll else '1')
+    fleets = []
+    for size in (int(size) for size in args.sizes.split(',') if size):
+        result = subprocess.run([sys.executable, '-m', 'monitoring.benchmark', '--fleet-size', str(size),
+                                 '--ticks', str(args.ticks), '--alloc-ticks', str(args.alloc_ticks)],
+                                cwd=HERE, env=env, capture_output=True, text=True)
+        if result.returncode:
+            fleets.append({'devices': size, 'error': result.stderr.strip().splitlines()[-1:]})
+        else:
+            fleets.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        print(f"benchmarked {size} devices", file=sys.stderr)
+
+    report = {'environment': environment(),
+              'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'fleet_size')},
+              'fleet': fleets}
+    if args.record_seconds:
+        report['recorder'] = bench_recorder(args.record_seconds, args.record_fps, args.screen)
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Periodic crash-safe checkpoints of engine state and fast warm restart from them."""
+import fcntl
+import logging
+import mmap
+import os
+import threading
+import time
+
+from monitoring.codec import decode_arrays, encode_arrays, snapshot_arrays, snapshot_from, snapshot_header, verify
+
+MAGIC = b'IOTC'
+
+log = logging.getLogger(__name__)
+
+
+def write_checkpoint(path, snapshot, arrays=(), state=None):
+    """Write ``snapshot`` plus extra named ``arrays`` and a JSON-ready ``state`` dict to ``path``.
+
+    The file is written under a temporary name, fsynced and renamed over
+    ``path``, so a crash leaves either the previous checkpoint or the new
+    one, never a torn file. Returns the number of bytes written.
+    """
+    data = encode_arrays(dict(snapshot_header(snapshot), state=state or {}),
+                         list(snapshot_arrays(snapshot)) + list(arrays), magic=MAGIC, checksums=True)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp, path)
+    # Make the rename itself durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return len(data)
+
+
+class Checkpoint:
+    """A checkpoint file mapped read-only.
+
+    Opening only checks the prefix, header and bounds; arrays are read
+    straight from the mapping and each one's CRC-32 is verified the first
+    time it is used, so a restore touches every page once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, self._arrays = decode_arrays(self._map, MAGIC)
+        self.state = self.header.get('state', {})
+        self._verified = set()
+
+    def array(self, name):
+        array = self._arrays[name]
+        if name not in self._verified:
+            verify(self.header, name, array)
+            self._verified.add(name)
+        return array
+
+    def arrays(self, prefix):
+        """Verified arrays whose names start with ``prefix``, keyed by the rest of the name."""
+        return {name[len(prefix):]: self.array(name) for name in self._arrays if name.startswith(prefix)}
+
+    def snapshot(self):
+        """The checkpointed ``Snapshot``; its arrays are still backed by the mapping."""
+        names = [name for name in self._arrays if name == 'versions' or name.startswith(('column:', 'log:'))]
+        return snapshot_from(self.header, {name: self.array(name) for name in names})
+
+
+class Checkpointer:
+    """Checkpoint the latest published snapshot every ``interval`` seconds from a background thread.
+
+    ``capture(snapshot)`` runs on the engine thread right after a publish,
+    between ticks, and returns ``(arrays, state)`` for the state kept
+    outside the snapshot (analytics, notifications, timers). It should only
+    copy: encoding, writing and fsyncing happen on the checkpoint thread,
+    so the tick loop never waits on the disk. A checkpoint still pending
+    when a newer one is captured is simply replaced. A failed write is
+    logged and counted in ``failures`` and ``last_error``; the thread keeps
+    going. Writes need an exclusive lock on ``<path>.lock``, taken by
+    ``start()``, so two processes never replace the same file.
+    """
+
+    def __init__(self, path, capture, interval=30.0):
+        self.path = path
+        self.capture = capture
+        self.interval = interval
+        self.written = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_time = None
+        self.last_seconds = None
+        self.last_bytes = None
+        self._due = time.monotonic() + interval
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._owner = None
+
+    def _acquire(self):
+        """Take the checkpoint lock for this process; raises OSError if another process has it."""
+        if self._owner is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        owner = open(f'{self.path}.lock', 'a+')
+        try:
+            fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner.close()
+            raise BlockingIOError(f"{self.path} is already checkpointed by another process") from None
+        self._owner = owner
+
+    def attach(self, engine):
+        engine.subscribe(self._published)
+        return self
+
+    def _published(self, snapshot):
+        now = time.monotonic()
+        if now < self._due or self._stop.is_set():
+            return
+        self._due = now + self.interval
+        self._hold(snapshot)
+
+    def _hold(self, snapshot):
+        arrays, state = self.capture(snapshot)
+        with self._lock:
+            self._pending = (snapshot, arrays, state)
+        self._wake.set()
+
+    def start(self):
+        self._acquire()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='checkpoints', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        started = time.perf_counter()
+        try:
+            self._acquire()
+            size = write_checkpoint(self.path, *pending)
+        except Exception as exc:
+            self.failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            log.exception("checkpoint write failed")
+            return
+        self.written += 1
+        self.last_bytes = size
+        self.last_seconds = time.perf_counter() - started
+        self.last_time = time.time()
+
+    def close(self, final=None):
+        """Stop the thread; with ``final`` (a snapshot, taken once ticks have stopped) write it first."""
+        if final is not None:
+            self._hold(final)
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_pending()
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
@@ -0,0 +1,131 @@
+"""Compact binary encoding of engine snapshots (shared-memory publishing and checkpoints)."""
+import json
+import struct
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from monitoring.engine import Snapshot
+from monitoring.events import EventRing
+from monitoring.store import FleetSnapshot
+
+MAGIC = b'IOTS'
+FORMAT_VERSION = 1
+# magic, format version, header length
+_PREFIX = struct.Struct('<4sII')
+
+
+def _arrays(fleet):
+    for key, column in fleet.columns.items():
+        yield f'column:{key}', column
+    yield 'versions', fleet.versions
+    for log, ring in fleet.logs.items():
+        for name in EventRing.ARRAYS:
+            yield f'log:{log}:{name}', getattr(ring, name)
+
+
+def encode_arrays(header, arrays, magic=MAGIC, checksums=False):
+    """Serialize a JSON-ready ``header`` dict plus named arrays into one bytes object.
+
+    Layout: prefix, JSON header (with the array table), then the raw array
+    bytes, each aligned to 8 bytes so decoding can map them in place. With
+    ``checksums`` every table entry also carries the CRC-32 of its bytes.
+    """
+    table = []
+    blobs = []
+    offset = 0
+    for name, array in arrays:
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        entry = [name, np.lib.format.dtype_to_descr(array.dtype), list(array.shape), offset]
+        if checksums:
+            entry.append(zlib.crc32(data))
+        table.append(entry)
+        blobs.append(data)
+        offset += array.nbytes
+        pad = -offset % 8
+        if pad:
+            blobs.append(b'\0' * pad)
+            offset += pad
+    header = json.dumps(dict(header, arrays=table, length=offset)).encode()
+    header += b' ' * (-(_PREFIX.size + len(header)) % 8)
+    return b''.join([_PREFIX.pack(magic, FORMAT_VERSION, len(header)), header] + blobs)
+
+
+def decode_arrays(buffer, magic=MAGIC):
+    """Inverse of ``encode_arrays``: (header, {name: read-only view into ``buffer``}).
+
+    Only the prefix, header and bounds are checked here; CRC-32s, when
+    present, stay in ``header['checksums']`` for the caller to verify as
+    it consumes each array.
+    """
+    if len(buffer) < _PREFIX.size:
+        raise ValueError("truncated encoding")
+    found, version, header_length = _PREFIX.unpack_from(buffer, 0)
+    if found != magic:
+        raise ValueError(f"expected {magic!r} data, found {found!r}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported format version {version}")
+    start = _PREFIX.size + header_length
+    header = json.loads(bytes(buffer[_PREFIX.size:start]))
+    if start + header.get('length', 0) > len(buffer):
+        raise ValueError("truncated encoding")
+    arrays = {}
+    header['checksums'] = {}
+    for name, descr, shape, offset, *crc in header.pop('arrays'):
+        dtype = np.lib.format.descr_to_dtype(descr)
+        count = int(np.prod(shape))
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+        if array.flags.writeable:
+            array.flags.writeable = False
+        arrays[name] = array
+        if crc:
+            header['checksums'][name] = crc[0]
+    return header, arrays
+
+
+def verify(header, name, array):
+    """Raise ValueError if ``array`` does not match the CRC-32 recorded for ``name``."""
+    expected = header['checksums'].get(name)
+    if expected is not None and zlib.crc32(np.ascontiguousarray(array)) != expected:
+        raise ValueError(f"checksum mismatch in {name}")
+    return array
+
+
+def snapshot_header(snapshot):
+    fleet = snapshot.devices
+    return {
+        'version': snapshot.version,
+        'time': snapshot.time.isoformat(),
+        'popup': snapshot.popup,
+        'epoch': fleet.epoch,
+        'names': list(fleet.names),
+        'log_capacity': {log: ring.capacity for log, ring in fleet.logs.items()},
+    }
+
+
+def snapshot_arrays(snapshot):
+    return _arrays(snapshot.devices)
+
+
+def snapshot_from(header, arrays):
+    """Rebuild a ``Snapshot`` from a decoded header and its (read-only) arrays."""
+    columns = {name.split(':', 1)[1]: array for name, array in arrays.items() if name.startswith('column:')}
+    logs = {}
+    for log, capacity in header['log_capacity'].items():
+        logs[log] = EventRing.from_arrays(capacity, {name: arrays[f'log:{log}:{name}'] for name in EventRing.ARRAYS})
+    names = tuple(header['names'])
+    fleet = FleetSnapshot(names, {name: i for i, name in enumerate(names)}, columns, logs,
+                          arrays['versions'], header['epoch'])
+    return Snapshot(header['version'], datetime.fromisoformat(header['time']), fleet, header['popup'])
+
+
+def encode_snapshot(snapshot):
+    """Serialize a ``Snapshot`` of a ``FleetSnapshot`` into one bytes object."""
+    return encode_arrays(snapshot_header(snapshot), snapshot_arrays(snapshot))
+
+
+def decode_snapshot(buffer):
+    """Rebuild a ``Snapshot`` whose arrays are read-only views into ``buffer``."""
+    return snapshot_from(*decode_arrays(buffer))
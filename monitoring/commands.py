@@ -0,0 +1,394 @@
+"""Bulk device commands fanned out through a bounded asyncio executor with progress tracking."""
+import asyncio
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from flask import jsonify, request
+
+from monitoring.store import device_type
+
+# ``waves`` are cumulative fleet fractions run one after another (a staged
+# rollout); a wave whose failure share exceeds ``max_failure_rate`` stops the job.
+# ``type_limit`` caps concurrent commands per device type.
+CommandSpec = namedtuple('CommandSpec', ['label', 'effects', 'timeout', 'retries', 'waves', 'type_limit',
+                                         'max_failure_rate'])
+
+COMMANDS = {
+    'lock': CommandSpec("Lock devices", {'ai_shield': True}, 2.0, 2, (1.0,), 200, 1.0),
+    # Unshielded devices are left alone by the simulator, i.e. frozen in place
+    'freeze': CommandSpec("Freeze operations", {'ai_shield': False}, 2.0, 2, (1.0,), 200, 1.0),
+    'firmware': CommandSpec("Firmware update", {'maintenance_alert': None, 'optimization_suggestion': None},
+                            30.0, 1, (0.01, 0.1, 0.5, 1.0), 25, 0.2),
+    'restart': CommandSpec("Restart devices", {'status': 'Online', 'vision_status': 'Active'}, 10.0, 2, (1.0,), 100, 1.0),
+}
+
+ACTIVE = ('queued', 'running')
+
+
+class CommandError(Exception):
+    """A device rejected or failed a command."""
+
+
+class DeviceEndpoint:
+    """Transport to one device; ``execute`` is a coroutine that raises on failure."""
+
+    async def execute(self, device, command):
+        raise NotImplementedError
+
+
+class SimulatedEndpoint(DeviceEndpoint):
+    """Local stand-in for device APIs: random latency, occasional failures and hangs."""
+
+    LATENCY = {'firmware': (0.5, 2.0), 'restart': (0.2, 1.0)}
+
+    def __init__(self, latency=(0.02, 0.2), failure_rate=0.02, hang_rate=0.005, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.rng = random.Random(seed)
+
+    async def execute(self, device, command):
+        low, high = self.LATENCY.get(command, self.latency)
+        roll = self.rng.random()
+        if roll < self.hang_rate:
+            # Never answers; the executor's timeout has to catch it
+            await asyncio.sleep(3600)
+        await asyncio.sleep(self.rng.uniform(low, high))
+        if roll < self.hang_rate + self.failure_rate:
+            raise CommandError(f"{device} rejected {command}")
+
+
+class CommandJob:
+    """One command over a set of devices; counters are plain ints read without locking."""
+
+    def __init__(self, job_id, command, names, waves):
+        self.id = job_id
+        self.command = command
+        self.names = names
+        # End offset of each wave in ``names``; empty waves are merged away
+        self.waves = sorted({min(len(names), max(1, round(len(names) * fraction))) for fraction in waves}
+                            if names else set())
+        self.wave = 0
+        self.state = 'queued'
+        self.created = time.time()
+        self.finished = None
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.retried = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.errors = []
+        self._task = None
+        self._applied = []
+
+    @property
+    def done(self):
+        return self.succeeded + self.failed + self.timed_out + self.cancelled
+
+    def progress(self):
+        return {'id': self.id, 'command': self.command, 'label': COMMANDS[self.command].label,
+                'state': self.state, 'total': len(self.names), 'done': self.done,
+                'succeeded': self.succeeded, 'failed': self.failed, 'timed_out': self.timed_out,
+                'cancelled': self.cancelled, 'retried': self.retried, 'in_flight': self.in_flight,
+                'wave': self.wave, 'waves': len(self.waves), 'errors': self.errors[:10],
+                'seconds': round((self.finished or time.time()) - self.created, 2)}
+
+
+class _CommandRoutes:
+    """``/commands`` routes over ``view`` and ``cancel_view``."""
+
+    def register(self, server, rule='/commands'):
+        server.add_url_rule(rule, 'device_commands', self.view, methods=['GET', 'POST'])
+        server.add_url_rule(rule + '/cancel', 'device_commands_cancel', self.cancel_view, methods=['POST'])
+        server.add_url_rule(rule + '/<job_id>', 'device_command', self.view)
+        server.add_url_rule(rule + '/<job_id>/<action>', 'device_command_action', self.view, methods=['POST'])
+        return self
+
+
+class CommandExecutor(_CommandRoutes):
+    """Run bulk commands on an asyncio loop in a background thread.
+
+    Each device command is a task gated by its device type's limit and the
+    global ``concurrency`` cap, with a timeout and retries with exponential
+    backoff. Successful devices are written back to ``store`` in batches
+    under ``lock``. ``version`` increases whenever any job's progress moves,
+    so pollers can skip work when nothing changed.
+    """
+
+    def __init__(self, store, lock, endpoint, concurrency=512, keep=20, backoff=0.2, flush_interval=0.25):
+        self.store = store
+        self.lock = lock
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.backoff = backoff
+        self.flush_interval = flush_interval
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.version = 0
+        self._ids = itertools.count(1)
+        self._loop = None
+        self._thread = None
+        self._limit = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def in_flight(self):
+        return sum(job.in_flight for job in list(self.jobs.values()))
+
+    def active(self):
+        return [job for job in list(self.jobs.values()) if job.state in ACTIVE]
+
+    def recent(self, limit=5):
+        """``(version, progress of the newest ``limit`` jobs)``, what the dashboard polls."""
+        return self.version, [job.progress() for job in list(self.jobs.values())[-limit:]]
+
+    def start(self):
+        if self.running:
+            return self
+        ready = threading.Event()
+
+        def run():
+            loop = self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._limit = asyncio.Semaphore(self.concurrency)
+            loop.create_task(self._flusher())
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='device-commands', daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # Callers (any thread) --------------------------------------------------
+
+    def submit(self, command, devices=None):
+        """Start ``command`` on ``devices`` (default: the whole fleet); returns the job."""
+        spec = COMMANDS[command]
+        if not self.running:
+            self.start()
+        names = list(self.store.names if devices is None else devices)
+        job = CommandJob(f"{command}-{next(self._ids):04d}", command, names, spec.waves)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.state in ACTIVE:
+                break
+            self.jobs.popitem(last=False)
+        self._loop.call_soon_threadsafe(self._launch, job)
+        self.version += 1
+        return job
+
+    def cancel(self, job_id=None):
+        """Cancel one job, or every active job; returns the cancelled jobs."""
+        jobs = [self.jobs[job_id]] if job_id in self.jobs else [] if job_id else self.active()
+        for job in jobs:
+            if job.state in ACTIVE and self._loop is not None:
+                self._loop.call_soon_threadsafe(self._cancel, job)
+        return jobs
+
+    # Event loop ------------------------------------------------------------
+
+    def _launch(self, job):
+        job._task = self._loop.create_task(self._run(job))
+
+    def _cancel(self, job):
+        if job._task is not None and not job._task.done():
+            job._task.cancel()
+        else:
+            job.state = 'cancelled'
+            job.cancelled = len(job.names) - job.done
+            job.finished = time.time()
+        self.version += 1
+
+    async def _run(self, job):
+        spec = COMMANDS[job.command]
+        job.state = 'running'
+        type_limits = {}
+        tasks = []
+        try:
+            start = 0
+            for job.wave, stop in enumerate(job.waves, 1):
+                wave = job.names[start:stop]
+                start = stop
+                tasks = []
+                for name in wave:
+                    kind = device_type(name)
+                    limit = type_limits.get(kind)
+                    if limit is None:
+                        limit = type_limits[kind] = asyncio.Semaphore(spec.type_limit)
+                    tasks.append(asyncio.ensure_future(self._execute(job, spec, name, limit)))
+                failures_before = job.failed + job.timed_out
+                await asyncio.gather(*tasks)
+                self._flush(job)
+                if (job.failed + job.timed_out - failures_before) / len(wave) > spec.max_failure_rate:
+                    job.errors.insert(0, f"stopped after wave {job.wave}: failure rate above "
+                                         f"{spec.max_failure_rate:.0%}")
+                    job.cancelled = len(job.names) - job.done
+                    job.state = 'failed'
+                    return
+            job.state = 'completed'
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._flush(job)
+            job.cancelled = len(job.names) - job.done
+            job.state = 'cancelled'
+        finally:
+            job.finished = time.time()
+            self.version += 1
+
+    async def _execute(self, job, spec, name, type_limit):
+        async with type_limit, self._limit:
+            job.in_flight += 1
+            try:
+                for attempt in range(spec.retries + 1):
+                    try:
+                        await asyncio.wait_for(self.endpoint.execute(name, job.command), spec.timeout)
+                    except asyncio.TimeoutError:
+                        error, timed_out = f"{name}: timed out after {spec.timeout:g} s", True
+                    except CommandError as exc:
+                        error, timed_out = f"{name}: {exc}", False
+                    else:
+                        job.succeeded += 1
+                        job._applied.append(name)
+                        return
+                    if attempt == spec.retries:
+                        if timed_out:
+                            job.timed_out += 1
+                        else:
+                            job.failed += 1
+                        if len(job.errors) < 100:
+                            job.errors.append(error)
+                        return
+                    job.retried += 1
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+            finally:
+                job.in_flight -= 1
+                self.version += 1
+
+    def _flush(self, job):
+        """Write the effects of newly succeeded devices into the store in one locked batch."""
+        names, job._applied = job._applied, []
+        if not names:
+            return
+        with self.lock:
+            index = self.store.index
+            rows = np.fromiter((index[name] for name in names if name in index), dtype=np.int64)
+            self.store.assign(rows, COMMANDS[job.command].effects)
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            for job in self.active():
+                self._flush(job)
+
+    # HTTP ------------------------------------------------------------------
+
+    def view(self, job_id=None, action=None):
+        if request.method == 'POST' and job_id is None:
+            body = request.get_json(silent=True)
+            body = body if isinstance(body, dict) else {}
+            if body.get('command') not in COMMANDS:
+                return jsonify({'error': f"command must be one of {sorted(COMMANDS)}"}), 400
+            devices = body.get('devices')
+            if devices is not None and not (isinstance(devices, list)
+                                            and all(isinstance(name, str) for name in devices)):
+                return jsonify({'error': "devices must be a list of device names, or null for the whole fleet"}), 400
+            return jsonify(self.submit(body['command'], devices).progress()), 202
+        if job_id is None:
+            response = jsonify([job.progress() for job in list(self.jobs.values())])
+            response.headers['X-Commands-Version'] = str(self.version)
+            return response
+        if job_id not in self.jobs:
+            return jsonify({'error': f"unknown job {job_id}"}), 404
+        if action == 'cancel':
+            self.cancel(job_id)
+        elif action is not None:
+            return jsonify({'error': f"unknown action {action}; only cancel is supported"}), 404
+        return jsonify(self.jobs[job_id].progress())
+
+    def cancel_view(self):
+        return jsonify([job.progress() for job in self.cancel()])
+
+
+class RemoteJob:
+    """A writer-side job as last reported over HTTP, with ``CommandJob``'s ``id`` and ``progress()``."""
+
+    def __init__(self, progress):
+        self.id = progress['id']
+        self._progress = progress
+
+    def progress(self):
+        return self._progress
+
+
+class CommandForwarder(_CommandRoutes):
+    """``CommandExecutor`` front end for web workers that do not own the device store.
+
+    Submissions, cancels and job listings go to the writer's ``/commands``
+    routes through ``client`` (a ``monitoring.control.WriterClient``), so
+    every worker starts, lists and cancels the same jobs. The same routes
+    are served here by relaying them. Calls raise OSError while the writer
+    is unreachable.
+    """
+
+    def __init__(self, client, rule='/commands'):
+        self.client = client
+        self.rule = rule
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def _call(self, method, path='', body=None):
+        status, payload, headers = self.client.call(method, self.rule + path, body)
+        if status >= 400:
+            raise ValueError(payload.get('error', f"writer answered {status}"))
+        return payload, headers
+
+    def submit(self, command, devices=None):
+        body = {'command': command} if devices is None else {'command': command, 'devices': list(devices)}
+        return RemoteJob(self._call('POST', body=body)[0])
+
+    def cancel(self, job_id=None):
+        if job_id is None:
+            return [RemoteJob(progress) for progress in self._call('POST', '/cancel')[0]]
+        return [RemoteJob(self._call('POST', f'/{job_id}/cancel')[0])]
+
+    def recent(self, limit=5):
+        jobs, headers = self._call('GET')
+        return int(headers.get('X-Commands-Version', 0)), jobs[-limit:]
+
+    # HTTP ------------------------------------------------------------------
+
+    def view(self, job_id=None, action=None):
+        path = ''.join(f'/{part}' for part in (job_id, action) if part)
+        try:
+            status, payload, headers = self.client.call(request.method, self.rule + path,
+                                                        request.get_data() or None)
+        except OSError as exc:
+            return jsonify({'error': f"fleet writer unreachable: {exc}"}), 502
+        response = jsonify(payload)
+        response.status_code = status
+        if 'X-Commands-Version' in headers:
+            response.headers['X-Commands-Version'] = headers['X-Commands-Version']
+        return response
+
+    def cancel_view(self):
+        return self.view('cancel')
@@ -0,0 +1,46 @@
+"""Response compression: Flask-Compress when installed, otherwise a gzip ``after_request`` hook."""
+import gzip
+
+from flask import request
+
+# Dynamic text responses worth compressing. Dash's JavaScript bundles are fingerprinted and
+# cached by the browser, so the fallback leaves them alone rather than re-gzip megabytes per load.
+MIMETYPES = ('application/json', 'text/html', 'text/plain')
+
+
+def enable_compression(server, level=6, minimum_size=500):
+    """Gzip responses of ``server`` for clients that accept it; returns the backend used.
+
+    Flask-Compress (which also speaks brotli) is preferred when importable.
+    Bodies under ``minimum_size`` bytes and streamed responses, such as
+    Server-Sent Events, are sent as they are. Hooks registered before this
+    call see the compressed body, since Flask runs ``after_request``
+    functions last-registered first.
+    """
+    try:
+        from flask_compress import Compress
+    except ImportError:
+        pass
+    else:
+        server.config.setdefault('COMPRESS_MIMETYPES', list(MIMETYPES))
+        server.config.setdefault('COMPRESS_LEVEL', level)
+        server.config.setdefault('COMPRESS_MIN_SIZE', minimum_size)
+        Compress(server)
+        return 'flask-compress'
+
+    @server.after_request
+    def gzip_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in MIMETYPES or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+            return response
+        data = response.get_data()
+        if len(data) < minimum_size:
+            return response
+        # mtime=0 keeps the output byte-for-byte stable for identical bodies
+        response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return 'gzip'
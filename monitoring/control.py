@@ -0,0 +1,35 @@
+"""JSON calls from web workers to the fleet writer's loopback control listener."""
+import json
+import urllib.error
+import urllib.request
+
+DEFAULT_PORT = 8051
+
+
+class WriterClient:
+    """Minimal JSON-over-HTTP client for the writer's own routes (``/commands``, ``/recording``).
+
+    Under serve.py the writer serves the dashboard's Flask app on
+    ``127.0.0.1:IOT_CONTROL_PORT``; workers send anything that must act on
+    writer-owned state there. ``call`` returns ``(status, payload, headers)``
+    for any HTTP status and raises OSError when the writer cannot be reached.
+    """
+
+    def __init__(self, base_url, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def call(self, method, path, body=None):
+        data = None if body is None else body if isinstance(body, bytes) else json.dumps(body).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.load(response), response.headers
+        except urllib.error.HTTPError as exc:
+            with exc:
+                try:
+                    payload = json.load(exc)
+                except ValueError:
+                    payload = {'error': f"writer answered {exc.code} {exc.reason}"}
+                return exc.code, payload, exc.headers
@@ -0,0 +1,121 @@
+"""Fixed-capacity per-device ring buffers of compact structured log events."""
+import numpy as np
+
+# Severity codes; anything at WARNING or above counts towards the error rate
+INFO, WARNING, ERROR, CRITICAL = 0, 1, 2, 3
+
+# One event is 15 bytes: epoch seconds (NaN for seed entries), owning row,
+# template code, severity and a small template argument code.
+EVENT_DTYPE = np.dtype([('time', 'f8'), ('device', 'i4'), ('code', 'u1'),
+                        ('severity', 'u1'), ('arg', 'u1')])
+
+# Message templates per log, indexed by event code. Text is only produced
+# when a terminal is rendered, never on the tick path.
+TEMPLATES = {
+    'scan_log': (
+        "Vision scan on {device}...",
+        "AI analysis complete: {arg}",
+        "Starting scan...",
+    ),
+    'error_log': (
+        "No issues detected",
+        "Critical failure - AI rebooting",
+        "Vision module offline - AI restoring",
+        "{error_type}",
+        "No issues",
+    ),
+    'ai_log': (
+        "AI adjusted {device} parameters",
+        "Threat prediction updated for {device}",
+        "Health score recalculated for {device}",
+        "Anomaly detection triggered for {device}",
+        "No anomalies in {device}",
+        "Maintenance scheduled for {device}",
+        "No maintenance needed for {device}",
+        "Optimization applied: {arg}",
+        "No optimization needed for {device}",
+    ),
+}
+SEVERITY = {
+    'scan_log': (INFO, INFO, INFO),
+    'error_log': (INFO, CRITICAL, ERROR, WARNING, INFO),
+    'ai_log': (INFO,) * len(TEMPLATES['ai_log']),
+}
+
+
+def seed_event(kind, text, device=0):
+    """Encode an untimestamped literal log line (e.g. "Starting scan...") as an event."""
+    code = TEMPLATES[kind].index(text)
+    return np.array((np.nan, device, code, SEVERITY[kind][code], 0), dtype=EVENT_DTYPE)
+
+
+class EventRing:
+    """Preallocated ``devices x capacity`` ring of events, appended for many rows at once.
+
+    ``flagged`` tracks, per device, how many retained events are WARNING or
+    worse, so error rates are a counter read rather than a scan of the log.
+    ``appended`` counts every append or clear per device, so readers can tell
+    whether a log changed without looking at its contents.
+    """
+
+    def __init__(self, capacity=5, devices=16):
+        self.capacity = capacity
+        self.events = np.zeros((devices, capacity), dtype=EVENT_DTYPE)
+        self.head = np.zeros(devices, dtype=np.int32)
+        self.count = np.zeros(devices, dtype=np.int32)
+        self.flagged = np.zeros(devices, dtype=np.int32)
+        self.appended = np.zeros(devices, dtype=np.uint32)
+
+    def grow(self, devices):
+        events = np.zeros((devices, self.capacity), dtype=EVENT_DTYPE)
+        events[:len(self.events)] = self.events
+        self.events = events
+        for name in self.ARRAYS[1:]:
+            column = getattr(self, name)
+            grown = np.zeros(devices, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def append(self, rows, time, code, severity, arg=0):
+        """Append one event to each of ``rows``; other arguments broadcast against it."""
+        slots = self.head[rows]
+        evicted = self.events['severity'][rows, slots] >= WARNING
+        self.flagged[rows] -= (self.count[rows] == self.capacity) & evicted
+        self.events['time'][rows, slots] = time
+        self.events['device'][rows, slots] = rows
+        self.events['code'][rows, slots] = code
+        self.events['severity'][rows, slots] = severity
+        self.events['arg'][rows, slots] = arg
+        self.flagged[rows] += np.asarray(severity) >= WARNING
+        self.head[rows] = (slots + 1) % self.capacity
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.capacity)
+        self.appended[rows] += 1
+
+    def clear(self, i):
+        self.head[i] = self.count[i] = self.flagged[i] = 0
+        self.appended[i] += 1
+
+    def latest(self, i):
+        """Retained events for row ``i``, oldest first."""
+        n = self.count[i]
+        return self.events[i, (self.head[i] - n + np.arange(n)) % self.capacity]
+
+    ARRAYS = ('events', 'head', 'count', 'flagged', 'appended')
+
+    @classmethod
+    def from_arrays(cls, capacity, arrays):
+        """Wrap existing arrays (named as in ``ARRAYS``) without copying."""
+        ring = cls.__new__(cls)
+        ring.capacity = capacity
+        for name in cls.ARRAYS:
+            setattr(ring, name, arrays[name])
+        return ring
+
+    def copy(self, devices):
+        """Read-only copy of the first ``devices`` rows."""
+        arrays = {}
+        for name in self.ARRAYS:
+            frozen = getattr(self, name)[:devices].copy()
+            frozen.flags.writeable = False
+            arrays[name] = frozen
+        return EventRing.from_arrays(self.capacity, arrays)
@@ -0,0 +1,229 @@
+"""Site > building > room grouping with rollup aggregates maintained from changed rows."""
+import threading
+
+import numpy as np
+from flask import jsonify, request
+
+from monitoring.store import STATUS, VISION_STATUS
+
+LEVELS = ('site', 'building', 'room')
+# Summed per node (means and rates are derived from the sums at read time)
+SUMS = ('ai_confidence', 'flagged')
+# Counted per code per node
+COUNTS = {'status': len(STATUS), 'vision_status': len(VISION_STATUS)}
+# Kept as a per-node maximum
+MAXIMA = ('threat_score', 'failure_probability')
+
+
+class FleetLayout:
+    """Fixed tree of sites, buildings and rooms; devices sit in rooms.
+
+    ``rooms`` is a sequence of (site, building, room) name paths. A room's
+    position in it is the id stored in each device's ``room`` column.
+    """
+
+    def __init__(self, rooms):
+        self.rooms = [tuple(path) for path in rooms]
+        if not self.rooms:
+            raise ValueError("a layout needs at least one room")
+        self.sites = list(dict.fromkeys(path[0] for path in self.rooms))
+        self.buildings = list(dict.fromkeys(path[:2] for path in self.rooms))
+        self.ids = {path: i for i, path in enumerate(self.rooms)}
+        sites = {site: i for i, site in enumerate(self.sites)}
+        buildings = {building: i for i, building in enumerate(self.buildings)}
+        # Node index of each room's building and each building's site
+        self.parents = {
+            'room': np.array([buildings[path[:2]] for path in self.rooms], dtype=np.intp),
+            'building': np.array([sites[site] for site, _ in self.buildings], dtype=np.intp),
+        }
+
+    @classmethod
+    def generate(cls, sites, buildings, rooms):
+        """Regular ``sites`` x ``buildings`` x ``rooms`` layout with numbered names."""
+        return cls([(f"Site {s + 1:02d}", f"Building {b + 1:02d}", f"Room {b + 1}{r + 1:02d}")
+                    for s in range(sites) for b in range(buildings) for r in range(rooms)])
+
+    def room_id(self, site, building, room):
+        return self.ids[(site, building, room)]
+
+    def nodes(self, level):
+        return {'site': self.sites, 'building': self.buildings, 'room': self.rooms}[level]
+
+    def labels(self, level):
+        return [node if isinstance(node, str) else ' / '.join(node) for node in self.nodes(level)]
+
+
+def _floats(values):
+    return [None if value != value else round(value, 3) for value in values.tolist()]
+
+
+class FleetRollups:
+    """Per site, building and room aggregates over the snapshots published by ``source``.
+
+    Every node keeps a device count, status and vision status counts, the
+    sums behind mean AI confidence and error rate, and the highest threat
+    score and failure probability. A sync reads only the rows that changed
+    since the last indexed epoch: their previously seen contribution is
+    subtracted from their old room and the new one added to their current
+    room, and those room deltas are carried up to buildings and sites. A
+    maximum cannot be un-added, so a room is rescanned only when the row
+    holding its maximum went down or moved out.
+    """
+
+    def __init__(self, source, layout):
+        self.source = source
+        self.layout = layout
+        self.snapshot = None
+        self.log_capacity = 1
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.epoch = None
+        self.size = 0
+        # Contribution each row made at the last sync; ``present`` is False until the first
+        self.present = np.zeros(0, dtype=np.bool_)
+        self.seen = {'room': np.zeros(0, dtype=np.intp),
+                     'status': np.zeros(0, dtype=np.uint8), 'vision_status': np.zeros(0, dtype=np.uint8),
+                     'ai_confidence': np.zeros(0), 'flagged': np.zeros(0),
+                     'threat_score': np.zeros(0), 'failure_probability': np.zeros(0)}
+        self.totals = {}
+        for level in LEVELS:
+            size = len(self.layout.nodes(level))
+            totals = {'devices': np.zeros(size, dtype=np.int64)}
+            totals.update((key, np.zeros(size)) for key in SUMS)
+            totals.update((key, np.zeros((size, codes), dtype=np.int64)) for key, codes in COUNTS.items())
+            totals.update((key, np.full(size, np.nan)) for key in MAXIMA)
+            self.totals[level] = totals
+
+    def sync(self):
+        """Fold the latest snapshot into the rollups; returns it (``None`` before the first publish)."""
+        snapshot = self.source.snapshot()
+        if snapshot is None:
+            return None
+        fleet = snapshot.devices
+        with self._lock:
+            if fleet.epoch == self.epoch:
+                return self.snapshot
+            if self.epoch is not None and (fleet.epoch < self.epoch or len(fleet) < self.size):
+                # A restarted writer: epochs went backwards, start over
+                self._reset()
+            self._apply(fleet)
+            self.snapshot = snapshot
+        return snapshot
+
+    def _apply(self, fleet):
+        n = len(fleet)
+        if n > self.size:
+            self.present = np.concatenate([self.present, np.zeros(n - self.size, dtype=np.bool_)])
+            for key, seen in self.seen.items():
+                self.seen[key] = np.concatenate([seen, np.zeros(n - self.size, dtype=seen.dtype)])
+            self.size = n
+        rows = fleet.changed_since(-1 if self.epoch is None else self.epoch)
+        ring = fleet.logs['error_log']
+        self.log_capacity = ring.capacity
+
+        present = self.present[rows]
+        old = {key: seen[rows][present] for key, seen in self.seen.items()}
+        new = {key: fleet.column(key)[rows] for key in ('status', 'vision_status') + MAXIMA}
+        new['ai_confidence'] = fleet.column('ai_confidence')[rows]
+        new['flagged'] = ring.flagged[rows]
+        # Rooms missing from the layout fall into the last room rather than breaking the rollup
+        new['room'] = np.minimum(fleet.column('room')[rows], len(self.layout.rooms) - 1).astype(np.intp)
+
+        size = len(self.layout.rooms)
+        delta = {'devices': np.bincount(new['room'], minlength=size) - np.bincount(old['room'], minlength=size)}
+        for key in SUMS:
+            delta[key] = (np.bincount(new['room'], weights=new[key], minlength=size)
+                          - np.bincount(old['room'], weights=old[key], minlength=size))
+        for key, codes in COUNTS.items():
+            delta[key] = (np.bincount(new['room'] * codes + new[key], minlength=size * codes)
+                          - np.bincount(old['room'] * codes + old[key], minlength=size * codes)).reshape(size, codes)
+
+        # Rooms whose maximum row dropped or left need a rescan once the new values are in
+        maxima = self.totals['room']
+        stale = set()
+        moved = old['room'] != new['room'][present]
+        for key in MAXIMA:
+            held = old[key] >= maxima[key][old['room']]
+            dropped = moved | (new[key][present] < old[key])
+            stale.update(old['room'][held & dropped].tolist())
+
+        for key, values in new.items():
+            self.seen[key][rows] = values
+        self.present[rows] = True
+
+        # Carry the room deltas up the tree
+        for level, parent in (('room', None), ('building', self.layout.parents['room']),
+                              ('site', self.layout.parents['building'])):
+            totals = self.totals[level]
+            if parent is not None:
+                delta = {key: self._up(values, parent, len(totals['devices'])) for key, values in delta.items()}
+            for key, values in delta.items():
+                totals[key] += values.astype(totals[key].dtype, copy=False)
+
+        for key in MAXIMA:
+            column = maxima[key]
+            np.fmax.at(column, new['room'], new[key])
+            if stale:
+                dirty = np.fromiter(stale, dtype=np.intp)
+                column[dirty] = np.nan
+                members = np.flatnonzero(np.isin(self.seen['room'], dirty) & self.present)
+                np.fmax.at(column, self.seen['room'][members], self.seen[key][members])
+            # Few rooms, so the upper levels are simply refolded from their children
+            below = column
+            for level, parent in (('building', self.layout.parents['room']),
+                                  ('site', self.layout.parents['building'])):
+                above = self.totals[level][key]
+                above.fill(np.nan)
+                np.fmax.at(above, parent, below)
+                below = above
+        self.epoch = fleet.epoch
+
+    @staticmethod
+    def _up(values, parent, size):
+        out = np.zeros((size,) + values.shape[1:], dtype=values.dtype)
+        np.add.at(out, parent, values)
+        return out
+
+    def level(self, level):
+        """Aggregates for every node of ``level`` in layout order, JSON-ready."""
+        if level not in LEVELS:
+            raise ValueError(f"level must be one of {list(LEVELS)}")
+        self.sync()
+        with self._lock:
+            totals = self.totals[level]
+            devices = totals['devices']
+            with np.errstate(invalid='ignore', divide='ignore'):
+                confidence = totals['ai_confidence'] / devices
+                errors = totals['flagged'] / (devices * self.log_capacity)
+            return {
+                'level': level,
+                'epoch': self.epoch,
+                'labels': self.layout.labels(level),
+                'devices': devices.tolist(),
+                'status': {value: totals['status'][:, code].tolist() for code, value in enumerate(STATUS)},
+                'vision_status': {value: totals['vision_status'][:, code].tolist()
+                                  for code, value in enumerate(VISION_STATUS)},
+                'ai_confidence': _floats(confidence),
+                'error_rate': _floats(errors),
+                'threat_score': _floats(totals['threat_score']),
+                'failure_probability': _floats(totals['failure_probability']),
+            }
+
+    def vision_counts(self):
+        """Fleet-wide vision status counts, summed over the sites."""
+        with self._lock:
+            return self.totals['site']['vision_status'].sum(axis=0).tolist()
+
+    # HTTP ------------------------------------------------------------------
+
+    def view(self):
+        try:
+            return jsonify(self.level(request.args.get('level', 'site')))
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+
+    def register(self, server, rule='/rollups'):
+        server.add_url_rule(rule, 'fleet_rollups', self.view)
+        return self
@@ -0,0 +1,390 @@
+"""Memory-mapped columnar metric history with 1 s / 1 min / 1 h tiers and downsampled range queries."""
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+from flask import jsonify, request
+
+FORMAT_VERSION = 1
+METRICS = ('ai_confidence', 'failure_probability', 'error_rate')
+# (name, bucket seconds, default retention seconds)
+TIERS = (('1s', 1, 3600), ('1min', 60, 7 * 86400), ('1h', 3600, 365 * 86400))
+METHODS = ('lttb', 'minmax')
+
+
+def metric_values(fleet):
+    """Current value of every history metric for every device in a snapshot."""
+    return {'ai_confidence': fleet.column('ai_confidence'),
+            'failure_probability': fleet.column('failure_probability'),
+            'error_rate': fleet.error_rates()}
+
+
+def lttb(t, values, points):
+    """Largest-Triangle-Three-Buckets down to ``points`` per row of ``values``.
+
+    All rows share the sample times ``t``, so each bucket step runs across
+    every row at once. Returns (times, values), both shaped (rows, points).
+    """
+    rows, n = values.shape
+    if n <= points or points < 3:
+        return np.broadcast_to(t, values.shape), values
+    every = (n - 2) / (points - 2)
+    edges = (np.arange(points - 1) * every).astype(np.intp) + 1
+    picked = np.empty((rows, points), dtype=np.intp)
+    picked[:, 0] = 0
+    picked[:, -1] = n - 1
+    known = ~np.isnan(values)
+    filled = np.where(known, values, 0.0)
+    all_rows = np.arange(rows)
+    prev_t = np.full(rows, t[0])
+    prev_v = values[:, 0]
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        after = edges[i + 2] if i + 2 < len(edges) else n
+        # Average of the next bucket is the triangle's third corner
+        avg_t = t[hi:after].mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_v = filled[:, hi:after].sum(axis=1) / known[:, hi:after].sum(axis=1)
+        area = np.abs((prev_t - avg_t)[:, None] * (values[:, lo:hi] - prev_v[:, None])
+                      - (prev_t[:, None] - t[lo:hi]) * (avg_v - prev_v)[:, None])
+        j = np.argmax(np.where(np.isnan(area), -1.0, area), axis=1) + lo
+        picked[:, i + 1] = j
+        prev_t = t[j]
+        prev_v = values[all_rows, j]
+    return t[picked], np.take_along_axis(values, picked, axis=1)
+
+
+def minmax(t, lows, highs, points):
+    """Keep each bucket's lowest and highest sample, in time order: ``points`` per row at most."""
+    rows, n = lows.shape
+    buckets = max(1, points // 2)
+    if n <= points:
+        return np.broadcast_to(t, lows.shape), (lows + highs) / 2
+    width = math.ceil(n / buckets)
+    pad = buckets * width - n
+    lows = np.pad(lows, ((0, 0), (0, pad)), constant_values=np.nan).reshape(rows, buckets, width)
+    highs = np.pad(highs, ((0, 0), (0, pad)), constant_values=np.nan).reshape(rows, buckets, width)
+    low = np.argmin(np.where(np.isnan(lows), np.inf, lows), axis=2)
+    high = np.argmax(np.where(np.isnan(highs), -np.inf, highs), axis=2)
+    low_v = np.take_along_axis(lows, low[..., None], axis=2)[..., 0]
+    high_v = np.take_along_axis(highs, high[..., None], axis=2)[..., 0]
+    offsets = np.arange(buckets) * width
+    low = np.minimum(low + offsets, n - 1)
+    high = np.minimum(high + offsets, n - 1)
+    first = np.where(low <= high, low, high)
+    second = np.where(low <= high, high, low)
+    first_v = np.where(low <= high, low_v, high_v)
+    second_v = np.where(low <= high, high_v, low_v)
+    positions = np.stack([first, second], axis=2).reshape(rows, -1)
+    return t[positions], np.stack([first_v, second_v], axis=2).reshape(rows, -1)
+
+
+def _floats(values):
+    return [None if value != value else round(value, 4) for value in values.tolist()]
+
+
+class HistoryStore:
+    """Append-only history of ``METRICS`` per device, kept in memory-mapped files under ``path``.
+
+    Every tier is a ring of time buckets: one float64 start time per bucket
+    and, per metric, a float32 matrix laid out device-major (each device's
+    series is contiguous) so range queries read whole runs. The 1 s tier
+    stores samples as they arrive; the 1 min and 1 h tiers store the mean,
+    min and max of each bucket, accumulated in memory and written when the
+    bucket closes. A bucket's slot is its number modulo the tier's
+    capacity, so retention is by time and old buckets are overwritten in
+    place. Adding devices grows the files; ``readonly`` stores (workers)
+    re-map whenever the writer's metadata changes.
+
+    A writable store touches nothing on disk until ``acquire()`` takes an
+    exclusive lock on ``path``, so only one process ever writes a history
+    directory.
+    """
+
+    def __init__(self, path, retention=None, width=64, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        retention = retention or {}
+        self.tiers = [(name, resolution, max(1, int(retention.get(name, keep) // resolution)))
+                      for name, resolution, keep in TIERS]
+        self.names = []
+        self.index = {}
+        self.since = []
+        self.width = 0
+        self.samples = 0
+        self._maps = {}
+        self._acc = {}
+        self._stamp = None
+        self._checked = False
+        self._lock = threading.Lock()
+        self._width = width
+        self._owner = None
+        if readonly:
+            self._refresh()
+
+    def acquire(self):
+        """Lock ``path`` for this process and open the files for writing.
+
+        Raises OSError if another process already writes this history.
+        """
+        if self.readonly or self._owner is not None:
+            return self
+        os.makedirs(self.path, exist_ok=True)
+        owner = open(os.path.join(self.path, 'lock'), 'a+')
+        try:
+            fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner.close()
+            raise BlockingIOError(f"{self.path} is already written by another process") from None
+        self._owner = owner
+        with self._lock:
+            self._load(self._width)
+        return self
+
+    def release(self):
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    # Files -----------------------------------------------------------------
+
+    def _files(self, width):
+        """(key, file name, dtype, shape) for every mapped array."""
+        for tier, _, capacity in self.tiers:
+            yield (tier, 'times'), f'{tier}.times', np.float64, (capacity,)
+            for metric in METRICS:
+                for stat in self._stats(tier):
+                    yield (tier, metric, stat), f'{tier}.{metric}.{stat}', np.float32, (width, capacity)
+
+    def _stats(self, tier):
+        return ('mean',) if tier == self.tiers[0][0] else ('mean', 'min', 'max')
+
+    def _meta(self):
+        return {'version': FORMAT_VERSION, 'metrics': list(METRICS), 'tiers': [list(tier) for tier in self.tiers]}
+
+    def _load(self, width):
+        meta = None
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as source:
+                meta = json.load(source)
+        except (OSError, ValueError):
+            pass
+        if meta is not None and all(meta.get(key) == value for key, value in self._meta().items()):
+            self.names, self.since = meta['names'], meta['since']
+            self.index = {name: i for i, name in enumerate(self.names)}
+            self._map(meta['width'])
+        else:
+            # Missing or from another configuration: start empty
+            self._map(width, fresh=True)
+            self._write_meta()
+
+    def _map(self, width, fresh=False):
+        # Built aside and swapped in whole, so readers never see a partial set of arrays
+        maps = {}
+        for key, filename, dtype, shape in self._files(width):
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            filename = os.path.join(self.path, filename)
+            if not self.readonly:
+                with open(filename, 'a+b') as handle:
+                    if fresh:
+                        handle.truncate(0)
+                    # Sparse growth: untouched pages cost no disk or memory
+                    if os.fstat(handle.fileno()).st_size < nbytes:
+                        handle.truncate(nbytes)
+            maps[key] = np.memmap(filename, dtype=dtype, mode='r' if self.readonly else 'r+', shape=shape)
+        self._maps = maps
+        self.width = width
+
+    def _write_meta(self):
+        meta = dict(self._meta(), width=self.width, names=self.names, since=self.since)
+        temp = os.path.join(self.path, 'meta.json.tmp')
+        with open(temp, 'w') as out:
+            json.dump(meta, out)
+        os.replace(temp, os.path.join(self.path, 'meta.json'))
+
+    def _refresh(self):
+        """Readers: re-map after the writer grew the files or reset the history."""
+        try:
+            stamp = os.stat(os.path.join(self.path, 'meta.json')).st_mtime_ns
+        except OSError:
+            return
+        if stamp == self._stamp:
+            return
+        with open(os.path.join(self.path, 'meta.json')) as source:
+            meta = json.load(source)
+        if any(meta.get(key) != value for key, value in self._meta().items()):
+            return
+        self.names, self.since = meta['names'], meta['since']
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self._map(meta['width'])
+        self._stamp = stamp
+
+    # Writing ---------------------------------------------------------------
+
+    def _track(self, names, now):
+        """Line rows up with the fleet's devices (names are only compared in full once)."""
+        if len(names) == len(self.names) and self._checked:
+            return
+        if tuple(self.names) != tuple(names[:len(self.names)]):
+            # A different fleet: the old rows mean nothing any more
+            self.names, self.since = [], []
+            for tier, _, _ in self.tiers:
+                self._maps[(tier, 'times')][:] = 0
+            self._acc = {}
+        self._checked = True
+        if len(names) > len(self.names):
+            self.since.extend([now] * (len(names) - len(self.names)))
+            self.names = list(names)
+            self.index = {name: i for i, name in enumerate(self.names)}
+            if len(names) > self.width:
+                width = max(self.width, 1)
+                while width < len(names):
+                    width *= 2
+                self._map(width)
+        self._write_meta()
+
+    def record(self, snapshot):
+        """Append one snapshot; fits ``FleetEngine.subscribe``. Ignored until ``acquire()``."""
+        if snapshot is None or self._owner is None:
+            return
+        fleet = snapshot.devices
+        now = snapshot.time.timestamp()
+        values = metric_values(fleet)
+        n = len(fleet)
+        with self._lock:
+            self._track(fleet.names, now)
+            for tier, resolution, capacity in self.tiers:
+                bucket = int(now // resolution)
+                if tier == self.tiers[0][0]:
+                    slot = bucket % capacity
+                    for metric in METRICS:
+                        self._maps[(tier, metric, 'mean')][:n, slot] = values[metric]
+                    # Time last: a bucket is only valid once its values are in
+                    self._maps[(tier, 'times')][slot] = bucket * resolution
+                    continue
+                acc = self._acc.get(tier)
+                if acc is not None and (acc['bucket'] != bucket or acc['size'] != n):
+                    self._close(tier, acc)
+                    acc = None
+                if acc is None:
+                    # Per metric: running sum, min, max and number of non-NaN samples per device
+                    acc = self._acc[tier] = {'bucket': bucket, 'size': n}
+                    for metric in METRICS:
+                        acc[metric] = (np.zeros(n), np.full(n, np.nan), np.full(n, np.nan),
+                                       np.zeros(n, dtype=np.int32))
+                for metric in METRICS:
+                    value = values[metric].astype(np.float64)
+                    total, low, high, known = acc[metric]
+                    present = ~np.isnan(value)
+                    total += np.where(present, value, 0.0)
+                    np.fmin(low, value, out=low)
+                    np.fmax(high, value, out=high)
+                    known += present
+            self.samples += 1
+
+    def _close(self, tier, acc):
+        """Write an accumulated bucket into its tier."""
+        resolution, capacity = next((res, cap) for name, res, cap in self.tiers if name == tier)
+        slot = acc['bucket'] % capacity
+        n = acc['size']
+        for metric in METRICS:
+            total, low, high, known = acc[metric]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = total / known
+            for stat, value in (('mean', mean), ('min', low), ('max', high)):
+                self._maps[(tier, metric, stat)][:n, slot] = value
+        self._maps[(tier, 'times')][slot] = acc['bucket'] * resolution
+
+    def flush(self):
+        """Write the partly filled 1 min / 1 h buckets (on shutdown) and sync the files."""
+        if self._owner is None:
+            return
+        with self._lock:
+            for tier, acc in list(self._acc.items()):
+                self._close(tier, acc)
+            for array in self._maps.values():
+                array.flush()
+
+    # Reading ---------------------------------------------------------------
+
+    def tier_for(self, start, now=None):
+        """Finest tier whose retention still reaches back to ``start``.
+
+        One bucket of slack lets "the last hour" computed a moment earlier stay on the 1 s tier.
+        """
+        now = time.time() if now is None else now
+        for tier, resolution, capacity in self.tiers:
+            if now - start <= resolution * (capacity + 1):
+                return tier, resolution, capacity
+        return self.tiers[-1]
+
+    def query(self, metric, names, start, end=None, points=300, method='lttb'):
+        """Downsampled series of ``metric`` for ``names`` over [start, end] (epoch seconds).
+
+        Returns ``{'tier', 'resolution', 'series': {name: (times, values)}}``
+        with at most ``points`` samples per device.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {list(METRICS)}")
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {list(METHODS)}")
+        end = time.time() if end is None else end
+        with self._lock:
+            if self.readonly:
+                self._refresh()
+            if not self._maps:
+                raise ValueError("no history has been recorded yet")
+            tier, resolution, capacity = self.tier_for(start)
+            unknown = [name for name in names if name not in self.index]
+            if unknown:
+                raise ValueError(f"no history for {', '.join(unknown[:5])}")
+            rows = np.array([self.index[name] for name in names], dtype=np.intp)
+            last = int(end // resolution)
+            buckets = np.arange(max(math.ceil(start / resolution), last - capacity + 1), last + 1)
+            slots = buckets % capacity
+            # A slot holds this bucket only if it was written for it (not a lap ago, not never)
+            held = self._maps[(tier, 'times')][slots] == buckets * resolution
+            slots, times = slots[held], (buckets[held] * resolution).astype(np.float64)
+            grid = np.ix_(rows, slots)
+            means = self._maps[(tier, metric, 'mean')][grid].astype(np.float64)
+            if method == 'minmax' and tier != self.tiers[0][0]:
+                lows = self._maps[(tier, metric, 'min')][grid].astype(np.float64)
+                highs = self._maps[(tier, metric, 'max')][grid].astype(np.float64)
+            else:
+                lows = highs = means
+            since = np.array([self.since[i] for i in rows])
+        # Buckets from before a device joined hold another fleet's (or no) data
+        before = times[None, :] < (since[:, None] // resolution) * resolution
+        means[before] = np.nan
+        if lows is not means:
+            lows[before] = highs[before] = np.nan
+        if method == 'lttb':
+            times, values = lttb(times, means, points)
+        else:
+            times, values = minmax(times, lows, highs, points)
+        return {'tier': tier, 'resolution': resolution,
+                'series': {name: (times[i], values[i]) for i, name in enumerate(names)}}
+
+    # HTTP ------------------------------------------------------------------
+
+    def view(self):
+        args = request.args
+        try:
+            end = float(args['end']) if 'end' in args else time.time()
+            start = float(args['start']) if 'start' in args else end - float(args.get('range', 3600))
+            names = [name for name in args.get('devices', '').split(',') if name]
+            result = self.query(args.get('metric', 'ai_confidence'), names, start, end,
+                                points=min(int(args.get('points', 300)), 5000), method=args.get('method', 'lttb'))
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        result['series'] = {name: {'t': _floats(times), 'v': _floats(values)}
+                            for name, (times, values) in result['series'].items()}
+        return jsonify(result)
+
+    def register(self, server, rule='/history'):
+        server.add_url_rule(rule, 'metric_history', self.view)
+        return self
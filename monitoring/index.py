@@ -0,0 +1,213 @@
+"""Incrementally maintained fleet indexes for filtered, ranked and paginated device queries."""
+import heapq
+import threading
+from collections import defaultdict
+
+import numpy as np
+from flask import jsonify, request
+
+from monitoring.store import CODES, device_type
+
+FILTERS = ('status', 'vision_status')
+RANKINGS = ('threat_score', 'failure_probability')
+OTHER_TYPE = 'Other'
+# Largest page /devices serves
+MAX_PAGE = 1000
+# Marks rows not yet present in a per-row array
+_UNSET = 255
+
+
+def _ranked(heap):
+    """Yield heap entries in ascending order without popping (frontier walk, O(k log k) for k items)."""
+    if not heap:
+        return
+    frontier = [(heap[0], 0)]
+    while frontier:
+        entry, i = heapq.heappop(frontier)
+        yield entry
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+class FleetIndex:
+    """Secondary indexes over the snapshots published by ``source``.
+
+    Row sets per status, vision status and device type, plus one max-heap
+    per risk score, are brought up to date from the rows that changed since
+    the last indexed epoch. Heaps use lazy deletion: a changed score pushes
+    a new entry and stale ones are skipped when read, with a rebuild once
+    stale entries outnumber live ones ``rebuild_factor`` to one. Queries then
+    touch only the matching rows, and a ranked page reads only as far down a
+    heap as the page needs.
+    """
+
+    def __init__(self, source, rebuild_factor=4):
+        self.source = source
+        self.rebuild_factor = rebuild_factor
+        self.epoch = None
+        self.size = 0
+        self.rebuilds = 0
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.names = []
+        self.lower_names = []
+        self.by_code = {key: defaultdict(set) for key in FILTERS}
+        self.by_type = defaultdict(set)
+        self.codes = {key: np.zeros(0, dtype=np.uint8) for key in FILTERS}
+        self.scores = {key: np.zeros(0, dtype=np.float32) for key in RANKINGS}
+        self.heaps = {key: [] for key in RANKINGS}
+        self.epoch = None
+        self.size = 0
+
+    def sync(self):
+        """Index the latest snapshot; returns it (``None`` before the first publish)."""
+        snapshot = self.source.snapshot()
+        if snapshot is None:
+            return None
+        fleet = snapshot.devices
+        with self._lock:
+            if fleet.epoch == self.epoch:
+                return self.snapshot
+            if self.epoch is not None and (fleet.epoch < self.epoch or len(fleet) < self.size):
+                # A restarted writer: epochs went backwards, start over
+                self._reset()
+            self._apply(fleet)
+            self.snapshot = snapshot
+        return snapshot
+
+    def _apply(self, fleet):
+        n = len(fleet)
+        rows = fleet.changed_since(-1 if self.epoch is None else self.epoch)
+        if n > self.size:
+            for key in FILTERS:
+                self.codes[key] = np.concatenate([self.codes[key], np.full(n - self.size, _UNSET, dtype=np.uint8)])
+            for key in RANKINGS:
+                self.scores[key] = np.concatenate([self.scores[key], np.full(n - self.size, np.nan, dtype=np.float32)])
+            for i in range(self.size, n):
+                name = fleet.names[i]
+                self.names.append(name)
+                self.lower_names.append(name.lower())
+                self.by_type[device_type(name) or OTHER_TYPE].add(i)
+            self.size = n
+
+        for key in FILTERS:
+            new = fleet.column(key)[rows]
+            old = self.codes[key][rows]
+            moved = new != old
+            sets = self.by_code[key]
+            for i, before, after in zip(rows[moved].tolist(), old[moved].tolist(), new[moved].tolist()):
+                if before != _UNSET:
+                    sets[before].discard(i)
+                sets[after].add(i)
+            self.codes[key][rows] = new
+
+        for key in RANKINGS:
+            new = fleet.column(key)[rows]
+            # NaN != NaN, so unscored rows count as moved; they are never pushed
+            moved = new != self.scores[key][rows]
+            self.scores[key][rows] = new
+            heap = self.heaps[key]
+            if len(heap) + moved.sum() > self.rebuild_factor * n + 64:
+                scores = self.scores[key][:n].tolist()
+                heap[:] = [(-score, i) for i, score in enumerate(scores) if score == score]
+                heapq.heapify(heap)
+                self.rebuilds += 1
+            else:
+                for i, score in zip(rows[moved].tolist(), new[moved].tolist()):
+                    if score == score:
+                        heapq.heappush(heap, (-score, i))
+        self.epoch = fleet.epoch
+
+    def _candidates(self, filters, kind, search):
+        """Matching row set, or ``None`` for "every row"."""
+        sets = []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            sets.append(self.by_code[key].get(CODES[key].index(value), set()))
+        if kind is not None:
+            sets.append(self.by_type.get(kind, set()))
+        sets.sort(key=len)
+        candidates = set(sets[0]).intersection(*sets[1:]) if sets else None
+        if search:
+            # Substring search has no index; it scans only the rows left after filtering
+            needle = search.lower()
+            rows = candidates if candidates is not None else range(self.size)
+            candidates = {i for i in rows if needle in self.lower_names[i]}
+        return candidates
+
+    def query(self, status=None, vision_status=None, kind=None, search=None, sort=None, offset=0, limit=20):
+        """One page of devices: ``{'total', 'offset', 'rows', 'names', 'snapshot'}``.
+
+        ``sort`` is ``None`` (fleet order) or a ranking column, highest first.
+        ``snapshot`` is the one the index reflected, so rows are valid in it.
+        Raises ValueError for a negative ``offset`` or a ``limit`` below 1.
+        """
+        if offset < 0 or limit < 1:
+            raise ValueError("offset must be at least 0 and limit at least 1")
+        self.sync()
+        with self._lock:
+            candidates = self._candidates({'status': status, 'vision_status': vision_status}, kind, search)
+            total = self.size if candidates is None else len(candidates)
+            if sort is None:
+                if candidates is None:
+                    rows = list(range(min(offset, total), min(offset + limit, total)))
+                else:
+                    rows = sorted(candidates)[offset:offset + limit]
+            else:
+                rows = []
+                seen = set()
+                scores = self.scores[sort]
+                skip = offset
+                for negative, i in _ranked(self.heaps[sort]):
+                    # Stale (superseded) entries and duplicates are skipped
+                    if i in seen or -negative != scores[i] or (candidates is not None and i not in candidates):
+                        continue
+                    seen.add(i)
+                    if skip:
+                        skip -= 1
+                        continue
+                    rows.append(i)
+                    if len(rows) == limit:
+                        break
+            return {'total': total, 'offset': offset, 'rows': rows,
+                    'names': [self.names[i] for i in rows], 'snapshot': self.snapshot}
+
+    def types(self):
+        with self._lock:
+            return sorted(kind for kind, rows in self.by_type.items() if rows)
+
+    # HTTP ------------------------------------------------------------------
+
+    def view(self):
+        args = request.args
+        sort = args.get('sort')
+        if sort is not None and sort not in RANKINGS:
+            return jsonify({'error': f"sort must be one of {list(RANKINGS)}"}), 400
+        try:
+            offset = int(args.get('offset', 0))
+            limit = int(args.get('limit', 20))
+        except ValueError:
+            return jsonify({'error': "offset and limit must be integers"}), 400
+        if offset < 0:
+            return jsonify({'error': "offset must be at least 0"}), 400
+        if not 1 <= limit <= MAX_PAGE:
+            return jsonify({'error': f"limit must be from 1 to {MAX_PAGE}"}), 400
+        try:
+            page = self.query(status=args.get('status'), vision_status=args.get('vision_status'),
+                              kind=args.get('type'), search=args.get('q'), sort=sort,
+                              offset=offset, limit=limit)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        snapshot = page.pop('snapshot')
+        rows = page.pop('rows')
+        page['devices'] = [dict(snapshot.devices.summary(i), name=snapshot.devices.names[i]) for i in rows]
+        return jsonify(page)
+
+    def register(self, server, rule='/devices'):
+        server.add_url_rule(rule, 'device_index', self.view)
+        return self
@@ -0,0 +1,427 @@
+"""Telemetry ingestion: HTTP bulk and UDP listeners feeding batched writes into a DeviceStore."""
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+
+import numpy as np
+from flask import jsonify, request
+
+from monitoring.store import CODES, COLUMNS
+
+# Fields a reading may set (placement is configuration, not telemetry); anything else is ignored
+INGEST_FIELDS = frozenset(key for key in COLUMNS
+                          if key not in ('telemetry', 'vision_feed', 'predicted_maintenance_date', 'room'))
+_CODE_LOOKUP = {key: {value: code for code, value in enumerate(values)} for key, values in CODES.items()}
+# Accepted range of every numeric field; values outside it (or NaN/inf, or bools) are dropped
+RANGES = {'ai_confidence': (0.0, 1.0), 'threat_score': (0.0, 1.0), 'failure_probability': (0.0, 1.0),
+          'health_score': (0, 100)}
+# Longest device name a reading may auto-register
+MAX_NAME = 128
+
+
+def column_value(key, value):
+    """What a reading's ``value`` for ``key`` stores in its column, or None if it is not acceptable.
+
+    Coded fields take one of their code table's values, boolean fields a
+    JSON boolean, and numeric fields a finite number within ``RANGES``
+    (rounded for integer columns).
+    """
+    lookup = _CODE_LOOKUP.get(key)
+    if lookup is not None:
+        return lookup.get(value) if value is None or isinstance(value, str) else None
+    if COLUMNS[key] is np.bool_:
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    low, high = RANGES[key]
+    if not low <= value <= high:
+        return None
+    return round(value) if np.issubdtype(COLUMNS[key], np.integer) else value
+
+
+class RateCounter:
+    """Running total plus a per-second rate over the last ``window`` seconds."""
+
+    def __init__(self, window=10):
+        self.window = window
+        self.total = 0
+        self._buckets = deque()
+
+    def add(self, n, now=None):
+        second = int(now or time.time())
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += n
+        else:
+            self._buckets.append([second, n])
+            while self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+        self.total += n
+
+    def rate(self, now=None):
+        cutoff = int(now or time.time()) - self.window
+        return sum(n for second, n in self._buckets if second > cutoff) / self.window
+
+
+def parse_readings(body):
+    """Decode a JSON array, ``{"readings": [...]}``, a single reading or NDJSON; returns (readings, malformed)."""
+    body = body.strip()
+    payload = None
+    if body[:1] == b'[' or (body[:1] == b'{' and b'\n' not in body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return [], 1
+    elif body[:1] == b'{':
+        # Either an object wrapper spread over several lines or NDJSON
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            pass
+    if payload is not None:
+        if isinstance(payload, dict):
+            payload = payload['readings'] if isinstance(payload.get('readings'), list) else [payload]
+        readings = [r for r in payload if isinstance(r, dict)]
+        return readings, len(payload) - len(readings)
+    readings = []
+    malformed = 0
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            reading = json.loads(line)
+        except ValueError:
+            malformed += 1
+            continue
+        if isinstance(reading, dict):
+            readings.append(reading)
+        else:
+            malformed += 1
+    return readings, malformed
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingestor):
+        self.ingestor = ingestor
+
+    def datagram_received(self, data, addr):
+        readings, malformed = parse_readings(data)
+        self.ingestor.submit(readings, f"udp:{addr[0]}", malformed)
+
+
+class _IngestRoutes:
+    """``/ingest`` and ``/ingest/stats`` routes over ``submit``, ``depth`` and ``stats``."""
+
+    def view(self):
+        readings, malformed = parse_readings(request.get_data())
+        # Keyed by peer address: a client-chosen label would let any sender mint new entries
+        accepted, rejected = self.submit(readings, f"http:{request.remote_addr}", malformed)
+        response = jsonify({'accepted': accepted, 'rejected': rejected, 'malformed': malformed,
+                            'queue_depth': self.depth})
+        if rejected and not accepted:
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+        else:
+            response.status_code = 202
+        return response
+
+    def register(self, server, rule='/ingest'):
+        server.add_url_rule(rule, 'telemetry_ingest', self.view, methods=['POST'])
+        server.add_url_rule(rule + '/stats', 'telemetry_ingest_stats', lambda: jsonify(self.stats()))
+        return self
+
+
+class TelemetryIngestor(_IngestRoutes):
+    """Bounded ingestion queue applied to ``store`` in vectorized batches.
+
+    ``submit`` never blocks: readings beyond ``capacity`` pending entries are
+    rejected and reported back to the sender (HTTP 429) so producers see
+    backpressure instead of unbounded memory growth. A single applier thread
+    takes ``lock`` (the engine lock) once per batch of up to ``batch_size``
+    readings, auto-registering unknown device names up to ``max_registered``
+    new devices; readings for further unknown names are dropped and counted
+    in ``unregistered``. Devices fed this way are flagged ``telemetry`` so
+    the simulator leaves them alone. Field values that fail ``column_value``
+    are dropped and counted in ``invalid``. Per-source counters are keyed by
+    peer address and only the ``max_sources`` most recently seen are kept.
+    """
+
+    def __init__(self, store, lock, capacity=200_000, batch_size=10_000, max_registered=10_000,
+                 max_sources=1024):
+        self.store = store
+        self.lock = lock
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self._pending = deque()
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._udp_loop = None
+        self.max_registered = max_registered
+        self.max_sources = max_sources
+        self.sources = OrderedDict()
+        self.applied = RateCounter()
+        self.batches = 0
+        self.invalid = 0
+        self.registered = 0
+        self.unregistered = 0
+
+    # Producers -------------------------------------------------------------
+
+    def _source(self, source):
+        stats = self.sources.get(source)
+        if stats is None:
+            stats = self.sources[source] = {'received': RateCounter(), 'rejected': 0, 'malformed': 0}
+            if len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+        else:
+            self.sources.move_to_end(source)
+        return stats
+
+    def submit(self, readings, source='local', malformed=0):
+        """Queue ``readings``; returns ``(accepted, rejected)``."""
+        with self._ready:
+            room = max(0, self.capacity - len(self._pending))
+            accepted = readings if len(readings) <= room else readings[:room]
+            self._pending.extend(accepted)
+            stats = self._source(source)
+            stats['received'].add(len(accepted))
+            stats['rejected'] += len(readings) - len(accepted)
+            stats['malformed'] += malformed
+            self._ready.notify()
+        return len(accepted), len(readings) - len(accepted)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    # Applier ---------------------------------------------------------------
+
+    def apply(self, batch):
+        """Write one batch of readings into the store; later readings win per device and field."""
+        store = self.store
+        updates = {}
+        rows = []
+        with self.lock:
+            index = store.index
+            for reading in batch:
+                name = reading.get('device')
+                if not isinstance(name, str):
+                    continue
+                i = index.get(name)
+                if i is None:
+                    if self.registered >= self.max_registered or not 0 < len(name) <= MAX_NAME:
+                        self.unregistered += 1
+                        continue
+                    i = store.add(name, {'telemetry': True})
+                    self.registered += 1
+                rows.append(i)
+                for key, value in reading.items():
+                    if key not in INGEST_FIELDS:
+                        continue
+                    value = column_value(key, value)
+                    if value is None:
+                        self.invalid += 1
+                        continue
+                    update = updates.get(key)
+                    if update is None:
+                        update = updates[key] = ([], [])
+                    update[0].append(i)
+                    update[1].append(value)
+            for key, (idx, values) in updates.items():
+                idx = np.asarray(idx)
+                # Keep only the last reading per device so duplicates resolve deterministically
+                _, first_from_end = np.unique(idx[::-1], return_index=True)
+                keep = len(idx) - 1 - first_from_end
+                store.columns[key][idx[keep]] = np.asarray(values)[keep]
+            rows = np.unique(np.asarray(rows, dtype=np.int64))
+            store.columns['telemetry'][rows] = True
+            store.touch(rows)
+        self.applied.add(len(batch))
+        self.batches += 1
+
+    def drain(self):
+        with self._ready:
+            n = min(len(self._pending), self.batch_size)
+            batch = [self._pending.popleft() for _ in range(n)]
+        if batch:
+            self.apply(batch)
+        return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._ready:
+                self._ready.wait_for(lambda: self._pending or self._stop.is_set(), timeout=1.0)
+            self.drain()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='telemetry-ingest', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._ready:
+            self._ready.notify_all()
+        if self._udp_loop is not None:
+            self._udp_loop.call_soon_threadsafe(self._udp_loop.stop)
+
+    # Transports ------------------------------------------------------------
+
+    def start_udp(self, host='127.0.0.1', port=9999):
+        """Listen for NDJSON datagrams on an asyncio loop in a background thread.
+
+        Raises OSError here, in the caller, if the port cannot be bound.
+        """
+        started = threading.Event()
+        failed = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                transport, _ = loop.run_until_complete(
+                    loop.create_datagram_endpoint(lambda: _UdpProtocol(self), local_addr=(host, port)))
+            except OSError as exc:
+                failed.append(exc)
+                loop.close()
+                started.set()
+                return
+            self._udp_loop = loop
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                transport.close()
+                loop.close()
+
+        threading.Thread(target=run, name='telemetry-udp', daemon=True).start()
+        started.wait(5)
+        if failed:
+            raise failed[0]
+        return self
+
+    def stats(self):
+        now = time.time()
+        return {
+            'queue_depth': self.depth,
+            'capacity': self.capacity,
+            'applied_total': self.applied.total,
+            'applied_per_second': self.applied.rate(now),
+            'batches': self.batches,
+            'invalid_values': self.invalid,
+            'registered_devices': self.registered,
+            'unregistered_readings': self.unregistered,
+            'sources': {source: {'received_total': stats['received'].total,
+                                 'received_per_second': stats['received'].rate(now),
+                                 'rejected': stats['rejected'], 'malformed': stats['malformed']}
+                        for source, stats in list(self.sources.items())},
+        }
+
+
+def datagrams(readings, size=50):
+    """Pack readings into NDJSON datagrams, staying well under MTU-fragmentation limits."""
+    chunk = []
+    for reading in readings:
+        chunk.append(json.dumps(reading))
+        if len(chunk) == size:
+            yield len(chunk), "\n".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield len(chunk), "\n".join(chunk).encode()
+
+
+class TelemetryForwarder(_IngestRoutes):
+    """Ingestion front end for web workers that do not own the device store.
+
+    Readings are relayed as NDJSON datagrams to the UDP listener of the
+    single writer process, which applies them like any other UDP source.
+    Delivery is fire-and-forget, so queue backpressure is not visible here.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.forwarded = RateCounter()
+
+    def submit(self, readings, source='local', malformed=0):
+        for count, datagram in datagrams(readings):
+            self._socket.sendto(datagram, self.address)
+            self.forwarded.add(count)
+        return len(readings), 0
+
+    @property
+    def depth(self):
+        return 0
+
+    def stats(self):
+        return {'forward_to': f"{self.address[0]}:{self.address[1]}",
+                'forwarded_total': self.forwarded.total,
+                'forwarded_per_second': self.forwarded.rate(time.time())}
+
+
+# Local test client -------------------------------------------------------------
+
+def synthetic_readings(count, devices, prefix='Sensor'):
+    for _ in range(count):
+        health = random.randint(50, 99)
+        yield {'device': f"{prefix} {random.randrange(devices):05d}",
+               'status': 'Online' if random.random() < 0.95 else 'Offline',
+               'ai_confidence': round(random.uniform(0.5, 0.99), 3),
+               'threat_score': round(random.uniform(0.0, 0.8), 3),
+               'health_score': health}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send synthetic telemetry to a running dashboard")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--http', help="ingest URL, e.g. http://127.0.0.1:8050/ingest")
+    target.add_argument('--udp', help="host:port of the UDP listener")
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=5000, help="readings per HTTP request")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    sent = rejected = 0
+    readings = synthetic_readings(args.count, args.devices)
+    if args.http:
+        chunk = []
+        while sent < args.count:
+            # Top up with fresh readings behind whatever the server turned away last time
+            chunk += [next(readings) for _ in range(min(args.batch, args.count - sent) - len(chunk))]
+            body = "\n".join(json.dumps(r) for r in chunk).encode()
+            req = urllib.request.Request(args.http, data=body, headers={'Content-Type': 'application/x-ndjson'})
+            try:
+                with urllib.request.urlopen(req) as response:
+                    result = json.load(response)
+            except urllib.error.HTTPError as exc:
+                if exc.code != 429:
+                    raise
+                result = json.load(exc)
+                time.sleep(float(exc.headers.get('Retry-After', 1)))
+            sent += result['accepted']
+            rejected += result['rejected']
+            # The server accepts a prefix of the request; resend the rejected tail
+            chunk = chunk[result['accepted']:]
+    else:
+        host, port = args.udp.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for count, datagram in datagrams(readings):
+            sock.sendto(datagram, (host, int(port)))
+            sent += count
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'sent': sent, 'rejected': rejected, 'seconds': round(elapsed, 3),
+                      'readings_per_second': round(sent / elapsed)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Vectorized log event generation and lazy rendering of log text."""
+import time
+
+import numpy as np
+
+from monitoring.events import TEMPLATES, SEVERITY
+from monitoring.store import SCAN_RESULT, OPTIMIZATION, MAINTENANCE, device_type
+
+# Device-type-specific error messages (error_log code 3)
+ERROR_TYPES = {
+    "Smart Thermostat": "Temp anomaly detected - AI corrected",
+    "Security Camera": "Vision blur detected - AI enhanced",
+    "Smart Lock": "Access violation - AI locked",
+    "Smart Light": "Light flicker - AI stabilized",
+    "Smart Speaker": "Audio distortion - AI fixed",
+    "Smart Fridge": "Door left open - AI alerted",
+    "Smart TV": "Screen glitch - AI resolved",
+    "Smart Doorbell": "False detection - AI filtered",
+    "Smart AC": "Vent blockage - AI cleared",
+    "Smart Washer": "Water overflow - AI stopped"
+}
+DEFAULT_ERROR_TYPE = "Sensor fault - AI corrected"
+
+# Argument code tables for templates that take ``{arg}``
+ARGS = {'scan_log': SCAN_RESULT, 'ai_log': OPTIMIZATION}
+
+_SEVERITY = {kind: np.array(levels, dtype=np.uint8) for kind, levels in SEVERITY.items()}
+
+
+def generate_logs(store, now):
+    """Append one scan, error and AI event to every simulated device that changed this tick.
+
+    Devices whose state did not move since the last snapshot log nothing, so
+    their version (and everything keyed on it) stays put.
+    """
+    rows = store.simulated_rows()
+    rows = rows[store.versions[rows] > store.epoch]
+    n = rows.size
+    rng = store.rng
+    stamp = now.timestamp()
+    c = {key: store.column(key)[rows] for key in ('last_scan', 'anomaly_detected',
+                                                   'maintenance_alert', 'optimization_suggestion')}
+
+    # Scan log: "Vision scan on ..." or "AI analysis complete: <last_scan>"
+    code = rng.integers(0, 2, n)
+    store.logs['scan_log'].append(rows, stamp, code, _SEVERITY['scan_log'][code], c['last_scan'])
+
+    # Error log: ``store.error_rate`` (30% by default) chance of one of three failures,
+    # otherwise "No issues detected"
+    code = np.where(rng.random(n) < store.error_rate, rng.integers(1, 4, n), 0)
+    store.logs['error_log'].append(rows, stamp, code, _SEVERITY['error_log'][code])
+
+    # AI log: pick one of six actions; the last three depend on current device state
+    action = rng.integers(0, 6, n)
+    code = action.copy()
+    code[action == 3] = np.where(c['anomaly_detected'][action == 3], 3, 4)
+    code[action == 4] = np.where(c['maintenance_alert'][action == 4] != MAINTENANCE.index(None), 5, 6)
+    code[action == 5] = np.where(c['optimization_suggestion'][action == 5] != OPTIMIZATION.index(None), 7, 8)
+    store.logs['ai_log'].append(rows, stamp, code, _SEVERITY['ai_log'][code], c['optimization_suggestion'])
+
+
+def render_event(kind, device, event):
+    code = int(event['code'])
+    arg = ARGS[kind][event['arg']] if kind in ARGS else None
+    text = TEMPLATES[kind][code].format(device=device, arg=arg,
+                                        error_type=ERROR_TYPES.get(device_type(device), DEFAULT_ERROR_TYPE))
+    if np.isnan(event['time']):
+        return text
+    return f"[{time.strftime('%H:%M:%S', time.localtime(event['time']))}] {text}"
+
+
+def render_log(kind, device, events):
+    return "\n".join(render_event(kind, device, event) for event in events)
@@ -0,0 +1,248 @@
+"""Prometheus-format metrics with cheap always-on timers and a toggleable sampling profiler."""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+from flask import Response, jsonify, request
+
+# Seconds, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes, 256 B to 16 MiB in powers of four
+SIZE_BUCKETS = tuple(256 * 4 ** k for k in range(9))
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; ``observe`` is a bisect plus three adds under a lock."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                yield f'{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {count}'
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Gauge:
+    """Value read at scrape time from ``read()``; ``None`` omits the sample.
+
+    ``read`` may also return a dict of {label values tuple: value}. Use
+    ``kind='counter'`` for running totals that are kept elsewhere.
+    """
+
+    def __init__(self, name, help, read, labelnames=(), kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.read()
+        if value is None:
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text exposition format.
+
+    Every process keeps its own registry; under multiple workers each worker
+    exposes its own numbers plus an ``iot_process_id`` gauge to tell them apart.
+    """
+
+    def __init__(self, prefix='iot_'):
+        self.prefix = prefix
+        self._metrics = []
+        self.profiler = SamplingProfiler()
+        self.gauge('process_id', "PID of the process serving this scrape", os.getpid)
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._add(Histogram(self.prefix + name, help, buckets, labelnames))
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self.prefix + name, help, labelnames))
+
+    def gauge(self, name, help, read, labelnames=(), kind='gauge'):
+        return self._add(Gauge(self.prefix + name, help, read, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def profile_view(self, action=None):
+        """``/metrics/profile``: folded stacks so far; POST ``/start`` and ``/stop`` toggle sampling."""
+        if action == 'start':
+            self.profiler.start(interval=float(request.args.get('interval', self.profiler.interval)),
+                                include_idle=request.args.get('idle') == '1')
+            return jsonify({'profiling': True, 'interval': self.profiler.interval})
+        if action == 'stop':
+            self.profiler.stop()
+            return jsonify({'profiling': False, 'samples': self.profiler.samples})
+        return Response(self.profiler.folded(), mimetype='text/plain')
+
+    def register(self, server, rule='/metrics'):
+        server.add_url_rule(rule, 'metrics', self.view)
+        server.add_url_rule(rule + '/profile', 'metrics_profile', self.profile_view)
+        # Starting and stopping change state, so only POST (crawlers and prefetchers send GET)
+        server.add_url_rule(rule + '/profile/<any(start, stop):action>', 'metrics_profile_action',
+                            self.profile_view, methods=['POST'])
+        return self
+
+
+# Leaf frames of threads that are just waiting; skipped unless idle samples are asked for
+_IDLE_LEAVES = {('threading.py', 'wait'), ('selectors.py', 'select'), ('socketserver.py', 'serve_forever'),
+                ('queue.py', 'get'), ('base_events.py', '_run_once'), ('socket.py', 'readinto'),
+                ('threading.py', '_wait_for_tstate_lock'), ('selectors.py', 'poll')}
+
+
+class SamplingProfiler:
+    """Off by default; while running, samples every thread's stack every ``interval`` seconds.
+
+    Output is the folded-stack format (``frame;frame;frame count``) read by
+    flamegraph.pl, speedscope and inferno. Sampling happens on its own thread
+    via ``sys._current_frames``, so the profiled code is not instrumented.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.include_idle = False
+        self.samples = 0
+        self._stacks = _Tally()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None, include_idle=False):
+        if self.running:
+            return self
+        self.interval = interval or self.interval
+        self.include_idle = include_idle
+        self._stacks = _Tally()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+                    stack.append(name)
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
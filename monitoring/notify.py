@@ -0,0 +1,280 @@
+"""Bounded, deduplicating notification store and an asyncio dispatch worker pool."""
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime
+
+from monitoring.events import INFO, WARNING, ERROR, CRITICAL
+
+SEVERITY_NAMES = {INFO: 'info', WARNING: 'warning', ERROR: 'error', CRITICAL: 'critical'}
+
+
+class Notification:
+    """One alert; ``count`` grows when repeats are coalesced into it."""
+
+    __slots__ = ('time', 'device', 'severity', 'kind', 'message', 'count', 'last_time')
+
+    def __init__(self, time, device, severity, kind, message):
+        self.time = time
+        self.device = device
+        self.severity = severity
+        self.kind = kind
+        self.message = message
+        self.count = 1
+        self.last_time = time
+
+    def as_dict(self):
+        return {'time': self.time.strftime('%Y-%m-%d %H:%M:%S'), 'device': self.device,
+                'severity': SEVERITY_NAMES.get(self.severity, self.severity), 'kind': self.kind,
+                'message': self.message, 'count': self.count}
+
+
+class NotificationStore:
+    """Keep the most recent ``capacity`` notifications, indexed by device and severity.
+
+    A notification with the same device and kind as one posted less than
+    ``dedup_window`` seconds earlier is folded into it (``count`` += 1) and
+    not returned for dispatch, so a flapping device can't cause an alert
+    storm.
+    """
+
+    def __init__(self, capacity=1000, dedup_window=300):
+        self.capacity = capacity
+        self.dedup_window = dedup_window
+        self._items = deque()
+        self.by_device = {}
+        self.by_severity = {}
+        self._latest = {}
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def post(self, now, device, severity, kind, message):
+        """Record a notification; returns it if it should be dispatched, None if coalesced."""
+        key = (device, kind)
+        with self._lock:
+            latest = self._latest.get(key)
+            if latest is not None and (now - latest.time).total_seconds() < self.dedup_window:
+                latest.count += 1
+                latest.last_time = now
+                self.coalesced += 1
+                return None
+            notification = Notification(now, device, severity, kind, message)
+            self._items.append(notification)
+            self.by_device.setdefault(device, deque()).append(notification)
+            self.by_severity.setdefault(severity, deque()).append(notification)
+            self._latest[key] = notification
+            if len(self._items) > self.capacity:
+                self._evict(self._items.popleft())
+            return notification
+
+    def _evict(self, old):
+        # The evicted entry is the oldest overall, hence also the oldest in each index
+        for index, key in ((self.by_device, old.device), (self.by_severity, old.severity)):
+            entries = index[key]
+            entries.popleft()
+            if not entries:
+                del index[key]
+        if self._latest.get((old.device, old.kind)) is old:
+            del self._latest[(old.device, old.kind)]
+
+    def state(self):
+        """Every retained notification as JSON-ready dicts, oldest first (for checkpoints)."""
+        with self._lock:
+            return [{'time': item.time.isoformat(), 'last_time': item.last_time.isoformat(), 'device': item.device,
+                     'severity': item.severity, 'kind': item.kind, 'message': item.message, 'count': item.count}
+                    for item in self._items]
+
+    def restore(self, items):
+        """Reload notifications saved by ``state``, including the dedup windows they open.
+
+        Every item is decoded before any is added, so a malformed one
+        (ValueError, KeyError or TypeError) leaves the store unchanged.
+        """
+        decoded = []
+        for item in items:
+            notification = Notification(datetime.fromisoformat(item['time']), item['device'], item['severity'],
+                                        item['kind'], item['message'])
+            notification.count = int(item['count'])
+            notification.last_time = datetime.fromisoformat(item['last_time'])
+            decoded.append(notification)
+        for notification in decoded:
+            with self._lock:
+                self._items.append(notification)
+                self.by_device.setdefault(notification.device, deque()).append(notification)
+                self.by_severity.setdefault(notification.severity, deque()).append(notification)
+                self._latest[(notification.device, notification.kind)] = notification
+                if len(self._items) > self.capacity:
+                    self._evict(self._items.popleft())
+
+    def recent(self, limit=20, device=None, severity=None):
+        with self._lock:
+            if device is not None:
+                items = self.by_device.get(device, ())
+            elif severity is not None:
+                items = self.by_severity.get(severity, ())
+            else:
+                items = self._items
+            return list(items)[-limit:]
+
+
+class Channel:
+    """Delivery backend; ``send`` runs on the dispatcher's thread pool and raises on failure."""
+
+    def __init__(self, name, rate=1.0, burst=5):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def send(self, notification):
+        raise NotImplementedError
+
+
+class FileChannel(Channel):
+    """Append each notification as a JSON line, tagged with the channel and target."""
+
+    def __init__(self, name, path, target=None, **limits):
+        super().__init__(name, **limits)
+        self.path = path
+        self.target = target
+
+    def send(self, notification):
+        record = dict(notification.as_dict(), channel=self.name, target=self.target)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class HttpChannel(Channel):
+    """POST each notification as JSON to ``url`` (e.g. a webhook or a local stub)."""
+
+    def __init__(self, name, url, timeout=5.0, **limits):
+        super().__init__(name, **limits)
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification):
+        body = json.dumps(dict(notification.as_dict(), channel=self.name)).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Deliver notifications to every channel from an asyncio worker pool.
+
+    ``submit`` only hands the notification to the event loop thread and
+    never blocks the caller; when ``queue_size`` deliveries are already
+    waiting it is dropped and counted. Each channel has its own token-bucket
+    rate limit, and failed sends are retried ``retries`` times with
+    exponential backoff.
+    """
+
+    def __init__(self, channels, workers=4, queue_size=1000, retries=3, backoff=0.5):
+        self.channels = list(channels)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {channel.name: {'sent': 0, 'failed': 0, 'retried': 0} for channel in self.channels}
+        self.dropped = 0
+        self._limits = {channel.name: _TokenBucket(channel.rate, channel.burst) for channel in self.channels}
+        self._loop = None
+        self._queue = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self.running:
+            return self
+        ready = threading.Event()
+
+        def run():
+            loop = self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._queue = asyncio.Queue(self.queue_size)
+            for n in range(self.workers):
+                loop.create_task(self._worker())
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='notification-dispatch', daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def submit(self, notification):
+        """Queue ``notification`` for delivery; returns False if the dispatcher isn't running."""
+        if not self.running:
+            return False
+        self._loop.call_soon_threadsafe(self._enqueue, notification)
+        return True
+
+    def _enqueue(self, notification):
+        for channel in self.channels:
+            try:
+                self._queue.put_nowait((channel, notification))
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            channel, notification = await self._queue.get()
+            stats = self.stats[channel.name]
+            try:
+                for attempt in range(self.retries + 1):
+                    await self._limits[channel.name].acquire()
+                    try:
+                        await loop.run_in_executor(None, channel.send, notification)
+                    except Exception:
+                        if attempt == self.retries:
+                            stats['failed'] += 1
+                            break
+                        stats['retried'] += 1
+                        await asyncio.sleep(self.backoff * 2 ** attempt)
+                    else:
+                        stats['sent'] += 1
+                        break
+            finally:
+                self._queue.task_done()
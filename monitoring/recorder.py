@@ -0,0 +1,474 @@
+"""Screen recorders: an in-process capture/encode thread pipeline and a segmented
+recorder that runs capture and encode in worker processes over shared memory."""
+import argparse
+import importlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# cv2 and mss are imported where frames are grabbed or encoded, so importing this
+# module (e.g. to launch a SegmentedRecorder from the dashboard) loads neither
+
+
+class MssSource:
+    """Screen grabber for one monitor or an explicit ``region`` dict (left/top/width/height)."""
+
+    def __init__(self, region=None, monitor=1):
+        self.region = region
+        self.monitor = monitor
+        self._sct = None
+
+    def __enter__(self):
+        import mss
+
+        # mss handles are thread-bound, so the source is opened on the capture thread
+        self._sct = mss.mss()
+        self.area = self.region or self._sct.monitors[self.monitor]
+        return self
+
+    def __exit__(self, *exc):
+        self._sct.close()
+
+    @property
+    def size(self):
+        return self.area['width'], self.area['height']
+
+    def grab(self):
+        """BGRA frame as a zero-copy view of the grabbed pixels."""
+        shot = self._sct.grab(self.area)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+
+class ScreenRecorder:
+    """Record a frame source to MP4 at a steady ``fps`` for up to ``duration`` seconds.
+
+    Capture is paced against absolute deadlines (``start + k / fps``) rather
+    than sleeping after each frame, so capture and encode time don't lower
+    the real frame rate. Frames are converted into a fixed pool of
+    preallocated BGR buffers; when the encoder falls behind and no buffer is
+    free the frame is dropped instead of queueing unboundedly. Missed slots
+    are filled by repeating the previous frame so playback keeps wall-clock
+    timing.
+    """
+
+    def __init__(self, output='screen_record.mp4', fps=20, duration=60, region=None, scale=1.0,
+                 queue_size=4, source=None, fourcc='mp4v'):
+        self.output = output
+        self.fps = fps
+        self.duration = duration
+        self.scale = scale
+        self.queue_size = queue_size
+        self.source = source or MssSource(region)
+        self.fourcc = fourcc
+        self._stop = threading.Event()
+        self._threads = []
+        self.error = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.started_at = None
+        self.finished_at = None
+        self.frames_captured = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_encoded = 0
+        self.encode_seconds = 0.0
+        self.encode_max = 0.0
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0.0
+        return {
+            'running': self.running,
+            'elapsed': elapsed,
+            'target_fps': self.fps,
+            'achieved_fps': self.frames_captured / elapsed if elapsed else 0.0,
+            'frames_captured': self.frames_captured,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'encode_latency_avg': self.encode_seconds / self.frames_encoded if self.frames_encoded else 0.0,
+            'encode_latency_max': self.encode_max,
+        }
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._frames = queue.Queue()
+        self._free = queue.Queue()
+        self.error = None
+        self.reset_stats()
+        self._threads = [threading.Thread(target=self._capture, name='recorder-capture', daemon=True)]
+        self._threads[0].start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.join()
+
+    @staticmethod
+    def _frame_size(scale, width, height):
+        if scale == 1.0:
+            return width, height
+        # Even dimensions keep most codecs happy
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+    def _capture(self):
+        import cv2
+
+        try:
+            with self.source as source:
+                width, height = self._frame_size(self.scale, *source.size)
+                for _ in range(self.queue_size + 1):
+                    self._free.put(np.empty((height, width, 3), dtype=np.uint8))
+                scaled = np.empty((height, width, 4), dtype=np.uint8) if (width, height) != source.size else None
+                writer = cv2.VideoWriter(self.output, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+                encoder = threading.Thread(target=self._encode, args=(writer,), name='recorder-encode', daemon=True)
+                self._threads.append(encoder)
+                encoder.start()
+
+                interval = 1.0 / self.fps
+                self.started_at = time.monotonic()
+                slot = 0
+                while not self._stop.is_set():
+                    now = time.monotonic()
+                    if now - self.started_at >= self.duration:
+                        break
+                    deadline = self.started_at + slot * interval
+                    if deadline > now:
+                        self._stop.wait(deadline - now)
+                        continue
+                    # Skip slots whose deadline already passed; the encoder repeats a frame for them
+                    late = int((now - deadline) / interval)
+                    self.frames_dropped += late
+                    slot += late
+
+                    frame = source.grab()
+                    try:
+                        buffer = self._free.get_nowait()
+                    except queue.Empty:
+                        self.frames_dropped += 1
+                        slot += 1
+                        continue
+                    if scaled is not None:
+                        cv2.resize(frame, (width, height), dst=scaled, interpolation=cv2.INTER_AREA)
+                        frame = scaled
+                    cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=buffer)
+                    self.frames_captured += 1
+                    self._frames.put((slot, buffer))
+                    slot += 1
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self._frames.put(None)
+
+    def _encode(self, writer):
+        last = None
+        written = -1
+        try:
+            while True:
+                item = self._frames.get()
+                if item is None:
+                    break
+                slot, buffer = item
+                started = time.perf_counter()
+                # Hold the previous frame through any skipped slots
+                while last is not None and written < slot - 1:
+                    writer.write(last)
+                    written += 1
+                writer.write(buffer)
+                written = slot
+                latency = time.perf_counter() - started
+                self.frames_encoded += 1
+                self.encode_seconds += latency
+                self.encode_max = max(self.encode_max, latency)
+                self.frames_written = written + 1
+                if last is not None:
+                    self._free.put(last)
+                last = buffer
+        finally:
+            writer.release()
+            self.finished_at = time.monotonic()
+
+
+# Shared counters published by the recording worker processes
+STAT_FIELDS = ('started_at', 'finished_at', 'frames_captured', 'frames_dropped', 'frames_written',
+               'frames_encoded', 'encode_seconds', 'segments')
+STARTED_AT, FINISHED_AT, CAPTURED, DROPPED, WRITTEN, ENCODED, ENCODE_SECONDS, SEGMENTS = range(len(STAT_FIELDS))
+
+
+def _open_counters(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # The dashboard owns this block; keep the worker's resource tracker from unlinking it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm, np.ndarray(len(STAT_FIELDS), dtype=np.float64, buffer=shm.buf)
+
+
+def _load_source(spec, region):
+    """``module:attr`` factory for a frame source, or the screen (optionally a region)."""
+    if not spec:
+        return MssSource(region)
+    module, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module), attr)()
+
+
+def capture_worker(source, fps, duration, scale, slots, output_dir, prefix, segment_seconds, fourcc,
+                   stop, stats_name):
+    import cv2
+
+    ctx = mp.get_context('spawn')
+    free, ready = ctx.Queue(), ctx.Queue()
+    stats, counters = _open_counters(stats_name)
+    with source:
+        width, height = ScreenRecorder._frame_size(scale, *source.size)
+        shape = (slots, height, width, 3)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        try:
+            frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            for slot in range(slots):
+                free.put(slot)
+            encoder = ctx.Process(target=encode_worker, name='recorder-encode',
+                                  args=(shm.name, shape, fps, output_dir, prefix, segment_seconds, fourcc,
+                                        free, ready, stats_name))
+            encoder.start()
+            scaled = np.empty((height, width, 4), dtype=np.uint8) if (width, height) != source.size else None
+            interval = 1.0 / fps
+            started = time.monotonic()
+            counters[STARTED_AT] = time.time()
+            index = 0
+            while not stop.is_set():
+                now = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+                deadline = started + index * interval
+                if deadline > now:
+                    stop.wait(deadline - now)
+                    continue
+                late = int((now - deadline) / interval)
+                counters[DROPPED] += late
+                index += late
+
+                frame = source.grab()
+                try:
+                    slot = free.get_nowait()
+                except queue.Empty:
+                    counters[DROPPED] += 1
+                    index += 1
+                    continue
+                if scaled is not None:
+                    cv2.resize(frame, (width, height), dst=scaled, interpolation=cv2.INTER_AREA)
+                    frame = scaled
+                cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=frames[slot])
+                counters[CAPTURED] += 1
+                # Only the slot number crosses the process boundary, never pixels
+                ready.put((slot, index))
+                index += 1
+            ready.put(None)
+            encoder.join()
+            counters[FINISHED_AT] = time.time()
+            del frames, counters
+        finally:
+            shm.close()
+            shm.unlink()
+            stats.close()
+
+
+def encode_worker(name, shape, fps, output_dir, prefix, segment_seconds, fourcc, free, ready, stats_name):
+    import cv2
+
+    # Spawned children share the creator's resource tracker, which unlinks on its behalf
+    shm = shared_memory.SharedMemory(name=name)
+    stats, counters = _open_counters(stats_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    size = (shape[2], shape[1])
+    per_segment = max(1, int(round(segment_seconds * fps)))
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    writer = None
+    last = None
+    written = -1
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            slot, index = item
+            started = time.perf_counter()
+            while written < index:
+                # Roll over to a new fixed-length segment file
+                if (written + 1) % per_segment == 0:
+                    if writer is not None:
+                        writer.release()
+                    segment = (written + 1) // per_segment
+                    path = os.path.join(output_dir, f"{prefix}_{stamp}_{segment:04d}.mp4")
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+                    counters[SEGMENTS] = segment + 1
+                # Frames for skipped slots repeat the previous one
+                writer.write(frames[slot] if written + 1 == index or last is None else frames[last])
+                written += 1
+            latency = time.perf_counter() - started
+            counters[WRITTEN] = written + 1
+            counters[ENCODED] += 1
+            counters[ENCODE_SECONDS] += latency
+            if last is not None:
+                free.put(last)
+            last = slot
+    finally:
+        if writer is not None:
+            writer.release()
+        del frames, counters
+        shm.close()
+        stats.close()
+
+
+class SegmentedRecorder:
+    """Record in worker processes, as rolling ``segment_seconds``-long MP4 files.
+
+    Capture runs in a separate ``python -m monitoring.recorder`` process
+    that owns a ``SharedMemory`` ring of ``slots`` BGR frames; a second
+    process encodes from those slots. Only slot numbers travel over the
+    queues, so the dashboard process does no pixel work and never contends
+    for the GIL with the recorder. The worker is a plain interpreter rather
+    than a multiprocessing child so it doesn't re-import the dashboard.
+    Counters live in a small shared block the dashboard reads directly;
+    pacing and dropped-frame accounting match ``ScreenRecorder``. The
+    worker watches a pipe from the dashboard and finishes the recording
+    when it closes, so a dashboard that exits or crashes never leaves a
+    recorder writing segments behind it.
+
+    ``source`` is an optional ``module:attr`` frame-source factory, used
+    instead of grabbing the screen.
+    """
+
+    def __init__(self, output_dir='recordings', prefix='screen', segment_seconds=10, fps=20, duration=None,
+                 region=None, scale=1.0, slots=6, source=None, fourcc='mp4v'):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.segment_seconds = segment_seconds
+        self.fps = fps
+        self.duration = duration
+        self.region = region
+        self.scale = scale
+        self.slots = slots
+        self.source = source
+        self.fourcc = fourcc
+        self._stats = shared_memory.SharedMemory(create=True, size=8 * len(STAT_FIELDS))
+        self._counters = np.ndarray(len(STAT_FIELDS), dtype=np.float64, buffer=self._stats.buf)
+        self._process = None
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        if self.running:
+            return self
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._counters[:] = 0.0
+        args = [sys.executable, '-m', 'monitoring.recorder', '--stats', self._stats.name,
+                '--output-dir', self.output_dir, '--prefix', self.prefix,
+                '--segment-seconds', str(self.segment_seconds), '--fps', str(self.fps),
+                '--scale', str(self.scale), '--slots', str(self.slots), '--fourcc', self.fourcc]
+        if self.duration is not None:
+            args += ['--duration', str(self.duration)]
+        if self.region:
+            args += ['--region', json.dumps(self.region)]
+        if self.source:
+            args += ['--source', self.source]
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        # Nothing is ever written to the pipe; the worker only waits for it to close
+        self._process = subprocess.Popen(args, env=env, stdin=subprocess.PIPE)
+        return self
+
+    def stop(self):
+        if self.running:
+            self._process.terminate()
+
+    def join(self, timeout=None):
+        if self._process is not None:
+            self._process.wait(timeout)
+
+    def close(self):
+        """Stop the worker and release the shared counters block."""
+        self.stop()
+        self.join()
+        if self._process is not None:
+            self._process.stdin.close()
+        del self._counters
+        self._stats.close()
+        self._stats.unlink()
+
+    def stats(self):
+        counters = dict(zip(STAT_FIELDS, self._counters.tolist()))
+        elapsed = ((counters['finished_at'] or time.time()) - counters['started_at']) if counters['started_at'] else 0.0
+        encoded = counters['frames_encoded']
+        return {
+            'running': self.running,
+            'elapsed': elapsed,
+            'target_fps': self.fps,
+            'achieved_fps': counters['frames_captured'] / elapsed if elapsed else 0.0,
+            'frames_captured': int(counters['frames_captured']),
+            'frames_written': int(counters['frames_written']),
+            'frames_dropped': int(counters['frames_dropped']),
+            'encode_latency_avg': counters['encode_seconds'] / encoded if encoded else 0.0,
+            'segments': int(counters['segments']),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segmented screen recording worker")
+    parser.add_argument('--stats', required=True, help="name of the shared counters block")
+    parser.add_argument('--output-dir', default='recordings')
+    parser.add_argument('--prefix', default='screen')
+    parser.add_argument('--segment-seconds', type=float, default=10)
+    parser.add_argument('--fps', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=None)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--slots', type=int, default=6)
+    parser.add_argument('--fourcc', default='mp4v')
+    parser.add_argument('--region', type=json.loads, default=None)
+    parser.add_argument('--source', default=None)
+    args = parser.parse_args(argv)
+
+    # SIGTERM from the dashboard ends the recording cleanly, and so does the dashboard going away:
+    # its end of the stdin pipe closes however it exits
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    def watch_parent():
+        # Raw reads on fd 0: a daemon thread parked in the buffered sys.stdin reader
+        # aborts interpreter shutdown
+        try:
+            while os.read(0, 4096):
+                pass
+        except OSError:
+            pass
+        stop.set()
+
+    threading.Thread(target=watch_parent, name='recorder-parent', daemon=True).start()
+    capture_worker(_load_source(args.source, args.region), args.fps, args.duration, args.scale, args.slots,
+                   args.output_dir, args.prefix, args.segment_seconds, args.fourcc, stop, args.stats)
+
+
+if __name__ == '__main__':
+    main()
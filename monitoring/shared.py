@@ -0,0 +1,178 @@
+"""Share published fleet snapshots across processes through one memory-mapped segment."""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from monitoring.codec import decode_snapshot, encode_snapshot
+
+MAGIC = b'IOTFLEET'
+# magic, sequence, active buffer, buffer size, length of buffer 0 and 1
+_HEADER = struct.Struct('<8sQQQQQ')
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 8
+HEADER_SIZE = 64
+DEFAULT_SIZE = 64 * 1024 * 1024
+
+
+def default_path(tag=None):
+    """A path on tmpfs when available so the segment never touches disk."""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, f'iot-fleet-{tag or os.getpid()}')
+
+
+class SharedSnapshotWriter:
+    """Single writer publishing encoded snapshots into a double-buffered segment.
+
+    The segment holds a header and two buffers. Each publish makes the
+    sequence odd, encodes into the buffer readers are *not* using, flips
+    ``active`` and makes the sequence even again. Readers keep a copy only if
+    the sequence was even and unchanged across it, so they never block the
+    writer and the writer never waits for readers.
+    """
+
+    def __init__(self, path=None, size=DEFAULT_SIZE):
+        self.path = path or default_path()
+        self.size = size
+        self.buffer_size = (size - HEADER_SIZE) // 2
+        self.published = 0
+        self.oversized = 0
+        # Size a fresh file and rename it into place: readers still mapping a
+        # previous segment at this path keep their inode instead of faulting
+        partial = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(partial, os.O_CREAT | os.O_RDWR | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._seq = 0
+        self._active = 0
+        self._lengths = [0, 0]
+        self._write_header()
+        os.replace(partial, self.path)
+
+    def _write_header(self):
+        self._map[:_HEADER.size] = _HEADER.pack(
+            MAGIC, self._seq, self._active, self.buffer_size, *self._lengths)
+
+    def publish(self, snapshot):
+        data = encode_snapshot(snapshot)
+        if len(data) > self.buffer_size:
+            # Keep serving the previous snapshot rather than a torn one
+            self.oversized += 1
+            return False
+        # Odd before touching either buffer: a reader lapped by two publishes
+        # would otherwise copy the buffer being rewritten under an even sequence
+        self._seq += 1
+        _SEQ.pack_into(self._map, _SEQ_OFFSET, self._seq)
+        target = 1 - self._active
+        start = HEADER_SIZE + target * self.buffer_size
+        self._map[start:start + len(data)] = data
+        self._lengths[target] = len(data)
+        self._active = target
+        self._write_header()
+        self._seq += 1
+        _SEQ.pack_into(self._map, _SEQ_OFFSET, self._seq)
+        self.published += 1
+        return True
+
+    def attach(self, engine):
+        """Mirror every snapshot ``engine`` publishes, starting with the current one."""
+        if engine.snapshot() is not None:
+            self.publish(engine.snapshot())
+        engine.subscribe(self.publish)
+        return self
+
+    def close(self, unlink=True):
+        self._map.close()
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SharedSnapshotReader:
+    """Lock-free reader with the engine's read interface (``snapshot``, ``wait_for``).
+
+    ``snapshot()`` only reads the 8-byte sequence when nothing changed; a new
+    sequence costs one copy of the active buffer plus an in-place decode.
+    A copy is discarded and retried unless the sequence was even before it
+    and unchanged after it. The decoded snapshot is cached under a lock, as
+    callback threads share one reader.
+    """
+
+    def __init__(self, path, poll=0.05, retries=100):
+        self.path = path
+        self.poll = poll
+        self.retries = retries
+        self.retried = 0
+        self._map = None
+        self._seq = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self._map = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            self._map = None
+            raise ValueError(f"{self.path} is not a shared fleet segment")
+
+    def _sequence(self):
+        return _SEQ.unpack_from(self._map, _SEQ_OFFSET)[0]
+
+    def snapshot(self):
+        with self._lock:
+            return self._read()
+
+    def _read(self):
+        if self._map is None:
+            try:
+                self._open()
+            except FileNotFoundError:
+                # Writer not up yet
+                return None
+        for _ in range(self.retries):
+            first = self._sequence()
+            if first == self._seq:
+                return self._snapshot
+            if first & 1:
+                # Writer is mid-publish
+                time.sleep(0.001)
+                continue
+            _, _, active, buffer_size, *lengths = _HEADER.unpack_from(self._map, 0)
+            if not lengths[active]:
+                return None
+            start = HEADER_SIZE + active * buffer_size
+            data = self._map[start:start + lengths[active]]
+            if self._sequence() == first:
+                self._seq = first
+                self._snapshot = decode_snapshot(data)
+                return self._snapshot
+            self.retried += 1
+        return self._snapshot
+
+    def wait_for(self, version, timeout=None):
+        """Poll until a snapshot newer than ``version`` is published, return the latest."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.snapshot()
+            if snapshot is not None and snapshot.version > version:
+                return snapshot
+            if deadline is not None and time.monotonic() >= deadline:
+                return snapshot
+            time.sleep(self.poll)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
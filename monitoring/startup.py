@@ -0,0 +1,106 @@
+"""Cold-start report: dashboard import time, slowest imports and resident memory per worker."""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so every measurement is a true cold start
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import serve
+serve.load_dashboard()
+{extra}
+elapsed = time.perf_counter() - started
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss_kb(),
+                  'loaded': [m for m in {watch!r} if m in sys.modules]}}))
+'''
+
+# Heavy optional modules whose presence after startup is worth flagging
+WATCH = ('cv2', 'mss', 'plotly.graph_objects', 'IPython', 'monitoring.recorder')
+
+# Loading these as well shows what the first recording request adds on top
+WITH_RECORDING = 'import cv2, mss, monitoring.recorder'
+
+
+def parse_importtime(stderr):
+    """``-X importtime`` lines -> list of (module, self_us, cumulative_us, depth)."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure(recording=False):
+    code = CHILD.format(root=HERE, extra=WITH_RECORDING if recording else '', watch=WATCH)
+    env = dict(os.environ, IOT_ROLE=os.environ.get('IOT_ROLE', 'worker'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run['imports'] = parse_importtime(result.stderr)
+    return run
+
+
+def report(runs=3, top=15, recording=False):
+    samples = [measure(recording) for _ in range(runs)]
+    # Slowest imports from the fastest run, which has the least OS noise
+    best = min(samples, key=lambda run: run['seconds'])
+    top_level = [entry for entry in best['imports'] if entry[3] <= 1]
+    slowest = sorted(top_level, key=lambda entry: entry[2], reverse=True)[:top]
+    return {
+        'runs': runs,
+        'recording_loaded': recording,
+        'seconds_min': round(best['seconds'], 4),
+        'seconds_median': round(statistics.median(run['seconds'] for run in samples), 4),
+        'rss_mb': round(statistics.median(run['rss_kb'] for run in samples) / 1024, 1),
+        'modules_imported': len(best['imports']),
+        'heavy_modules_loaded': best['loaded'],
+        'slowest_imports_ms': [{'module': name, 'cumulative': round(cumulative / 1000, 2),
+                                'self': round(self_us / 1000, 2)}
+                               for name, self_us, cumulative, _ in slowest],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure dashboard cold-start time and per-worker memory")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help="number of slowest top-level imports to list")
+    parser.add_argument('--with-recording', action='store_true',
+                        help="also import the recording stack, as after the first recording request")
+    parser.add_argument('--json', action='store_true', help="print the raw JSON report")
+    args = parser.parse_args(argv)
+
+    result = report(args.runs, args.top, args.with_recording)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"cold start: {result['seconds_min'] * 1000:.0f} ms min, {result['seconds_median'] * 1000:.0f} ms median "
+          f"over {result['runs']} runs; RSS {result['rss_mb']} MB; {result['modules_imported']} modules")
+    print(f"heavy modules loaded: {', '.join(result['heavy_modules_loaded']) or 'none'}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for entry in result['slowest_imports_ms']:
+        print(f"{entry['cumulative']:>14.1f} {entry['self']:>9.1f}  {entry['module']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""Columnar (structure-of-arrays) device state with vectorized per-tick updates."""
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime
+
+import numpy as np
+
+from monitoring.events import EventRing, seed_event
+
+# Code tables for the uint8-coded columns; index 0 is the default value
+STATUS = ('Online', 'Offline')
+VISION_STATUS = ('Active', 'Degraded', 'Offline')
+SCAN_RESULT = ('Clean', 'Threat Detected')
+MAINTENANCE = (None, 'Schedule service')
+OPTIMIZATION = (None, 'Increase scan frequency', 'Adjust AI threshold')
+
+# Known device types; fleet members are named after their type (optionally with a suffix)
+DEVICE_TYPES = ('Smart Thermostat', 'Security Camera', 'Smart Lock', 'Smart Light', 'Smart Speaker',
+                'Smart Fridge', 'Smart TV', 'Smart Doorbell', 'Smart AC', 'Smart Washer')
+
+ONLINE, OFFLINE = 0, 1
+VISION_ACTIVE, VISION_DEGRADED, VISION_OFFLINE = 0, 1, 2
+
+COLUMNS = {
+    'status': np.uint8,
+    'ai_shield': np.bool_,
+    'vision_status': np.uint8,
+    'last_scan': np.uint8,
+    'ai_confidence': np.float32,
+    'threat_score': np.float32,
+    'health_score': np.int16,
+    'anomaly_detected': np.bool_,
+    'maintenance_alert': np.uint8,
+    'optimization_suggestion': np.uint8,
+    'failure_probability': np.float32,
+    # Epoch seconds, NaN when no maintenance is predicted
+    'predicted_maintenance_date': np.float64,
+    # Fed by live telemetry; the simulator leaves these rows alone
+    'telemetry': np.bool_,
+    # Vision fields come from camera frames (monitoring.vision); the simulator leaves those alone
+    'vision_feed': np.bool_,
+    # Leaf of the site > building > room layout (see monitoring.hierarchy)
+    'room': np.uint32,
+}
+CODES = {
+    'status': STATUS,
+    'vision_status': VISION_STATUS,
+    'last_scan': SCAN_RESULT,
+    'maintenance_alert': MAINTENANCE,
+    'optimization_suggestion': OPTIMIZATION,
+}
+LOGS = ('scan_log', 'error_log', 'ai_log')
+FIELDS = tuple(COLUMNS) + LOGS
+
+DEFAULTS = {'ai_shield': True, 'ai_confidence': 0.9, 'health_score': 90,
+            'predicted_maintenance_date': np.nan}
+
+
+def device_type(name):
+    """Known type a device name belongs to ("Security Camera 0042" -> "Security Camera"), else None."""
+    for kind in DEVICE_TYPES:
+        if name == kind or name.startswith(kind + ' '):
+            return kind
+    return None
+
+
+def _decode(key, raw):
+    if key in CODES:
+        return CODES[key][raw]
+    if key == 'predicted_maintenance_date':
+        return None if np.isnan(raw) else datetime.fromtimestamp(raw).strftime('%Y-%m-%d %H:%M')
+    return raw.item()
+
+
+def _encode(key, value):
+    if key in CODES:
+        return CODES[key].index(value)
+    if key == 'predicted_maintenance_date':
+        if value is None or value == 'N/A':
+            return np.nan
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            value = datetime.strptime(value, '%Y-%m-%d %H:%M')
+        return value.timestamp()
+    return value
+
+
+class _ColumnarFleet(Mapping):
+    """Name -> record mapping over a set of equally sized columns."""
+
+    def __init__(self, names, index, columns, logs, versions, epoch=0):
+        self.names = names
+        self.index = index
+        self.columns = columns
+        self.logs = logs
+        # Per-device state version: the epoch of the first snapshot that
+        # includes the row's latest change. Readers that have shown epoch E
+        # only need to re-render rows with a version above E.
+        self.versions = versions
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        return self._record(self.index[name])
+
+    def get_field(self, i, key):
+        if key in self.logs:
+            return self.logs[key].latest(i)
+        return _decode(key, self.columns[key][i])
+
+    def column(self, key):
+        """Live column trimmed to the current fleet size."""
+        return self.columns[key][:len(self.names)]
+
+    def summary(self, i):
+        """JSON-ready scalar fields of row ``i`` (no logs)."""
+        summary = {key: self.get_field(i, key) for key in COLUMNS}
+        for key in ('ai_confidence', 'threat_score', 'failure_probability'):
+            summary[key] = round(summary[key], 3)
+        return summary
+
+    def changed_since(self, epoch):
+        """Row indices whose latest change is newer than ``epoch``."""
+        return np.flatnonzero(self.versions[:len(self.names)] > epoch)
+
+    def error_rates(self):
+        """Share of retained error_log events at WARNING or worse, per device."""
+        ring = self.logs['error_log']
+        return ring.flagged[:len(self.names)] / ring.capacity
+
+
+class DeviceRecord(Mapping):
+    """Dict-style, read-only view of one device row."""
+
+    __slots__ = ('_fleet', '_i')
+
+    def __init__(self, fleet, i):
+        self._fleet = fleet
+        self._i = i
+
+    @property
+    def fleet(self):
+        return self._fleet
+
+    @property
+    def row(self):
+        return self._i
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return self._fleet.get_field(self._i, key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+
+class DeviceView(DeviceRecord, MutableMapping):
+    """Writable dict-style view of one row of a ``DeviceStore``."""
+
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        self._fleet.set_field(self._i, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("device fields cannot be deleted")
+
+
+class FleetSnapshot(_ColumnarFleet):
+    """Frozen copy of a ``DeviceStore``; columns are read-only arrays."""
+
+    def _record(self, i):
+        return DeviceRecord(self, i)
+
+
+class DeviceStore(_ColumnarFleet):
+    """Structure-of-arrays device state with a name -> row index map.
+
+    Scalar fields live in typed NumPy columns so per-tick transitions run as
+    whole-fleet array operations; ``store[name]`` still returns a dict-like
+    view for code that works one device at a time.
+    """
+
+    def __init__(self, capacity=16, log_capacity=5, seed=None, change_rate=0.25, error_rate=0.3):
+        columns = {key: np.zeros(capacity, dtype=dtype) for key, dtype in COLUMNS.items()}
+        columns['predicted_maintenance_date'].fill(np.nan)
+        logs = {key: EventRing(log_capacity, capacity) for key in LOGS}
+        super().__init__([], {}, columns, logs, np.zeros(capacity, dtype=np.uint32))
+        self.log_capacity = log_capacity
+        self.rng = np.random.default_rng(seed)
+        # Simulation rates: share of shielded devices changing state per tick and
+        # the chance a generated error_log event is a failure
+        self.change_rate = change_rate
+        self.error_rate = error_rate
+
+    @classmethod
+    def from_records(cls, records, log_capacity=5, seed=None):
+        store = cls(capacity=max(16, len(records)), log_capacity=log_capacity, seed=seed)
+        for name, record in records.items():
+            store.add(name, record)
+        return store
+
+    @classmethod
+    def from_snapshot(cls, fleet, **options):
+        """Writable store holding a copy of ``fleet``, e.g. one restored from a checkpoint.
+
+        Columns missing from ``fleet`` take their defaults and unknown ones
+        are dropped; ``options`` go to the constructor.
+        """
+        n = len(fleet)
+        store = cls(capacity=max(16, n), log_capacity=fleet.logs['error_log'].capacity, **options)
+        store.names = list(fleet.names)
+        store.index = {name: i for i, name in enumerate(store.names)}
+        for key, column in store.columns.items():
+            if key in fleet.columns:
+                column[:n] = fleet.columns[key]
+            else:
+                column[:n] = _encode(key, DEFAULTS[key]) if key in DEFAULTS else 0
+        for log, ring in store.logs.items():
+            for name in EventRing.ARRAYS:
+                getattr(ring, name)[:n] = getattr(fleet.logs[log], name)
+        store.versions[:n] = fleet.versions
+        store.epoch = fleet.epoch
+        return store
+
+    @property
+    def capacity(self):
+        return len(self.columns['status'])
+
+    def _grow(self, capacity):
+        for key, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            if key == 'predicted_maintenance_date':
+                grown.fill(np.nan)
+            grown[:len(column)] = column
+            self.columns[key] = grown
+        for ring in self.logs.values():
+            ring.grow(capacity)
+        versions = np.zeros(capacity, dtype=self.versions.dtype)
+        versions[:len(self.versions)] = self.versions
+        self.versions = versions
+
+    def add(self, name, record=None):
+        """Register a device and return its row index (existing rows are reused)."""
+        if name in self.index:
+            return self.index[name]
+        i = len(self.names)
+        if i == self.capacity:
+            self._grow(self.capacity * 2)
+        self.names.append(name)
+        self.index[name] = i
+        values = dict(DEFAULTS)
+        values.update(record or {})
+        for key, value in values.items():
+            self.set_field(i, key, value)
+        return i
+
+    def extend(self, names, columns=None):
+        """Register many new devices at once from whole column arrays; returns their rows.
+
+        Columns not given take their defaults. Names must not already exist.
+        """
+        start = len(self.names)
+        stop = start + len(names)
+        capacity = max(self.capacity, 1)
+        while capacity < stop:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._grow(capacity)
+        self.names.extend(names)
+        self.index.update((name, start + i) for i, name in enumerate(names))
+        rows = np.arange(start, stop)
+        columns = columns or {}
+        for key, column in self.columns.items():
+            if key in columns:
+                column[rows] = columns[key]
+            else:
+                # Index 0 is the default of every code table
+                column[rows] = _encode(key, DEFAULTS[key]) if key in DEFAULTS else 0
+        self.touch(rows)
+        return rows
+
+    def set_field(self, i, key, value):
+        if key in self.logs:
+            # Accepts events or the untimestamped literal seed lines
+            ring = self.logs[key]
+            ring.clear(i)
+            for event in value:
+                if isinstance(event, str):
+                    event = seed_event(key, event, i)
+                ring.append(np.array([i]), event['time'], event['code'], event['severity'], event['arg'])
+        elif key in self.columns:
+            self.columns[key][i] = _encode(key, value)
+        else:
+            raise KeyError(key)
+        self.versions[i] = self.epoch + 1
+
+    def assign(self, rows, values):
+        """Set each ``{field: value}`` on every row in ``rows`` and mark them changed."""
+        for key, value in values.items():
+            self.columns[key][rows] = _encode(key, value)
+        self.touch(rows)
+
+    def touch(self, rows=None):
+        """Mark ``rows`` (default: every device) as changed since the last snapshot."""
+        if rows is None:
+            rows = slice(0, len(self.names))
+        self.versions[rows] = self.epoch + 1
+
+    def _record(self, i):
+        return DeviceView(self, i)
+
+    def simulated_rows(self):
+        return np.flatnonzero(~self.column('telemetry'))
+
+    def step(self, now):
+        """Run one tick of simulated status, vision, confidence, threat and health transitions.
+
+        Anomaly flags and failure predictions are derived from these by
+        ``monitoring.analytics.StreamingAnalytics``.
+        """
+        n = len(self.names)
+        rng = self.rng
+        c = {key: column[:n] for key, column in self.columns.items()}
+        simulated = ~c['telemetry']
+
+        # By default roughly a quarter of shielded devices change state each tick
+        rows = np.flatnonzero((rng.random(n) < self.change_rate) & c['ai_shield'] & simulated)
+        if rows.size:
+            k = rows.size
+            status = rng.integers(0, 2, k, dtype=np.uint8)
+            vision = np.where(status == ONLINE, rng.integers(0, 2, k), VISION_OFFLINE).astype(np.uint8)
+            # Scanned cameras keep their measured vision status, threat score and verdict
+            scanned = c['vision_feed'][rows]
+            vision[scanned] = c['vision_status'][rows[scanned]]
+            active = vision == VISION_ACTIVE
+            degraded = vision == VISION_DEGRADED
+            threat = np.where(degraded, rng.uniform(0.05, 0.8, k), rng.uniform(0.05, 0.3, k))
+            health = np.where(active, rng.integers(70, 96, k), rng.integers(50, 81, k))
+            optimize = np.where(rng.random(k) < 0.3, rng.integers(0, len(OPTIMIZATION), k), 0)
+
+            c['status'][rows] = status
+            c['vision_status'][rows] = vision
+            c['ai_confidence'][rows] = np.where(active, rng.uniform(0.7, 0.99, k), rng.uniform(0.5, 0.7, k))
+            c['threat_score'][rows] = np.where(scanned, c['threat_score'][rows], threat)
+            c['health_score'][rows] = health
+            c['maintenance_alert'][rows] = health < 70
+            c['optimization_suggestion'][rows] = optimize
+            c['last_scan'][rows[degraded & ~scanned]] = SCAN_RESULT.index('Threat Detected')
+            self.touch(rows)
+
+    def freeze(self):
+        """Copy the live columns into an immutable ``FleetSnapshot``."""
+        n = len(self.names)
+        columns = {}
+        for key, column in self.columns.items():
+            frozen = column[:n].copy()
+            frozen.flags.writeable = False
+            columns[key] = frozen
+        logs = {key: ring.copy(n) for key, ring in self.logs.items()}
+        versions = self.versions[:n].copy()
+        versions.flags.writeable = False
+        self.epoch += 1
+        return FleetSnapshot(tuple(self.names), dict(self.index), columns, logs, versions, self.epoch)
@@ -0,0 +1,54 @@
+"""Server-Sent Events transport that pushes engine snapshots to dashboards."""
+import json
+import threading
+
+from flask import Response, stream_with_context
+
+
+def snapshot_notice(snapshot):
+    """The few bytes a dashboard needs to know a newer snapshot exists; it fetches what it shows."""
+    return {'version': snapshot.version, 'epoch': snapshot.devices.epoch, 'size': len(snapshot.devices)}
+
+
+class SnapshotStream:
+    """Tell browsers about engine snapshots as they are published.
+
+    Each client blocks on the engine until a newer snapshot exists and is then
+    sent a notice of its version and fleet epoch, never device data: the
+    dashboard's callbacks read the page of devices and rollups they show from
+    the snapshot itself. A client that falls behind skips straight to the
+    latest snapshot (coalescing) rather than queueing every intermediate one,
+    and idle clients cost one sleeping thread plus a heartbeat comment every
+    ``heartbeat`` seconds.
+    """
+
+    def __init__(self, engine, heartbeat=15.0):
+        self.engine = engine
+        self.heartbeat = heartbeat
+        self.clients = 0
+        self._lock = threading.Lock()
+
+    def events(self):
+        with self._lock:
+            self.clients += 1
+        try:
+            version = -1
+            while True:
+                snapshot = self.engine.wait_for(version, timeout=self.heartbeat)
+                if snapshot is None or snapshot.version <= version:
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(snapshot_notice(snapshot))
+                version = snapshot.version
+                yield f"id: {version}\nevent: snapshot\ndata: {data}\n\n"
+        finally:
+            with self._lock:
+                self.clients -= 1
+
+    def view(self):
+        return Response(stream_with_context(self.events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def register(self, server, rule='/stream'):
+        server.add_url_rule(rule, 'snapshot_stream', self.view)
+        return self
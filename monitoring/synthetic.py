@@ -0,0 +1,63 @@
+"""Seeded synthetic fleets of any size for load testing and benchmarks."""
+import numpy as np
+
+from monitoring.hierarchy import FleetLayout
+from monitoring.store import DEVICE_TYPES, OPTIMIZATION, DeviceStore
+
+
+def parse_mix(spec):
+    """``"Security Camera=3,Smart Lock=1"`` -> {type: weight}; empty means an even mix."""
+    mix = {}
+    for part in filter(None, (part.strip() for part in (spec or '').split(','))):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in DEVICE_TYPES:
+            raise ValueError(f"unknown device type {kind.strip()!r}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_layout(spec):
+    """``"4x3x10"`` -> a ``FleetLayout`` of 4 sites, 3 buildings each and 10 rooms per building."""
+    try:
+        sites, buildings, rooms = (int(part) for part in spec.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"layout must look like SITESxBUILDINGSxROOMS, got {spec!r}") from None
+    return FleetLayout.generate(sites, buildings, rooms)
+
+
+def synthetic_fleet(count, mix=None, seed=0, log_capacity=5, change_rate=0.25, error_rate=0.3,
+                    online=0.95, shielded=0.9, rooms=1):
+    """Build a ``DeviceStore`` of ``count`` devices named "<type> 00042".
+
+    ``mix`` weights device types (default: all types evenly). ``change_rate``
+    and ``error_rate`` set how many devices change state and log failures per
+    tick. Devices are scattered evenly over room ids ``0..rooms-1`` of a
+    ``FleetLayout``. The same ``seed`` always yields the same fleet and the
+    same ticks.
+    """
+    rng = np.random.default_rng(seed)
+    mix = mix or {kind: 1.0 for kind in DEVICE_TYPES}
+    kinds = list(mix)
+    weights = np.array([mix[kind] for kind in kinds], dtype=float)
+    picks = rng.choice(len(kinds), size=count, p=weights / weights.sum())
+    names = [f"{kinds[k]} {i:05d}" for i, k in enumerate(picks)]
+
+    status = (rng.random(count) >= online).astype(np.uint8)
+    vision = np.where(status == 0, rng.integers(0, 2, count), 2).astype(np.uint8)
+    active = vision == 0
+    health = np.where(active, rng.integers(70, 96, count), rng.integers(50, 81, count))
+    columns = {
+        'status': status,
+        'ai_shield': rng.random(count) < shielded,
+        'vision_status': vision,
+        'ai_confidence': np.where(active, rng.uniform(0.7, 0.99, count), rng.uniform(0.5, 0.7, count)),
+        'threat_score': np.where(vision == 1, rng.uniform(0.05, 0.8, count), rng.uniform(0.05, 0.3, count)),
+        'health_score': health,
+        'maintenance_alert': health < 70,
+        'optimization_suggestion': np.where(rng.random(count) < 0.3, rng.integers(0, len(OPTIMIZATION), count), 0),
+        'room': rng.integers(0, rooms, count),
+    }
+    store = DeviceStore(capacity=max(16, count), log_capacity=log_capacity, seed=seed,
+                        change_rate=change_rate, error_rate=error_rate)
+    store.extend(names, columns)
+    return store
@@ -0,0 +1,396 @@
+"""Camera vision scans: motion and blur analysis of frame streams in worker processes."""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+from flask import jsonify
+
+from monitoring.ingest import RateCounter
+from monitoring.store import SCAN_RESULT, VISION_ACTIVE, VISION_DEGRADED, VISION_OFFLINE, device_type
+
+# cv2 is only imported by the scan workers, never by the dashboard process
+
+CAMERA_TYPES = ('Security Camera', 'Smart Doorbell')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# Grey-level change (0-255) that counts a pixel as moving
+DIFF_THRESHOLD = 25
+
+
+def is_camera(name):
+    return device_type(name) in CAMERA_TYPES
+
+
+def _images(directory):
+    return [os.path.join(directory, entry) for entry in sorted(os.listdir(directory))
+            if entry.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+class FrameSource:
+    """Where each camera's frames come from: a video or image file, or a directory.
+
+    A directory entry named after a device (``Security Camera 0001.mp4`` or a
+    ``Security Camera 0001/`` folder of images) feeds that device alone; the
+    directory's loose images are shared by every other camera, which read
+    them as a looping stream from their own offset. A file is shared by all.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.own = {}
+        self.shared = None
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                full = os.path.join(path, entry)
+                if os.path.isdir(full):
+                    self.own[entry] = full
+                elif not entry.lower().endswith(IMAGE_EXTENSIONS):
+                    self.own[os.path.splitext(entry)[0]] = full
+            if _images(path):
+                self.shared = path
+        elif os.path.exists(path):
+            self.shared = path
+        else:
+            raise FileNotFoundError(path)
+
+    def stream(self, name):
+        """``[path, offset]`` of the stream ``name`` reads, or None if it has none."""
+        path = self.own.get(name, self.shared)
+        if path is None:
+            return None
+        # Stable across processes and restarts, unlike hash()
+        return [path, zlib.crc32(name.encode()) if path == self.shared else 0]
+
+
+# Worker side -----------------------------------------------------------------
+
+class _Stream:
+    """One camera's open reader and its last smoothed frame, kept inside a worker."""
+
+    def __init__(self, path, offset):
+        import cv2
+
+        self.path = path
+        self.previous = None
+        self.capture = None
+        self.images = None
+        if os.path.isdir(path):
+            self.images = _images(path)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            self.images = [path]
+        else:
+            self.capture = cv2.VideoCapture(path)
+            frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            if frames > 0:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, offset % frames)
+        self.position = offset
+        self.flags = cv2.IMREAD_GRAYSCALE
+
+    def read(self, width):
+        """Next frame as 8-bit grey, looping at the end; None if nothing can be read."""
+        import cv2
+
+        if self.images is not None:
+            if not self.images:
+                return None
+            frame = cv2.imread(self.images[self.position % len(self.images)], self.flags)
+            self.position += 1
+            if frame is not None and self.flags == cv2.IMREAD_GRAYSCALE:
+                # Later images decode at the largest 1/2, 1/4 or 1/8 scale still at least
+                # ``width`` wide, which JPEG does for a fraction of the full cost
+                for factor, flags in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                      (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+                    if frame.shape[1] >= factor * width:
+                        self.flags = flags
+                        break
+            return frame
+        ok, frame = self.capture.read()
+        if not ok:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+            if not ok:
+                return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+_streams = {}
+
+
+def scan_batch(batch, width):
+    """Read and score the next frame of every ``[device, path, offset]`` stream in ``batch``.
+
+    Frames are scaled to ``width`` pixels across before any analysis.
+    Returns ``[device, motion, sharpness]`` per stream: ``motion`` is the
+    share of pixels that changed since that stream's previous frame,
+    ``sharpness`` the variance of the Laplacian (low means blurred); both
+    are None when no frame could be read.
+    """
+    import cv2
+
+    results = []
+    for name, path, offset in batch:
+        stream = _streams.get(name)
+        if stream is None or stream.path != path:
+            stream = _streams[name] = _Stream(path, offset)
+        frame = stream.read(width)
+        if frame is None:
+            stream.previous = None
+            results.append([name, None, None])
+            continue
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        if frame.shape[1] != width:
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        sharpness = float(cv2.Laplacian(frame, cv2.CV_32F).var())
+        # Smoothing keeps sensor noise and compression artefacts from reading as motion
+        smoothed = cv2.GaussianBlur(frame, (5, 5), 0)
+        previous = stream.previous
+        motion = 0.0
+        if previous is not None and previous.shape == smoothed.shape:
+            motion = np.count_nonzero(cv2.absdiff(previous, smoothed) > DIFF_THRESHOLD) / smoothed.size
+        stream.previous = smoothed
+        results.append([name, motion, sharpness])
+    return results
+
+
+def worker(width, niceness):
+    """Serve batches from stdin, one JSON line each, answering on stdout in order."""
+    import cv2
+
+    if niceness:
+        os.nice(niceness)
+    # One thread per worker; parallelism comes from the number of workers
+    cv2.setNumThreads(1)
+    for line in sys.stdin:
+        results = scan_batch(json.loads(line), width)
+        sys.stdout.write(json.dumps(results) + '\n')
+        sys.stdout.flush()
+
+
+# Dashboard side --------------------------------------------------------------
+
+class _Shard:
+    """One worker process and the batch it is working on (at most one at a time)."""
+
+    def __init__(self, args, env, deliver):
+        self.process = subprocess.Popen(args, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, bufsize=1)
+        self.deliver = deliver
+        self.busy = False
+        self.sent = None
+        self.thread = threading.Thread(target=self._read, name='vision-results', daemon=True)
+        self.thread.start()
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def submit(self, batch):
+        self.busy = True
+        self.sent = time.monotonic()
+        self.process.stdin.write(json.dumps(batch) + '\n')
+        self.process.stdin.flush()
+
+    def _read(self):
+        for line in self.process.stdout:
+            results = json.loads(line)
+            latency = time.monotonic() - self.sent
+            self.busy = False
+            self.deliver(results, latency)
+
+    def close(self):
+        if self.alive:
+            self.process.stdin.close()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.thread.join()
+
+
+class VisionScanner:
+    """Scan up to ``streams`` camera devices at ``fps`` frames per second each.
+
+    Cameras are split by name across ``workers`` scan processes, so a
+    camera's previous frame stays in the process that reads its next one.
+    Workers are plain ``python -m monitoring.vision`` interpreters (like the
+    segmented recorder) so they never re-import the dashboard; they run
+    niced, single-threaded, and decode frames themselves, so only device
+    names and a few numbers cross the pipes. Every tick a scheduler thread
+    sends each idle worker one batch holding all of its cameras; a worker
+    still busy with the previous batch skips the tick rather than queueing
+    work. Results are written to ``store`` under ``lock`` once per tick:
+
+    * ``vision_status``: Offline without a frame, Degraded when the frame's
+      sharpness is below ``blur_threshold``, otherwise Active.
+    * ``last_scan``: Threat Detected when at least ``motion_threshold`` of
+      the frame moved, otherwise Clean.
+    * ``threat_score``: the moving share relative to ``motion_scale``,
+      capped at 1.
+
+    Scanned rows are flagged ``vision_feed`` so the simulator leaves these
+    fields alone.
+    """
+
+    def __init__(self, store, lock, source, fps=2.0, workers=2, streams=64, width=160, blur_threshold=100.0,
+                 motion_threshold=0.02, motion_scale=0.2, niceness=10):
+        self.store = store
+        self.lock = lock
+        self.source = FrameSource(source)
+        self.fps = fps
+        self.workers = workers
+        self.streams = streams
+        self.width = width
+        self.blur_threshold = blur_threshold
+        self.motion_threshold = motion_threshold
+        self.motion_scale = motion_scale
+        self.niceness = niceness
+        self.cameras = []
+        self._known = 0
+        self._shards = []
+        self._results = []
+        self._results_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.scanned = RateCounter()
+        self.skipped = 0
+        self.restarts = 0
+        self.last_latency = None
+        self.last_apply_seconds = None
+
+    # Scheduling ------------------------------------------------------------
+
+    def _spawn(self):
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        args = [sys.executable, '-m', 'monitoring.vision', '--width', str(self.width),
+                '--nice', str(self.niceness)]
+        return _Shard(args, env, self._deliver)
+
+    def _deliver(self, results, latency):
+        with self._results_lock:
+            self._results.extend(results)
+        self.last_latency = latency
+
+    def _refresh(self):
+        """Pick up cameras added since the last tick (names are only ever appended)."""
+        with self.lock:
+            names = self.store.names[self._known:]
+            self._known += len(names)
+        for name in names:
+            if len(self.cameras) >= self.streams:
+                break
+            if is_camera(name):
+                stream = self.source.stream(name)
+                if stream is not None:
+                    self.cameras.append([name] + stream)
+
+    def _submit(self):
+        for i, shard in enumerate(self._shards):
+            if not shard.alive:
+                shard.close()
+                shard = self._shards[i] = self._spawn()
+                self.restarts += 1
+            batch = [camera for camera in self.cameras
+                     if zlib.crc32(camera[0].encode()) % len(self._shards) == i]
+            if not batch:
+                continue
+            if shard.busy:
+                self.skipped += len(batch)
+                continue
+            try:
+                shard.submit(batch)
+            except OSError:
+                # A worker that died mid-write is replaced next tick
+                shard.busy = False
+
+    def _apply(self):
+        with self._results_lock:
+            results, self._results = self._results, []
+        if not results:
+            return
+        started = time.perf_counter()
+        names = [name for name, _, _ in results]
+        motion = np.array([np.nan if m is None else m for _, m, _ in results])
+        sharpness = np.array([np.nan if s is None else s for _, _, s in results])
+        seen = ~np.isnan(motion)
+        vision = np.where(~seen, VISION_OFFLINE,
+                          np.where(sharpness < self.blur_threshold, VISION_DEGRADED, VISION_ACTIVE)).astype(np.uint8)
+        threat = np.minimum(1.0, np.nan_to_num(motion) / self.motion_scale)
+        verdict = np.where(motion >= self.motion_threshold, SCAN_RESULT.index('Threat Detected'),
+                           SCAN_RESULT.index('Clean')).astype(np.uint8)
+        with self.lock:
+            rows = np.array([self.store.index[name] for name in names], dtype=np.int64)
+            columns = self.store.columns
+            columns['vision_status'][rows] = vision
+            # Without a frame there is nothing to judge, so the last verdict stands
+            columns['last_scan'][rows[seen]] = verdict[seen]
+            columns['threat_score'][rows[seen]] = threat[seen]
+            columns['vision_feed'][rows] = True
+            self.store.touch(rows)
+        self.scanned.add(int(seen.sum()))
+        self.last_apply_seconds = time.perf_counter() - started
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        due = time.monotonic()
+        while not self._stop.wait(max(0.0, due - time.monotonic())):
+            self._apply()
+            self._refresh()
+            self._submit()
+            # A scheduler that fell behind starts afresh instead of bursting to catch up
+            due = max(due + interval, time.monotonic())
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._shards = [self._spawn() for _ in range(self.workers)]
+            self._thread = threading.Thread(target=self._run, name='vision-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+    # Reporting -------------------------------------------------------------
+
+    def stats(self):
+        return {
+            'source': self.source.path,
+            'cameras': len(self.cameras),
+            'workers': len(self._shards),
+            'target_fps': self.fps,
+            'scanned_total': self.scanned.total,
+            'scans_per_second': self.scanned.rate(),
+            'skipped': self.skipped,
+            'worker_restarts': self.restarts,
+            'batch_latency': self.last_latency,
+            'apply_seconds': self.last_apply_seconds,
+        }
+
+    def register(self, server, rule='/vision'):
+        server.add_url_rule(rule, 'vision_stats', lambda: jsonify(self.stats()))
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vision scan worker (batches on stdin, results on stdout)")
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--nice', type=int, default=10)
+    args = parser.parse_args(argv)
+    worker(args.width, args.nice)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Production entry point: one fleet writer process plus several WSGI workers.
+
+    python serve.py --workers 4 --bind 0.0.0.0:8050
+
+The writer owns the device store, runs the engine, ingestion, notifications,
+device commands and the screen recorder, and publishes every snapshot to a
+shared-memory segment. Workers only read that segment, so any worker can answer
+any browser; commands and recording controls they receive are relayed to the
+writer's loopback control listener (IOT_CONTROL_PORT, default 8051). Gunicorn is used when installed;
+otherwise workers are forked werkzeug servers sharing one listening socket.
+
+Under an external process manager, run ``python serve.py --writer`` once and
+point gunicorn at ``serve:server`` with IOT_ROLE=worker and the same
+IOT_SHARED_STATE path, IOT_CONTROL_PORT and IOT_INGEST_UDP_PORT.
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'iot.monitoring.py')
+
+_dashboard = None
+
+
+def load_dashboard():
+    """Import the dashboard script (its file name is not a valid module name) once."""
+    global _dashboard
+    if _dashboard is None:
+        if HERE not in sys.path:
+            sys.path.insert(0, HERE)
+        spec = importlib.util.spec_from_file_location('iot_monitoring', SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        _dashboard = module
+    return _dashboard
+
+
+def __getattr__(name):
+    # gunicorn resolves serve:server / serve:app lazily, inside each worker
+    if name in ('server', 'app'):
+        return getattr(load_dashboard(), name)
+    raise AttributeError(name)
+
+
+def serve_control(dashboard):
+    """Serve the writer's own routes on loopback so workers can reach writer-owned state."""
+    from werkzeug.serving import make_server
+    from monitoring.control import DEFAULT_PORT
+
+    port = int(os.environ.get('IOT_CONTROL_PORT', DEFAULT_PORT))
+    control = make_server('127.0.0.1', port, dashboard.server, threaded=True)
+    threading.Thread(target=control.serve_forever, name='writer-control', daemon=True).start()
+    return control
+
+
+def run_writer():
+    dashboard = load_dashboard()
+    control = serve_control(dashboard)
+    dashboard.start_services()
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda *_: stopped.append(True))
+    try:
+        while not stopped:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        control.shutdown()
+        dashboard.stop_services()
+
+
+def wait_for_segment(path, writer, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if writer.poll() is not None:
+            sys.exit(f"writer exited with status {writer.returncode}")
+        if time.monotonic() > deadline:
+            sys.exit(f"writer did not publish {path} within {timeout} s")
+        time.sleep(0.1)
+
+
+def fork_workers(host, port, count, threads):
+    """Fallback without gunicorn: forked werkzeug servers accepting on one shared socket."""
+    from werkzeug.serving import make_server
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    children = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = make_server(host, port, load_dashboard().server, threaded=threads > 1,
+                                 fd=listener.fileno())
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+    listener.close()
+    return children
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the dashboard with a shared fleet writer and N web workers")
+    parser.add_argument('--bind', default='0.0.0.0:8050')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=8, help="threads per worker (SSE holds one per client)")
+    parser.add_argument('--writer', action='store_true', help="run only the fleet writer process")
+    parser.add_argument('--no-gunicorn', action='store_true', help="always use forked werkzeug workers")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('IOT_SHARED_STATE', f"/dev/shm/iot-fleet-{os.getpid()}"
+                          if os.path.isdir('/dev/shm') else os.path.join(HERE, '.iot-fleet'))
+    # Workers forward telemetry to the writer's UDP listener, so the writer always runs one (on
+    # loopback unless IOT_INGEST_UDP_HOST says otherwise)
+    os.environ.setdefault('IOT_INGEST_UDP_PORT', '9999')
+    if args.writer:
+        os.environ['IOT_ROLE'] = 'writer'
+        run_writer()
+        return
+    if os.environ['IOT_INGEST_UDP_PORT'] == '0':
+        sys.exit("workers forward telemetry to the writer over UDP; IOT_INGEST_UDP_PORT cannot be 0")
+
+    path = os.environ['IOT_SHARED_STATE']
+    writer = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--writer'], cwd=HERE,
+                              env=dict(os.environ, IOT_ROLE='writer'))
+    wait_for_segment(path, writer)
+
+    os.environ['IOT_ROLE'] = 'worker'
+    host, port = args.bind.rsplit(':', 1)
+    use_gunicorn = not args.no_gunicorn and importlib.util.find_spec('gunicorn') is not None
+    if use_gunicorn:
+        gunicorn = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                                     '--threads', str(args.threads), '--bind', args.bind,
+                                     'serve:server'], cwd=HERE)
+        children = [gunicorn.pid]
+    else:
+        children = fork_workers(host, int(port), args.workers, args.threads)
+    print(f"serving on http://{args.bind} with {args.workers} "
+          f"{'gunicorn' if use_gunicorn else 'werkzeug'} workers; shared state {path}", flush=True)
+
+    def shutdown(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        writer.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        # Any worker dying takes the deployment down so a supervisor can restart it cleanly
+        os.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        writer.wait()
+
+
+if __name__ == '__main__':
+    main()